@@ -0,0 +1,96 @@
+import json
+import os
+import platform
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from bench.runner import ENDPOINTS, BenchmarkServer, compare, run_requests
+from bench.seed import seed_dataset
+from wadium.cache import clear_all
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Seed a test database and measure the latency and throughput of the main API endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--stories', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=3, help='Comments per published story.')
+        parser.add_argument('--requests', type=int, default=300, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=30, help='Unmeasured requests per endpoint first.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS),
+                            help='Endpoint to measure (repeatable; default: all).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                            help='Baseline JSON to compare with (default: bench/baseline.json).')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 latency increase and req/s decrease, as a fraction.')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Write the results as a baseline JSON.')
+
+    def handle(self, *args, **options):
+        names = options['endpoint'] or list(ENDPOINTS)
+        # A test database, as the test runner would create it; the configured one is left alone.
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            clear_all()
+            self.stdout.write('Seeding...')
+            dataset = seed_dataset(options['users'], options['stories'], options['comments'], options['seed'])
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['127.0.0.1']), BenchmarkServer() as server:
+                results = self.run_endpoints(server.url, names, dataset, options)
+        finally:
+            clear_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {'environment': self.get_environment(options), 'endpoints': results}
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            self.stdout.write(f"Saved the baseline to {options['save_baseline']}.")
+            return
+
+        if not os.path.exists(options['baseline']):
+            return
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        if baseline['environment'] != report['environment']:
+            self.stdout.write(self.style.WARNING(
+                f"The baseline was measured with {baseline['environment']}; numbers may not compare."))
+        regressions = compare(results, baseline['endpoints'], options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regression against the baseline.'))
+
+    def run_endpoints(self, url, names, dataset, options):
+        rng = random.Random(options['seed'])
+        results = {}
+        self.stdout.write(f"{'endpoint':<16}{'requests':>9}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}"
+                          f"{'p99 ms':>9}{'req/s':>9}")
+        for name in names:
+            clear_all()
+            path = ENDPOINTS[name]
+            run_requests(url, [path(dataset, rng) for _ in range(options['warmup'])], options['concurrency'])
+            result = run_requests(url, [path(dataset, rng) for _ in range(options['requests'])],
+                                  options['concurrency'])
+            results[name] = result
+            self.stdout.write(f"{name:<16}{result['requests']:>9}{result['errors']:>7}{result['p50_ms']:>9}"
+                              f"{result['p95_ms']:>9}{result['p99_ms']:>9}{result['rps']:>9}")
+        return results
+
+    @staticmethod
+    def get_environment(options):
+        return {
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'python': platform.python_version(),
+            'dataset': {key: options[key] for key in ('users', 'stories', 'comments', 'seed')},
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+        }
@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+
+# Endpoint name: function of (dataset, rng) returning the path of one request.
+ENDPOINTS = {
+    'story-list': lambda dataset, rng: f"/story/?page={rng.randint(1, min(5, len(dataset['stories']) // 10 or 1))}",
+    'story-main': lambda dataset, rng: '/story/main/',
+    'story-trending': lambda dataset, rng: '/story/trending/',
+    'story-detail': lambda dataset, rng: f"/story/{rng.choice(dataset['stories'])}/",
+    'story-comments': lambda dataset, rng: f"/story/{rng.choice(dataset['stories'])}/comment/",
+    'user-search': lambda dataset, rng: f"/user/?username={rng.choice(dataset['usernames'])[:4]}",
+    'user-stories': lambda dataset, rng: f"/user/{rng.choice(dataset['users'])}/story/",
+}
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class BenchmarkServer:
+    """
+    The project's WSGI application served by a thread per connection, on a free local port.
+    """
+
+    def __init__(self, host='127.0.0.1'):
+        self.httpd = ThreadedWSGIServer((host, 0), QuietWSGIRequestHandler, allow_reuse_address=False)
+        self.httpd.set_app(get_internal_wsgi_application())
+        self.url = f'http://{host}:{self.httpd.server_port}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def run_requests(base_url, paths, concurrency):
+    """
+    GET every path, `concurrency` clients at a time, each with its own keep-alive session.
+    Returns the summary of the latencies; responses other than 2xx/304 count as errors.
+    """
+    local = threading.local()
+    lock = threading.Lock()
+    latencies = []
+    errors = 0
+
+    def get(path):
+        nonlocal errors
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        response = session.get(base_url + path)
+        latency = time.perf_counter() - start
+        with lock:
+            latencies.append(latency)
+            if not (200 <= response.status_code < 300 or response.status_code == 304):
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(get, paths))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Regressions of results against a baseline ({endpoint: summary}): a p95 latency more than
+    `tolerance` (a fraction) above the baseline's, a throughput more than `tolerance` below it,
+    or errors where there were none.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms, baseline {expected['p95_ms']} ms")
+        if result['rps'] < expected['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rps']} req/s, baseline {expected['rps']} req/s")
+        if result['errors'] and not expected['errors']:
+            regressions.append(f"{name}: {result['errors']} errors")
+    return regressions
@@ -0,0 +1,77 @@
+import datetime
+import random
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+
+from story.models import Story, StoryComment, StoryTag, Tag
+from user.models import EmailAddress, UserProfile
+
+WORDS = ('wadium', 'django', 'redis', 'story', 'medium', 'writer', 'python', 'server', 'cache', 'query',
+         '안녕하세요', '이야기', '개발', '서버', '데이터', '검색', '오늘', '우리')
+TAGS = ('django', 'python', 'redis', 'mysql', 'devops', 'design', '개발', '일상')
+
+
+def sentence(rng, length):
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+
+def paragraph(text):
+    return {'type': 'paragraph', 'detail': {'content': text, 'emphasizing': 'normal'}}
+
+
+def seed_dataset(users=100, stories=1000, comments=3, seed=0):
+    """
+    Fill an empty database with users, stories (mostly published, with tags and comments),
+    curated main/trending stories and the search indexes. Returns the ids to request:
+    {'stories': [...], 'users': [...], 'usernames': [...]}.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    User.objects.bulk_create([
+        User(username=f'{rng.choice(WORDS)}_{i}', password=UserProfile.NORMAL_PW) for i in range(users)
+    ])
+    writers = list(User.objects.order_by('id'))
+    UserProfile.objects.bulk_create([
+        UserProfile(user=user, name=sentence(rng, 2), bio=sentence(rng, 5)) for user in writers
+    ])
+    EmailAddress.objects.bulk_create([
+        EmailAddress(email=f'{user.username}@wadium.shop', user=user, primary=True) for user in writers
+    ])
+
+    Story.objects.bulk_create([
+        Story(
+            writer=rng.choice(writers),
+            title=sentence(rng, rng.randint(2, 6)),
+            subtitle=sentence(rng, 8),
+            body=[[paragraph(sentence(rng, rng.randint(20, 80))) for _ in range(rng.randint(1, 5))]],
+            published=i % 10 != 0,
+            published_at=now - datetime.timedelta(minutes=i) if i % 10 != 0 else None,
+            main_order=i // 10 + 1 if i % 10 == 1 and i < 50 else None,
+            trending_order=i // 10 + 1 if i % 10 == 2 and i < 60 else None,
+        ) for i in range(stories)
+    ], batch_size=500)
+    story_ids = list(Story.objects.filter(published=True).order_by('id').values_list('id', flat=True))
+
+    Tag.objects.bulk_create([Tag(name=name) for name in TAGS])
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    StoryTag.objects.bulk_create([
+        StoryTag(story_id=story_id, tag_id=tag_id)
+        for story_id in story_ids for tag_id in rng.sample(tag_ids, rng.randint(1, 3))
+    ], batch_size=500)
+    StoryComment.objects.bulk_create([
+        StoryComment(story_id=story_id, writer=rng.choice(writers), body=sentence(rng, 12))
+        for story_id in story_ids for _ in range(comments)
+    ], batch_size=500)
+
+    # bulk_create skips the signals that keep the search indexes.
+    call_command('rebuild_search_index', stdout=StringIO())
+    call_command('rebuild_ngram_index', stdout=StringIO())
+    return {
+        'stories': story_ids,
+        'users': [user.id for user in writers],
+        'usernames': [user.username for user in writers],
+    }
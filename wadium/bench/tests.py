@@ -0,0 +1,45 @@
+import random
+
+from django.test import LiveServerTestCase, SimpleTestCase
+
+from wadium.cache import clear_all
+from .runner import ENDPOINTS, compare, percentile, run_requests, summarize
+from .seed import seed_dataset
+
+
+class BenchmarkStatsTestCase(SimpleTestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_summarize(self):
+        result = summarize([0.002, 0.001, 0.003, 0.004], errors=1, elapsed=0.5)
+        self.assertEqual(result, {'requests': 4, 'errors': 1, 'p50_ms': 2.0, 'p95_ms': 4.0, 'p99_ms': 4.0,
+                                  'rps': 8.0})
+
+    def test_compare(self):
+        baseline = {'story-list': {'p95_ms': 10.0, 'rps': 100.0, 'errors': 0}}
+        self.assertEqual(compare({'story-list': {'p95_ms': 12.0, 'rps': 80.0, 'errors': 0}}, baseline, 0.25), [])
+        self.assertEqual(compare({'story-main': {'p95_ms': 99.0, 'rps': 1.0, 'errors': 0}}, baseline, 0.25), [])
+        regressions = compare({'story-list': {'p95_ms': 13.0, 'rps': 70.0, 'errors': 2}}, baseline, 0.25)
+        self.assertEqual(len(regressions), 3)
+
+
+class BenchmarkRunTestCase(LiveServerTestCase):
+    def setUp(self):
+        clear_all()
+
+    def test_run_every_endpoint(self):
+        dataset = seed_dataset(users=5, stories=30, comments=2)
+        self.assertEqual(len(dataset['stories']), 27)
+        rng = random.Random(0)
+        for name, path in ENDPOINTS.items():
+            with self.subTest(endpoint=name):
+                # One client at a time: the live server shares the in-memory test database connection.
+                result = run_requests(self.live_server_url, [path(dataset, rng) for _ in range(3)], concurrency=1)
+                self.assertEqual(result['requests'], 3)
+                self.assertEqual(result['errors'], 0)
@@ -0,0 +1,160 @@
+import hashlib
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Sum, Value, When
+from django.utils.functional import cached_property
+
+from .models import SearchDocument, SearchPosting
+from .text import get_story_fields, get_term_frequencies, tokenize
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+QUERY_MAX_TERMS = 10
+# Story fields that the index depends on.
+INDEXED_FIELDS = ('title', 'subtitle', 'body', 'published')
+# Number of documents and their total length, kept up to date by index_stories().
+INDEX_DOCUMENTS_KEY = 'search:stats:documents'
+INDEX_LENGTH_KEY = 'search:stats:length'
+
+
+def get_signature(fields):
+    return hashlib.md5(repr(sorted(fields.items())).encode('utf-8')).hexdigest()
+
+
+def get_index_stats():
+    """
+    Return (documents, total length) of the index, from the cache when both are there.
+    """
+    cached = cache.get_many([INDEX_DOCUMENTS_KEY, INDEX_LENGTH_KEY])
+    if len(cached) == 2:
+        return cached[INDEX_DOCUMENTS_KEY], cached[INDEX_LENGTH_KEY]
+    stats = SearchDocument.objects.aggregate(documents=Count('pk'), length=Sum('length'))
+    documents, length = stats['documents'], stats['length'] or 0
+    cache.set_many({INDEX_DOCUMENTS_KEY: documents, INDEX_LENGTH_KEY: length}, timeout=settings.COUNT_CACHE_TIMEOUT)
+    return documents, length
+
+
+def update_index_stats(documents, length):
+    # Stats that are not cached are left alone; they will be aggregated on the next search.
+    for key, delta in ((INDEX_DOCUMENTS_KEY, documents), (INDEX_LENGTH_KEY, length)):
+        if not delta:
+            continue
+        try:
+            cache.incr(key, delta)
+        except ValueError:  # not cached
+            pass
+
+
+def clear_index_stats():
+    cache.delete_many([INDEX_DOCUMENTS_KEY, INDEX_LENGTH_KEY])
+
+
+def index_stories(stories):
+    """
+    Index published stories and drop the others from the index, in bulk.
+    Stories must have INDEXED_FIELDS loaded. Returns the number of stories (re)indexed.
+    """
+    stories = list(stories)
+    documents = SearchDocument.objects. \
+        filter(story_id__in=[story.pk for story in stories]). \
+        in_bulk(field_name='story_id')
+    dropped = [story.pk for story in stories if not story.published and story.pk in documents]
+    changed = {}
+    for story in stories:
+        if not story.published:
+            continue
+        fields = get_story_fields(story)
+        signature = get_signature(fields)
+        document = documents.get(story.pk)
+        if document is not None and document.signature == signature:
+            continue
+        changed[story.pk] = (get_term_frequencies(fields), signature)
+    if not dropped and not changed:
+        return 0
+
+    replaced = [pk for pk in changed if pk in documents]
+    new_documents = [
+        SearchDocument(story_id=pk, length=sum(frequencies.values()), signature=signature)
+        for pk, (frequencies, signature) in changed.items()
+    ]
+    with transaction.atomic():
+        SearchDocument.objects.filter(story_id__in=dropped + replaced).delete()
+        SearchDocument.objects.bulk_create(new_documents)
+        SearchPosting.objects.bulk_create([
+            SearchPosting(document_id=pk, term=term, frequency=frequency)
+            for pk, (frequencies, _) in changed.items()
+            for term, frequency in frequencies.items()
+        ], batch_size=1000)
+    update_index_stats(len(new_documents) - len(dropped) - len(replaced),
+                       sum(document.length for document in new_documents) -
+                       sum(documents[pk].length for pk in dropped + replaced))
+    return len(changed)
+
+
+class SearchResults:
+    """
+    Stories of `queryset` that match the query terms, ranked by BM25 over the inverted index.
+    Supports count() and slicing, so Django's Paginator can page over it; a page loads its
+    stories from `queryset` by primary key.
+    """
+
+    def __init__(self, queryset, terms):
+        self.queryset = queryset
+        self.terms = terms
+
+    @cached_property
+    def ranking(self):
+        documents, length = get_index_stats()
+        average_length = length / documents if documents else 1
+        document_frequencies = SearchPosting.objects. \
+            filter(term__in=self.terms). \
+            values('term'). \
+            annotate(documents=Count('document_id')). \
+            values_list('term', 'documents')
+        idf = {
+            term: math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequencies
+        }
+        if not idf:
+            return SearchPosting.objects.none()
+
+        term_idf = Case(*(When(term=term, then=Value(value)) for term, value in idf.items()),
+                        output_field=FloatField())
+        frequency = F('frequency')
+        length_norm = 1 - BM25_B + BM25_B * F('document__length') / average_length
+        score = ExpressionWrapper(term_idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm),
+                                  output_field=FloatField())
+        return SearchPosting.objects. \
+            filter(term__in=idf, document_id__in=self.queryset.values('id')). \
+            values('document_id'). \
+            annotate(score=Sum(score)). \
+            order_by('-score', '-document_id')
+
+    def count(self):
+        return self.ranking.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = [row['document_id'] for row in self.ranking[index]]
+        stories = {
+            story['id'] if isinstance(story, dict) else story.pk: story
+            for story in self.queryset.filter(id__in=ids)
+        }
+        return [stories[story_id] for story_id in ids if story_id in stories]
+
+
+def search_stories(queryset, query):
+    """
+    Full-text search over the published stories of a queryset, best match first.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:QUERY_MAX_TERMS]
+    if not terms:
+        return queryset.none()
+    return SearchResults(queryset, terms)
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from search.models import NgramToken
+from search.ngrams import index_ngrams
+from story.models import Story
+
+SOURCES = (
+    (NgramToken.STORY_TITLE, Story, 'title'),
+    (NgramToken.USERNAME, User, 'username'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the n-gram index of story titles and usernames.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of rows loaded and indexed at a time.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        for kind, model, field in SOURCES:
+            NgramToken.objects.filter(kind=kind).delete()
+            rows = model.objects.values_list('id', field).order_by('id')
+            # Keyset chunks by id, as in rebuild_search_index.
+            total = last_id = 0
+            while True:
+                chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+                if not chunk:
+                    break
+                index_ngrams(kind, dict(chunk))
+                total += len(chunk)
+                last_id = chunk[-1][0]
+            self.stdout.write(f'Indexed {total} {field}s.')
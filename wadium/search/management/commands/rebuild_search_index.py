@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from search.index import INDEXED_FIELDS, clear_index_stats, index_stories
+from search.models import SearchDocument
+from story.models import Story
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of published stories.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of stories loaded and indexed at a time.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Drop the whole index first instead of only reindexing changed stories.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if options['clear']:
+            SearchDocument.objects.all().delete()
+        else:
+            SearchDocument.objects.filter(story__published=False).delete()
+        clear_index_stats()
+
+        stories = Story.objects. \
+            filter(published=True). \
+            only(*INDEXED_FIELDS). \
+            order_by('id')
+        # Keyset chunks by id: MySQL client cursors would otherwise load every story at once.
+        indexed = total = last_id = 0
+        while True:
+            chunk = list(stories.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            indexed += index_stories(chunk)
+            total += len(chunk)
+            last_id = chunk[-1].id
+        self.stdout.write(f'Indexed {indexed} of {total} published stories.')
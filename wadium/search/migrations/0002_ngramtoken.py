@@ -0,0 +1,47 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+from search.ngrams import get_text_grams
+
+
+def index_existing(apps, schema_editor):
+    NgramToken = apps.get_model('search', 'NgramToken')
+    sources = (
+        (1, apps.get_model('story', 'Story'), 'title'),
+        (2, apps.get_model('auth', 'User'), 'username'),
+    )
+    for kind, model, field in sources:
+        for object_id, text in model.objects.values_list('id', field).iterator():
+            NgramToken.objects.bulk_create([
+                NgramToken(kind=kind, gram=gram, object_id=object_id) for gram in get_text_grams(text)
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NgramToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'story title'), (2, 'username')])),
+                ('gram', models.CharField(max_length=3)),
+                ('object_id', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ngramtoken',
+            index=models.Index(fields=['kind', 'gram', 'object_id'], name='search_ngra_kind_d8b250_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ngramtoken',
+            index=models.Index(fields=['kind', 'object_id'], name='search_ngra_kind_f0c1bb_idx'),
+        ),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
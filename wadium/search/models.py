@@ -0,0 +1,43 @@
+from django.db import models
+
+from story.models import Story
+
+
+class SearchDocument(models.Model):
+    # One per published story.
+    story = models.OneToOneField(Story, primary_key=True, related_name='search_document', on_delete=models.CASCADE)
+    length = models.PositiveIntegerField()  # weighted number of terms
+    signature = models.CharField(max_length=32)  # md5 of the indexed text, to skip unchanged stories
+
+
+class SearchPosting(models.Model):
+    document = models.ForeignKey(SearchDocument, related_name='postings', on_delete=models.CASCADE)
+    term = models.CharField(max_length=64)
+    frequency = models.PositiveIntegerField()  # weighted
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'document'])
+        ]
+
+
+class NgramToken(models.Model):
+    """
+    1- to 3-character substrings of indexed text, so that icontains lookups can be
+    narrowed down through an index instead of scanning the table (search/ngrams.py).
+    """
+    STORY_TITLE = 1
+    USERNAME = 2
+    KIND_CHOICES = [
+        (STORY_TITLE, 'story title'),
+        (USERNAME, 'username'),
+    ]
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    gram = models.CharField(max_length=3)
+    object_id = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'gram', 'object_id']),
+            models.Index(fields=['kind', 'object_id']),
+        ]
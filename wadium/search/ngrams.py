@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models import Count
+
+from .models import NgramToken
+
+NGRAM_MAX_LENGTH = 3
+QUERY_MAX_GRAMS = 8
+
+
+def normalize(text):
+    # Lowercased character by character, so that a substring of the text stays a substring
+    # once normalized ('ΑΣ'.lower() would turn the final sigma into 'ς').
+    return ''.join(character.lower() for character in text)
+
+
+def get_grams(text, length):
+    text = normalize(text)
+    return {text[i:i + length] for i in range(len(text) - length + 1)}
+
+
+def get_text_grams(text):
+    """
+    Every 1- to 3-character substring of the text, so that a query of any length has grams to look up.
+    """
+    grams = set()
+    for length in range(1, NGRAM_MAX_LENGTH + 1):
+        grams |= get_grams(text, length)
+    return grams
+
+
+def get_query_grams(query):
+    """
+    The longest grams of the query (up to QUERY_MAX_GRAMS of them, spread over the query).
+    """
+    length = min(len(normalize(query)), NGRAM_MAX_LENGTH)
+    if length == 0:
+        return []
+    grams = sorted(get_grams(query, length))
+    step = max(len(grams) / QUERY_MAX_GRAMS, 1)
+    return [grams[int(i * step)] for i in range(min(len(grams), QUERY_MAX_GRAMS))]
+
+
+def index_ngrams(kind, objects):
+    """
+    Replace the grams of the given {object_id: text}.
+    """
+    with transaction.atomic():
+        NgramToken.objects.filter(kind=kind, object_id__in=list(objects)).delete()
+        NgramToken.objects.bulk_create([
+            NgramToken(kind=kind, gram=gram, object_id=object_id)
+            for object_id, text in objects.items()
+            for gram in get_text_grams(text)
+        ], batch_size=1000)
+
+
+def delete_ngrams(kind, object_id):
+    NgramToken.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def filter_contains(queryset, kind, field, query, id_field='id'):
+    """
+    Same result as queryset.filter(**{field + '__icontains': query}), but the rows are first
+    narrowed down to those whose indexed text has every gram of the query.
+    """
+    grams = get_query_grams(query)
+    if not grams:
+        return queryset.filter(**{field + '__icontains': query})
+    candidates = NgramToken.objects. \
+        filter(kind=kind, gram__in=grams). \
+        values('object_id'). \
+        annotate(grams=Count('gram', distinct=True)). \
+        filter(grams=len(grams)). \
+        values('object_id')
+    return queryset.filter(**{id_field + '__in': candidates, field + '__icontains': query})
@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from story.models import Story
+from .index import INDEXED_FIELDS, clear_index_stats, index_stories
+from .models import NgramToken
+from .ngrams import delete_ngrams, index_ngrams
+
+# Model field whose n-grams are indexed, per NgramToken kind.
+NGRAM_FIELDS = {
+    Story: (NgramToken.STORY_TITLE, 'title'),
+    User: (NgramToken.USERNAME, 'username'),
+}
+
+
+@receiver(post_save, sender=Story)
+def story_saved(sender, instance, created, update_fields, **kwargs):
+    # The index is kept in the story's own transaction. Deleted stories cascade to their documents.
+    if created and not instance.published:
+        return
+    if update_fields is not None and not set(update_fields) & set(INDEXED_FIELDS):
+        return
+    story = instance
+    if any(field not in instance.__dict__ for field in INDEXED_FIELDS):
+        story = Story.objects.only(*INDEXED_FIELDS).get(pk=instance.pk)
+    index_stories([story])
+
+
+@receiver(post_delete, sender=Story)
+def story_deleted(sender, instance, **kwargs):
+    # The document went by cascade: let the next search aggregate the index stats again.
+    clear_index_stats()
+
+
+@receiver(post_init, sender=Story)
+@receiver(post_init, sender=User)
+def ngram_source_loaded(sender, instance, **kwargs):
+    _, field = NGRAM_FIELDS[sender]
+    instance._ngram_text = instance.__dict__.get(field)
+
+
+@receiver(post_save, sender=Story)
+@receiver(post_save, sender=User)
+def ngram_source_saved(sender, instance, created, update_fields, **kwargs):
+    kind, field = NGRAM_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        return
+    text = instance.__dict__.get(field)
+    if text is None or (not created and text == instance._ngram_text):
+        return
+    index_ngrams(kind, {instance.pk: text})
+    instance._ngram_text = text
+
+
+@receiver(post_delete, sender=Story)
+@receiver(post_delete, sender=User)
+def ngram_source_deleted(sender, instance, **kwargs):
+    kind, _ = NGRAM_FIELDS[sender]
+    delete_ngrams(kind, instance.pk)
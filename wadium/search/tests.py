@@ -0,0 +1,214 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, Client
+from wadium.cache import clear_all
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+import json
+
+from search.index import get_index_stats
+from search.models import NgramToken, SearchDocument, SearchPosting
+from search.ngrams import get_query_grams, get_text_grams
+from search.text import get_body_text, tokenize
+from story.models import Story
+from user.models import UserProfile
+
+
+def paragraph(content):
+    return {'type': 'paragraph', 'detail': {'content': content, 'emphasizing': 'normal'}}
+
+
+def image(caption):
+    return {'type': 'image', 'detail': {'size': 'normal', 'imgsrc': 'https://wadium.shop/image/', 'content': caption}}
+
+
+class SearchTextTestCase(TestCase):
+    def test_get_body_text(self):
+        body = [[
+            paragraph('Normal <em>hello! <strong>wadium</strong></em> &amp; more'),
+            image('image caption'),
+            {'type': 'unknown'},
+        ]]
+        self.assertEqual(get_body_text(body), 'Normal hello! wadium & more\nimage caption')
+        self.assertEqual(get_body_text([]), '')
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Hello, Wadium! 안녕하세요 ｗａｄｉｕｍ'), ['hello', 'wadium', '안녕하세요', 'wadium'])
+
+
+class SearchTestCase(TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.user_token = 'Token ' + Token.objects.create(user=self.user).key
+        self.other = UserProfile.create_user('jiwon', {
+            'name': 'Jiwon Kim',
+            'email': 'jiwon@wadium.shop',
+        })
+        self.title_match = self.create_story('Django tips', body=[[paragraph('Some tips')]])
+        self.body_match = self.create_story('Tips', body=[[paragraph('We love <b>django</b>.')]])
+        self.caption_match = self.create_story('Photos', body=[[image('django pony')]], writer=self.other)
+        self.no_match = self.create_story('Flask', body=[[paragraph('Flask tips')]])
+        self.draft = Story.objects.create(writer=self.user, title='Django draft')
+
+    def create_story(self, title, body, writer=None):
+        return Story.objects.create(writer=writer or self.user, title=title, body=body, published=True)
+
+    def search(self, uri):
+        response = self.client.get(uri)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        ids = [story['id'] for story in data['stories']]
+        self.assertEqual(data['count'], len(ids))
+        return ids
+
+    def test_search_ranking(self):
+        ids = self.search('/story/?q=django')
+        # Terms in the title weigh more than terms in the body.
+        self.assertEqual(ids[0], self.title_match.id)
+        self.assertEqual(set(ids), {self.title_match.id, self.body_match.id, self.caption_match.id})
+        self.assertEqual(self.search('/story/?q=DJANGO+tips')[0], self.title_match.id)
+        self.assertEqual(self.search('/story/?q=nothing'), [])
+        self.assertEqual(self.search('/story/?q=+'), [])
+
+    def test_search_filters(self):
+        self.assertEqual(self.search('/story/?q=django&title=photo'), [self.caption_match.id])
+        ids = self.search(f'/user/{self.user.id}/story/?q=django')
+        self.assertEqual(set(ids), {self.title_match.id, self.body_match.id})
+
+    def test_search_index_updated(self):
+        with self.subTest(msg='edit'):
+            self.client.put(f'/story/{self.no_match.id}/', json.dumps({'body': [[paragraph('Django now')]]}),
+                            content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+            self.assertIn(self.no_match.id, self.search('/story/?q=django'))
+        with self.subTest(msg='publish'):
+            self.client.post(f'/story/{self.draft.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertIn(self.draft.id, self.search('/story/?q=django'))
+        with self.subTest(msg='unpublish'):
+            self.client.post(f'/story/{self.draft.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertNotIn(self.draft.id, self.search('/story/?q=django'))
+            self.assertFalse(SearchDocument.objects.filter(story=self.draft).exists())
+        with self.subTest(msg='delete'):
+            self.client.delete(f'/story/{self.body_match.id}/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertNotIn(self.body_match.id, self.search('/story/?q=django'))
+            self.assertFalse(SearchPosting.objects.filter(document_id=self.body_match.id).exists())
+
+    def test_search_index_stats(self):
+        def aggregated():
+            return sum(document.length for document in SearchDocument.objects.all())
+
+        self.assertEqual(get_index_stats(), (4, aggregated()))
+        with self.subTest(msg='cached'):
+            with self.assertNumQueries(0):
+                get_index_stats()
+        with self.subTest(msg='edit'):
+            self.client.put(f'/story/{self.no_match.id}/', json.dumps({'body': [[paragraph('Django now and then')]]}),
+                            content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(get_index_stats(), (4, aggregated()))
+        with self.subTest(msg='publish'):
+            self.client.post(f'/story/{self.draft.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(get_index_stats(), (5, aggregated()))
+        with self.subTest(msg='unpublish'):
+            self.client.post(f'/story/{self.draft.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(get_index_stats(), (4, aggregated()))
+        with self.subTest(msg='delete'):
+            self.client.delete(f'/story/{self.body_match.id}/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(get_index_stats(), (3, aggregated()))
+
+    def test_search_unchanged_story_not_reindexed(self):
+        story = Story.objects.get(id=self.title_match.id)
+        with self.assertNumQueries(2):  # the UPDATE and the signature check
+            story.save()
+
+    def test_rebuild_search_index(self):
+        SearchDocument.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', '--chunk-size=2', stdout=out)
+        self.assertIn('Indexed 4 of 4', out.getvalue())
+        self.assertEqual(self.search('/story/?q=django')[0], self.title_match.id)
+
+
+class NgramTestCase(TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('웨이디움_writer', {
+            'name': 'Wadium Writer',
+            'email': 'writer@wadium.shop',
+        })
+        self.other = UserProfile.create_user('Wadium', {
+            'name': 'Wadium',
+            'email': 'wadium@wadium.shop',
+        })
+        self.korean = self.create_story('한국어 제목입니다')
+        self.mixed = self.create_story('Django와 함께하는 웹 개발')
+        self.english = self.create_story('Hello Wadium')
+
+    def create_story(self, title):
+        return Story.objects.create(writer=self.user, title=title, published=True)
+
+    def search_titles(self, uri):
+        response = self.client.get(uri)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {story['id'] for story in response.json()['stories']}
+
+    def search_users(self, username):
+        response = self.client.get('/user/', {'username': username})
+        if response.status_code == status.HTTP_404_NOT_FOUND:
+            return set()
+        return {user['id'] for user in response.json()['users']}
+
+    def test_grams(self):
+        self.assertEqual(get_text_grams('AbC'), {'a', 'b', 'c', 'ab', 'bc', 'abc'})
+        self.assertEqual(get_query_grams('제목'), ['제목'])
+        self.assertEqual(sorted(get_query_grams('Wadium')), ['adi', 'diu', 'ium', 'wad'])
+        self.assertEqual(get_query_grams(''), [])
+        self.assertEqual(len(get_query_grams('a very long query over many grams')), 8)
+
+    def test_story_title_search(self):
+        self.assertEqual(self.search_titles('/story/?title=제목'), {self.korean.id})
+        self.assertEqual(self.search_titles('/story/?title=O'), {self.mixed.id, self.english.id})
+        self.assertEqual(self.search_titles('/story/?title=o와 함'), {self.mixed.id})
+        self.assertEqual(self.search_titles('/story/?title=WADIUM'), {self.english.id})
+        self.assertEqual(self.search_titles('/story/?title=wadium hello'), set())
+        self.assertEqual(self.search_titles(f'/user/{self.user.id}/story/?title=웹'), {self.mixed.id})
+
+    def test_username_search(self):
+        self.assertEqual(self.search_users('웨이디움'), {self.user.id})
+        self.assertEqual(self.search_users('wadium'), {self.other.id})
+        self.assertEqual(self.search_users('_w'), {self.user.id})
+        self.assertEqual(self.search_users('없음'), set())
+
+    def test_ngram_index_updated(self):
+        with self.subTest(msg='edit'):
+            self.korean.title = '새 제목'
+            self.korean.save()
+            self.assertEqual(self.search_titles('/story/?title=새 제'), {self.korean.id})
+            self.assertEqual(self.search_titles('/story/?title=한국어'), set())
+        with self.subTest(msg='unchanged'):
+            story = Story.objects.get(id=self.korean.id)
+            with self.assertNumQueries(2):  # the UPDATE and the search signature check
+                story.save()
+        with self.subTest(msg='rename'):
+            self.other.username = 'renamed'
+            self.other.save()
+            self.assertEqual(self.search_users('wadium'), set())
+            self.assertEqual(self.search_users('name'), {self.other.id})
+        with self.subTest(msg='delete'):
+            self.mixed.delete()
+            self.assertFalse(NgramToken.objects.filter(kind=NgramToken.STORY_TITLE, object_id=self.mixed.id).exists())
+
+    def test_rebuild_ngram_index(self):
+        NgramToken.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_ngram_index', '--chunk-size=2', stdout=out)
+        self.assertIn('Indexed 3 titles', out.getvalue())
+        self.assertEqual(self.search_titles('/story/?title=제목'), {self.korean.id})
+        self.assertEqual(self.search_users('wadium'), {self.other.id})
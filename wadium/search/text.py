@@ -0,0 +1,59 @@
+import html
+import re
+import unicodedata
+from collections import Counter
+
+from django.utils.html import strip_tags
+
+TERM_MAX_LENGTH = 64
+TOKEN_PATTERN = re.compile(r'\w+')
+# Term frequencies are weighted by where the term appears.
+FIELD_WEIGHTS = (
+    ('title', 3),
+    ('subtitle', 2),
+    ('body', 1),
+)
+
+
+def get_body_text(body):
+    """
+    Plain text of a Story.body: the HTML-stripped `content` of its paragraph blocks
+    and the captions of its image blocks, in order.
+    """
+    texts = []
+
+    def walk(node):
+        if isinstance(node, list):
+            for child in node:
+                walk(child)
+        elif isinstance(node, dict):
+            detail = node.get('detail')
+            if isinstance(detail, dict) and isinstance(detail.get('content'), str):
+                texts.append(html.unescape(strip_tags(detail['content'])))
+
+    walk(body)
+    return '\n'.join(texts)
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKC', text).lower()
+    return [token[:TERM_MAX_LENGTH] for token in TOKEN_PATTERN.findall(text)]
+
+
+def get_story_fields(story):
+    return {
+        'title': story.title,
+        'subtitle': story.subtitle,
+        'body': get_body_text(story.body),
+    }
+
+
+def get_term_frequencies(fields):
+    """
+    Return a Counter of weighted term frequencies for {field name: text}.
+    """
+    frequencies = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(fields[field]):
+            frequencies[term] += weight
+    return frequencies
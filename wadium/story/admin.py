@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db import transaction
 
 from .models import Story
 
@@ -42,12 +43,19 @@ class MainListFilter(admin.SimpleListFilter):
 
 
 class StoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'writer_id', 'writer', 'title', 'main_order', 'trending_order', 'published_at')
+    list_display = ('id', 'writer_id', 'writer', 'title', 'main_order', 'trending_order', 'trending_pinned',
+                    'published_at')
     list_display_links = ('title',)
-    list_editable = ('main_order', 'trending_order')
+    list_editable = ('main_order', 'trending_order', 'trending_pinned')
     list_filter = (MainListFilter, TrendingListFilter)
     ordering = ('-published_at',)
     search_fields = ['writer__username', 'writer__userprofile__name']
 
+    def changelist_view(self, request, extra_context=None):
+        # Save list_editable rows in one transaction, so that the cache hooks in story/signals.py
+        # rebuild story:main and story:trending once per bulk edit instead of once per row.
+        with transaction.atomic():
+            return super(StoryAdmin, self).changelist_view(request, extra_context)
+
 
 admin.site.register(Story, StoryAdmin)
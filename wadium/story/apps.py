@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class StoryConfig(AppConfig):
     name = 'story'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,279 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+
+from wadium.cache import delete_value, get_local, get_or_compute, invalidate_local, set_value
+from wadium.responses import render_content
+from .models import Story, StoryComment
+from .serializers import StoryCardSerializer
+
+STORY_MAIN_KEY = 'story:main'
+STORY_TRENDING_KEY = 'story:trending'
+# main and trending are rebuilt as soon as a curated story changes, so the TTL only bounds
+# staleness from changes that bypass model signals (e.g. QuerySet.update()).
+STORY_CURATION_TIMEOUT = 60 * 60 * 6
+
+STORY_DETAIL_KEY = 'story:detail:{pk}'
+STORY_DETAIL_TIMEOUT = 600
+
+STORY_COMMENTS_GENERATION_KEY = 'story:{pk}:comments:generation'
+# Comments deleted without signals (e.g. QuerySet.delete()) are only noticed once the generation expires.
+STORY_COMMENTS_GENERATION_TIMEOUT = 60 * 60
+
+STORY_LIST_GENERATION_KEY = 'story:list:generation'
+STORY_LIST_PAGE_PARAMS = ('page', 'cursor')
+STORY_LIST_STATS_KEY = 'story:list:stats:{bucket}:{result}'
+STORY_LIST_BUCKETS = ('1', '2-10', '11+', 'cursor')
+STORY_LIST_STATS_FLUSH_INTERVAL = 10
+
+_stats = Counter()
+_stats_flushed_at = [time.monotonic()]
+_stats_lock = threading.Lock()
+
+
+def on_commit_once(func):
+    """
+    Run `func` once the current transaction commits, at most once per transaction,
+    so that saving many stories from the admin changelist rebuilds a key only once.
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(callback[1] is func for callback in connection.run_on_commit):
+        return
+    transaction.on_commit(func)
+
+
+def load_generation(key, timeout=None):
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock so that a lost generation key never brings back an old namespace.
+        cache.add(key, int(time.time() * 1000), timeout=timeout)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key, timeout=None):
+    try:
+        cache.incr(key)
+    except ValueError:  # not cached
+        load_generation(key, timeout)
+
+
+def load_story_list_generation():
+    return load_generation(STORY_LIST_GENERATION_KEY)
+
+
+def get_story_list_generation():
+    return get_local(STORY_LIST_GENERATION_KEY, load_story_list_generation)
+
+
+def bump_story_list_generation():
+    bump_generation(STORY_LIST_GENERATION_KEY)
+    invalidate_local(STORY_LIST_GENERATION_KEY)
+
+
+def invalidate_story_list():
+    """
+    Move the story list to a new cache namespace, now and again once the current
+    transaction commits, so that a page cached from pre-commit data is never served.
+    """
+    bump_story_list_generation()
+    on_commit_once(bump_story_list_generation)
+
+
+def get_story_list_page_id(query_params, get_last_page):
+    """
+    Return the id of a story list page, or None for an invalid page number. Page numbers are
+    normalized: '01' and '1' share an entry, and 'last' is resolved with `get_last_page()`.
+    """
+    if 'cursor' in query_params:
+        return 'cursor-' + hashlib.md5(query_params['cursor'].encode('utf-8')).hexdigest()
+    page = query_params.get('page', '1')
+    if page == 'last':
+        return f'page-{get_last_page()}'
+    try:
+        number = int(page)
+    except ValueError:
+        return None
+    return f'page-{number}' if number >= 1 else None
+
+
+def get_story_list_link_id(request):
+    """
+    Return the id of the URL that the next/previous links of a page are built from, or None when
+    the request has parameters other than STORY_LIST_PAGE_PARAMS: those end up in the links, and
+    caching them would let any client add cache entries at will. The host is bounded by ALLOWED_HOSTS.
+    """
+    if not set(request.query_params) <= set(STORY_LIST_PAGE_PARAMS):
+        return None
+    url = request.build_absolute_uri(request.path)
+    return hashlib.md5(url.encode('utf-8')).hexdigest()
+
+
+def get_story_list_page_key(page_id, link_id):
+    return f'story:list:{get_story_list_generation()}:{page_id}:{link_id}'
+
+
+def get_story_list_bucket(page_id):
+    kind, value = page_id.split('-', 1)
+    if kind == 'cursor':
+        return 'cursor'
+    if value == '1':
+        return '1'
+    if value.isdigit() and int(value) <= 10:
+        return '2-10'
+    return '11+'
+
+
+def record_story_list_cache_access(page_id, hit):
+    # Counted in process and flushed to the cache in batches, to keep L1 hits free of Redis round trips.
+    key = STORY_LIST_STATS_KEY.format(bucket=get_story_list_bucket(page_id), result='hit' if hit else 'miss')
+    with _stats_lock:
+        _stats[key] += 1
+        flush_due = time.monotonic() - _stats_flushed_at[0] >= STORY_LIST_STATS_FLUSH_INTERVAL
+    if flush_due:
+        flush_story_list_cache_stats()
+
+
+def flush_story_list_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+        _stats.clear()
+        _stats_flushed_at[0] = time.monotonic()
+    for key, count in stats.items():
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, count)
+        except ValueError:  # evicted in between
+            pass
+
+
+def get_story_list_cache_stats():
+    """
+    Return {bucket: {'hit': n, 'miss': n}} for the story list page cache.
+    """
+    flush_story_list_cache_stats()
+    keys = {
+        (bucket, result): STORY_LIST_STATS_KEY.format(bucket=bucket, result=result)
+        for bucket in STORY_LIST_BUCKETS for result in ('hit', 'miss')
+    }
+    values = cache.get_many(keys.values())
+    stats = {bucket: {'hit': 0, 'miss': 0} for bucket in STORY_LIST_BUCKETS}
+    for (bucket, result), key in keys.items():
+        stats[bucket][result] = values.get(key, 0)
+    return stats
+
+
+def get_story_main_queryset():
+    return Story.objects. \
+        filter(published=True). \
+        filter(main_order__gte=1, main_order__lte=5). \
+        order_by('main_order'). \
+        values(*StoryCardSerializer.values)
+
+
+def get_story_trending_queryset():
+    return Story.objects. \
+        filter(published=True). \
+        filter(trending_order__gte=1, trending_order__lte=6). \
+        order_by('trending_order'). \
+        values(*StoryCardSerializer.values)
+
+
+def build_story_main():
+    return render_content(StoryCardSerializer(get_story_main_queryset()).data)
+
+
+def build_story_trending():
+    return render_content(StoryCardSerializer(get_story_trending_queryset()).data)
+
+
+def get_story_main():
+    return get_or_compute(STORY_MAIN_KEY, build_story_main, timeout=STORY_CURATION_TIMEOUT, local=True)
+
+
+def get_story_trending():
+    return get_or_compute(STORY_TRENDING_KEY, build_story_trending, timeout=STORY_CURATION_TIMEOUT, local=True)
+
+
+def rebuild_story_main():
+    set_value(STORY_MAIN_KEY, build_story_main(), timeout=STORY_CURATION_TIMEOUT, local=True)
+
+
+def rebuild_story_trending():
+    set_value(STORY_TRENDING_KEY, build_story_trending(), timeout=STORY_CURATION_TIMEOUT, local=True)
+
+
+def invalidate_story_main():
+    delete_value(STORY_MAIN_KEY, local=True)
+    on_commit_once(rebuild_story_main)
+
+
+def invalidate_story_trending():
+    delete_value(STORY_TRENDING_KEY, local=True)
+    on_commit_once(rebuild_story_trending)
+
+
+def get_story_detail_key(pk):
+    return STORY_DETAIL_KEY.format(pk=pk)
+
+
+def invalidate_story_detail(*pks):
+    keys = [get_story_detail_key(pk) for pk in pks]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_story_validators(story):
+    """
+    Return (etag, last_modified) for the detail of a story loaded with its writer's profile.
+    """
+    writer = story.writer
+    profile = getattr(writer, 'userprofile', None)
+    versions = [story.updated_at]
+    if profile is not None:
+        versions.append(profile.updated_at)
+    version = ':'.join([str(story.pk), writer.username] + [str(v.timestamp()) for v in versions])
+    etag = '"%s"' % hashlib.md5(version.encode('utf-8')).hexdigest()
+    return etag, int(max(versions).timestamp())
+
+
+def invalidate_story_comments(story_id):
+    """
+    Change the ETag of every comment page of the story, now and again once the current
+    transaction commits, so that pre-commit data is never validated by the new ETag.
+    """
+    key = STORY_COMMENTS_GENERATION_KEY.format(pk=story_id)
+    bump_generation(key, STORY_COMMENTS_GENERATION_TIMEOUT)
+    transaction.on_commit(lambda: bump_generation(key, STORY_COMMENTS_GENERATION_TIMEOUT))
+
+
+def invalidate_writer_comments(user_id):
+    """
+    Invalidate the comment pages of every story the user commented on, and return their ids.
+    """
+    story_ids = StoryComment.objects. \
+        filter(writer_id=user_id). \
+        values_list('story_id', flat=True). \
+        distinct()
+    story_ids = list(story_ids)
+    for story_id in story_ids:
+        invalidate_story_comments(story_id)
+    return story_ids
+
+
+def get_story_comments_etag(story_id, query_params):
+    # One ETag per page whatever the parameter order or page spelling ('01', none for the first page).
+    params = query_params.copy()
+    page = params.get('page', '1')
+    if page.isdigit():
+        params['page'] = str(int(page))
+    if params.get('page') == '1':
+        del params['page']
+    generation = load_generation(STORY_COMMENTS_GENERATION_KEY.format(pk=story_id), STORY_COMMENTS_GENERATION_TIMEOUT)
+    version = f'{story_id}:{generation}:{urlencode(sorted(params.lists()), doseq=True)}'
+    return '"%s"' % hashlib.md5(version.encode('utf-8')).hexdigest()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from story.models import Story
+from story.trending import compute_trending_scores, update_trending
+
+
+class Command(BaseCommand):
+    help = 'Compute trending stories from recent reads and comments and update trending_order. Run it from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the best scoring stories without changing anything.')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            story_ids, scores = compute_trending_scores()
+            for index in scores.argsort()[::-1][:len(Story.TRENDING_ORDER_CHOICES)]:
+                self.stdout.write(f'{story_ids[index]}\t{scores[index]:.3f}')
+            return
+        trending = update_trending()
+        for story_id, slot in sorted(trending.items(), key=lambda item: item[1]):
+            self.stdout.write(f'{slot}\t{story_id}')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from story.reads import flush_story_reads
+
+
+class Command(BaseCommand):
+    help = 'Write buffered story reads to StoryRead. Run it from cron, or keep it running with --interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Flush every INTERVAL seconds until interrupted.')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            written = flush_story_reads()
+            if written is None:
+                self.stdout.write('Another flush is running.')
+            elif options['verbosity'] >= 1 and (written or interval is None):
+                self.stdout.write(f'Flushed reads of {written} (story, user) pairs.')
+            if interval is None:
+                return
+            time.sleep(interval)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from story.models import Tag
+from story.tags import build_tag_stories, delete_tag_stories
+from wadium.cache import get_redis
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Redis index of published stories per tag.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tags', nargs='*', help='Tag names (default: every tag).')
+
+    def handle(self, *args, **options):
+        redis = get_redis()
+        if redis is None:
+            self.stdout.write('The cache is not Redis; tag queries use the database.')
+            return
+        tags = Tag.objects.all()
+        if options['tags']:
+            tags = tags.filter(name__in=options['tags'])
+        tag_ids = list(tags.values_list('id', flat=True))
+        delete_tag_stories(tag_ids)
+        build_tag_stories(redis, tag_ids)
+        self.stdout.write(f'Rebuilt the index of {len(tag_ids)} tags.')
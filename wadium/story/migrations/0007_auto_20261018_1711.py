@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0006_auto_20210102_1558'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='storycomment',
+            index=models.Index(fields=['story', 'created_at', 'id'], name='story_story_story_i_c590bf_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0007_auto_20261018_1711'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storyread',
+            name='count',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0008_auto_20261018_1727'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='trending_pinned',
+            field=models.BooleanField(default=False),
+        ),
+    ]
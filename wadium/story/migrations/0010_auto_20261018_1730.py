@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0009_story_trending_pinned'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='storytag',
+            index=models.Index(fields=['tag', 'story'], name='story_story_tag_id_dce7c7_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0010_auto_20261018_1730'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['main_order', 'trending_order', 'published_at', 'id', 'published'], name='story_story_main_or_1e8eed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['trending_order', 'published'], name='story_story_trendin_35d1a2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['writer', 'published_at', 'published'], name='story_story_writer__683b9b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['writer', 'updated_at', 'published'], name='story_story_writer__1f5872_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def pin_trending_stories(apps, schema_editor):
+    # Stories in trending_order before the trending engine were picked by editors: keep them.
+    Story = apps.get_model('story', 'Story')
+    Story.objects.filter(trending_order__isnull=False).update(trending_pinned=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0011_story_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(pin_trending_stories, migrations.RunPython.noop),
+    ]
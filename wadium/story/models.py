@@ -16,8 +16,22 @@ class Story(models.Model):
     TRENDING_ORDER_CHOICES = list(zip(range(1, 7), map(str, range(1, 7))))
     main_order = models.PositiveSmallIntegerField(null=True, blank=True, choices=MAIN_ORDER_CHOICES)
     trending_order = models.PositiveSmallIntegerField(null=True, blank=True, choices=TRENDING_ORDER_CHOICES)
+    # Pinned stories keep their trending_order when compute_trending fills the other slots.
+    trending_pinned = models.BooleanField(default=False)
     # blank set to integer fields to pass validation in admin site
 
+    class Meta:
+        # filter(published=True) compiles to a bare `WHERE published`, which the databases do not
+        # match against an index prefix, so `published` comes last and is checked within the index.
+        indexes = [
+            # /story/ (pages and keyset cursor) and /story/main/
+            models.Index(fields=['main_order', 'trending_order', 'published_at', 'id', 'published']),
+            models.Index(fields=['trending_order', 'published']),  # /story/trending/
+            # /user/{id}/story/, /user/me/story/?public=
+            models.Index(fields=['writer', 'published_at', 'published']),
+            models.Index(fields=['writer', 'updated_at', 'published']),
+        ]
+
 
 class StoryComment(models.Model):
     story = models.ForeignKey(Story, related_name='comments', on_delete=models.CASCADE)
@@ -26,6 +40,11 @@ class StoryComment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['story', 'created_at', 'id'])  # comment_list keyset pagination
+        ]
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -38,12 +57,15 @@ class StoryTag(models.Model):
 
     class Meta:
         unique_together = ['story', 'tag']
+        indexes = [
+            models.Index(fields=['tag', 'story'])  # tag queries on story lists
+        ]
 
 
 class StoryRead(models.Model):
     story = models.ForeignKey(Story, related_name='story_read', on_delete=models.CASCADE)
     user = models.ForeignKey(User, related_name='story_read', on_delete=models.CASCADE)
-    count = models.PositiveSmallIntegerField()
+    count = models.PositiveBigIntegerField(default=0)
     read_at = models.DateTimeField()
 
     class Meta:
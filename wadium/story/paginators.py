@@ -1,8 +1,20 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from wadium.counts import CountedPaginationMixin
 
+CURSOR_INT_MAX = 2 ** 63 - 1  # the widest integer column
 
-class StoryPagination(PageNumberPagination):
+
+class StoryPagination(CountedPaginationMixin, PageNumberPagination):
     page_size = 10
 
     def get_paginated_response(self, data):
@@ -11,12 +23,13 @@ class StoryPagination(PageNumberPagination):
     def get_paginated_data(self, data):
         return {
             'count': self.page.paginator.count,
+            'count_exact': self.page.paginator.count_exact,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'stories': data
         }
 
-class CommentPagination(PageNumberPagination):
+class CommentPagination(CountedPaginationMixin, PageNumberPagination):
     page_size = 10
 
     def get_paginated_response(self, data):
@@ -25,7 +38,152 @@ class CommentPagination(PageNumberPagination):
     def get_paginated_data(self, data):
         return {
             'count': self.page.paginator.count,
+            'count_exact': self.page.paginator.count_exact,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'comments': data
-        }
\ No newline at end of file
+        }
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over a unique `ordering` such as ('-published_at', '-id').
+    The cursor holds the ordering values of the edge row of the current page,
+    so each page is a single indexed range scan with no COUNT and no OFFSET.
+    """
+    cursor_query_param = 'cursor'
+    # Optional: `?after=<pk>` starts right after the given row, e.g. to poll for new rows only.
+    after_query_param = None
+    page_size = 10
+    ordering = ()
+    results_key = 'results'
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_after_message = 'Invalid after'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.reverse, self.position = self.decode_cursor(request, queryset.model)
+        if self.position is None and self.after_query_param in request.query_params:
+            self.position = self.get_after_position(queryset, request.query_params[self.after_query_param])
+            self.base_url = remove_query_param(self.base_url, self.after_query_param)
+
+        ordering = self.get_ordering()
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            try:
+                queryset = queryset.filter(self.get_seek_filter(ordering, self.position))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # Fetch one extra row to know whether there is a page after this one.
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            self.results_key: data
+        }
+
+    def get_ordering(self):
+        if self.reverse:
+            return tuple(field[1:] if field.startswith('-') else '-' + field for field in self.ordering)
+        return tuple(self.ordering)
+
+    @staticmethod
+    def get_seek_filter(ordering, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        seek = Q()
+        for i, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            condition = Q(**{name + lookup: position[i]})
+            for prev_field, prev_value in zip(ordering[:i], position[:i]):
+                condition &= Q(**{prev_field.lstrip('-'): prev_value})
+            seek |= condition
+        return seek
+
+    def get_position(self, item):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            position.append(item[name] if isinstance(item, dict) else getattr(item, name))
+        return position
+
+    def get_after_position(self, queryset, pk):
+        try:
+            item = queryset.filter(pk=pk).values(*(field.lstrip('-') for field in self.ordering)).first()
+        except (ValidationError, ValueError, TypeError):
+            item = None
+        if item is None:
+            raise NotFound(self.invalid_after_message)
+        return self.get_position(item)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.get_position(self.page[-1]) if self.page else self.position
+        return self.encode_cursor(False, position)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.get_position(self.page[0]) if self.page else self.position
+        return self.encode_cursor(True, position)
+
+    def encode_cursor(self, reverse, position):
+        position = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+        payload = json.dumps({'r': int(reverse), 'p': position}, separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """
+        Return (reverse, position), the position values parsed and range-checked by the
+        model fields of the ordering.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            reverse, position = bool(payload['r']), payload['p']
+            if len(position) != len(self.ordering) or \
+                    not all(isinstance(value, str) or isinstance(value, int) and abs(value) <= CURSOR_INT_MAX
+                            for value in position):
+                raise ValueError()
+            # clean() also runs the validators that bound integers to the column range, where the
+            # backend has them (not SQLite).
+            position = [
+                model._meta.get_field(field.lstrip('-')).clean(value, None)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+
+class StoryCursorPagination(KeysetPagination):
+    ordering = ('-published_at', '-id')
+    results_key = 'stories'
+
+
+class CommentCursorPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+    after_query_param = 'after'
+    results_key = 'comments'
+    invalid_after_message = 'Comments with this id do not exist in this story.'
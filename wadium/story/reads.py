@@ -0,0 +1,146 @@
+import datetime
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from wadium.cache import get_redis
+from .models import Story, StoryRead
+
+STORY_READ_SEEN_KEY = 'story:read:seen:{story_id}:{user_id}'
+STORY_READ_PENDING_KEY = 'story:read:pending'
+STORY_READ_FLUSHING_KEY = 'story:read:flushing'
+STORY_READ_FLUSH_LOCK_KEY = 'story:read:flush:lock'
+STORY_READ_FLUSH_LOCK_TIMEOUT = 60 * 5
+STORY_READ_UPSERT_BATCH_SIZE = 500
+
+STORY_READ_UPSERT_SQL = {
+    'mysql': 'INSERT INTO {table} ({story}, {user}, {count}, {read_at}) VALUES {values} '
+             'ON DUPLICATE KEY UPDATE {count} = {count} + VALUES({count}), '
+             '{read_at} = GREATEST({read_at}, VALUES({read_at}))',
+    'sqlite': 'INSERT INTO {table} ({story}, {user}, {count}, {read_at}) VALUES {values} '
+              'ON CONFLICT ({story}, {user}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}, '
+              '{read_at} = MAX({table}.{read_at}, excluded.{read_at})',
+    'postgresql': 'INSERT INTO {table} ({story}, {user}, {count}, {read_at}) VALUES {values} '
+                  'ON CONFLICT ({story}, {user}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}, '
+                  '{read_at} = GREATEST({table}.{read_at}, excluded.{read_at})',
+}
+
+
+class RedisReadBuffer:
+    """
+    Pending reads in one Redis hash: 'c:<story_id>:<user_id>' holds the number of reads and
+    't:<story_id>:<user_id>' the time of the latest one. A flush renames the hash away, so
+    reads recorded meanwhile go to a fresh one.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.pending_key = cache.make_key(STORY_READ_PENDING_KEY)
+        self.flushing_key = cache.make_key(STORY_READ_FLUSHING_KEY)
+
+    def add(self, story_id, user_id, read_at):
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hincrby(self.pending_key, f'c:{story_id}:{user_id}', 1)
+        pipeline.hset(self.pending_key, f't:{story_id}:{user_id}', read_at)
+        pipeline.execute()
+
+    def take(self):
+        # Reads left behind by a failed flush are retried before new ones are taken.
+        if not self.redis.exists(self.flushing_key):
+            if not self.redis.exists(self.pending_key):
+                return {}
+            self.redis.rename(self.pending_key, self.flushing_key)
+        reads = defaultdict(lambda: [0, 0.0])
+        for field, value in self.redis.hgetall(self.flushing_key).items():
+            kind, story_id, user_id = field.decode().split(':')
+            if kind == 'c':
+                reads[int(story_id), int(user_id)][0] = int(value)
+            else:
+                reads[int(story_id), int(user_id)][1] = float(value)
+        return dict(reads)
+
+    def done(self):
+        self.redis.delete(self.flushing_key)
+
+
+def get_read_buffer():
+    """
+    The Redis buffer of pending reads, or None without a django_redis cache.
+    """
+    redis = get_redis()
+    return RedisReadBuffer(redis) if redis is not None else None
+
+
+def record_story_read(story_id, user_id):
+    """
+    Count a read of the story by the user, at most once per STORY_READ_DEDUP_WINDOW seconds.
+    Reads are buffered in Redis and written to StoryRead by flush_story_reads(). Without Redis
+    there is no buffer that the flush could reach, so the read is written right away.
+    """
+    window = settings.STORY_READ_DEDUP_WINDOW
+    if window and not cache.add(STORY_READ_SEEN_KEY.format(story_id=story_id, user_id=user_id), 1, timeout=window):
+        return False
+    read_buffer = get_read_buffer()
+    if read_buffer is None:
+        upsert_story_reads({(story_id, user_id): [1, time.time()]})
+    else:
+        read_buffer.add(story_id, user_id, time.time())
+    return True
+
+
+def upsert_story_reads(reads):
+    """
+    Add {(story_id, user_id): [count, read_at]} to StoryRead with bulk upserts.
+    Reads of stories or users deleted in the meantime are dropped.
+    """
+    if not reads:
+        return 0
+    story_ids = set(Story.objects.filter(id__in={story_id for story_id, _ in reads}).values_list('id', flat=True))
+    user_ids = set(User.objects.filter(id__in={user_id for _, user_id in reads}).values_list('id', flat=True))
+    rows = [
+        (story_id, user_id, count,
+         connection.ops.adapt_datetimefield_value(datetime.datetime.fromtimestamp(read_at, tz=timezone.utc)))
+        for (story_id, user_id), (count, read_at) in sorted(reads.items())
+        if story_id in story_ids and user_id in user_ids and count > 0
+    ]
+    if not rows:
+        return 0
+
+    quote_name = connection.ops.quote_name
+    columns = {
+        'table': quote_name(StoryRead._meta.db_table),
+        'story': quote_name(StoryRead._meta.get_field('story').column),
+        'user': quote_name(StoryRead._meta.get_field('user').column),
+        'count': quote_name(StoryRead._meta.get_field('count').column),
+        'read_at': quote_name(StoryRead._meta.get_field('read_at').column),
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), STORY_READ_UPSERT_BATCH_SIZE):
+            batch = rows[start:start + STORY_READ_UPSERT_BATCH_SIZE]
+            values = ', '.join(['(%s, %s, %s, %s)'] * len(batch))
+            sql = STORY_READ_UPSERT_SQL[connection.vendor].format(values=values, **columns)
+            cursor.execute(sql, [value for row in batch for value in row])
+    return len(rows)
+
+
+def flush_story_reads():
+    """
+    Write the buffered reads to StoryRead. Returns the number of (story, user) rows written,
+    or None when another flush is running.
+    """
+    read_buffer = get_read_buffer()
+    if read_buffer is None:
+        return 0  # reads were written as they were recorded
+    if not cache.add(STORY_READ_FLUSH_LOCK_KEY, 1, timeout=STORY_READ_FLUSH_LOCK_TIMEOUT):
+        return None
+    try:
+        written = upsert_story_reads(read_buffer.take())
+        read_buffer.done()
+        return written
+    finally:
+        cache.delete(STORY_READ_FLUSH_LOCK_KEY)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Story, StoryComment
 from user.serializers import UserSerializer
+from wadium.timing import timed
 
 
 class StorySerializer(serializers.ModelSerializer):
@@ -66,6 +67,55 @@ class SimpleStorySerializer(serializers.ModelSerializer):
         )
         read_only_fields = fields
 
+
+class StoryCardSerializer:
+    """
+    Read-only fast path for SimpleStorySerializer (and its nested UserSerializer).
+    Builds the same cards straight from `queryset.values(*StoryCardSerializer.values)` rows,
+    without instantiating models or serializer fields per card.
+    Keep in sync with SimpleStorySerializer; test_story_card_parity checks the output.
+    """
+    values = (
+        'id',
+        'writer_id',
+        'writer__username',
+        'writer__userprofile__name',
+        'writer__userprofile__profile_image',
+        'title',
+        'subtitle',
+        'featured_image',
+        'created_at',
+        'published_at',
+    )
+    datetime_field = serializers.DateTimeField()
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def to_representation(cls, row):
+        to_datetime = cls.datetime_field.to_representation
+        return {
+            'id': row['id'],
+            'writer': {
+                'id': row['writer_id'],
+                'username': row['writer__username'],
+                'name': row['writer__userprofile__name'],
+                'profile_image': row['writer__userprofile__profile_image'],
+            },
+            'title': row['title'],
+            'subtitle': row['subtitle'],
+            'featured_image': row['featured_image'],
+            'created_at': to_datetime(row['created_at']),
+            'published_at': to_datetime(row['published_at']) if row['published_at'] is not None else None,
+        }
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return [self.to_representation(row) for row in self.rows]
+
+
 class CommentSerializer(serializers.ModelSerializer):
     writer = UserSerializer(read_only=True)
     story_id = serializers.IntegerField(source='story.id', read_only=True)
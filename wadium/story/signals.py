@@ -0,0 +1,180 @@
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from user.models import UserProfile
+from wadium.cache import get_redis
+from wadium.counts import count_provider
+from .caching import invalidate_story_comments, invalidate_story_detail, invalidate_story_list, \
+    invalidate_story_main, invalidate_story_trending, invalidate_writer_comments
+from .models import Story, StoryComment, StoryTag
+from .tags import add_story_to_tags, remove_story_from_tags, reset_story_tags
+
+STORY_LIST_COUNT = 'story:list'
+StoryState = namedtuple('StoryState', ('writer_id', 'published', 'published_at', 'main_order', 'trending_order'))
+
+
+def user_story_count_name(user_id, published):
+    return f'user:{user_id}:stories:{"published" if published else "drafts"}'
+
+
+def story_comment_count_name(story_id):
+    return f'story:{story_id}:comments'
+
+
+def get_story_count_names(state):
+    """
+    Names of the cached counts that a story in the given state is counted in.
+    """
+    names = {user_story_count_name(state.writer_id, state.published)}
+    if state.published and state.main_order is None and state.trending_order is None:
+        names.add(STORY_LIST_COUNT)
+    return names
+
+
+def get_story_state(story):
+    # Read from __dict__ so that deferred fields are never loaded here.
+    if any(field not in story.__dict__ for field in StoryState._fields):
+        return None
+    return StoryState(*(story.__dict__[field] for field in StoryState._fields))
+
+
+def drop_story_counts(story):
+    count_provider.delete(STORY_LIST_COUNT,
+                          user_story_count_name(story.writer_id, True),
+                          user_story_count_name(story.writer_id, False))
+
+
+@receiver(post_init, sender=Story)
+def remember_story_state(sender, instance, **kwargs):
+    instance._loaded_state = get_story_state(instance) if instance.pk is not None else None
+
+
+def update_story_counts(previous_state, state):
+    names = get_story_count_names(state) if state is not None else set()
+    previous_names = get_story_count_names(previous_state) if previous_state is not None else set()
+    for name in names - previous_names:
+        count_provider.incr(name, 1)
+    for name in previous_names - names:
+        count_provider.incr(name, -1)
+
+
+def invalidate_story_caches(previous_state, state):
+    """
+    Invalidate the cached story views that a story moving between the given states
+    may appear in. A state of None means unknown.
+    """
+    states = (previous_state, state)
+    if None in states or any(s.published for s in states):
+        invalidate_story_list()
+    if None in states or any(s.main_order is not None for s in states):
+        invalidate_story_main()
+    if None in states or any(s.trending_order is not None for s in states):
+        invalidate_story_trending()
+
+
+def update_story_tags(story_id, previous_state, state):
+    """
+    Keep the Redis tag indexes (story/tags.py) in step with the story's publication.
+    A state of None means unknown.
+    """
+    if previous_state is None or state is None:
+        reset_story_tags(story_id)
+    elif not previous_state.published and not state.published:
+        return
+    elif (previous_state.published, previous_state.published_at) != (state.published, state.published_at):
+        if state.published:
+            add_story_to_tags(story_id, state.published_at)
+        else:
+            remove_story_from_tags(story_id)
+
+
+@receiver(post_save, sender=Story)
+def story_saved(sender, instance, created, **kwargs):
+    state = get_story_state(instance)
+    previous_state = instance._loaded_state
+    if created:
+        update_story_counts(None, state)
+        invalidate_story_caches(state, state)
+    elif state is None or previous_state is None:
+        drop_story_counts(instance)
+        invalidate_story_caches(None, None)
+        update_story_tags(instance.pk, None, None)
+    else:
+        update_story_counts(previous_state, state)
+        invalidate_story_caches(previous_state, state)
+        update_story_tags(instance.pk, previous_state, state)
+    invalidate_story_detail(instance.pk)
+    instance._loaded_state = state
+
+
+@receiver(post_delete, sender=Story)
+def story_deleted(sender, instance, **kwargs):
+    state = get_story_state(instance)
+    if state is None:
+        drop_story_counts(instance)
+    else:
+        update_story_counts(state, None)
+    invalidate_story_caches(state, state)
+    invalidate_story_detail(instance.pk)
+    count_provider.delete(story_comment_count_name(instance.pk))
+
+
+@receiver(post_save, sender=UserProfile)
+def writer_profile_saved(sender, instance, created, **kwargs):
+    # Story cards and details show the writer's name and profile image.
+    if created:
+        return
+    # Comment pages show their writers' username, name and profile image.
+    invalidate_writer_comments(instance.user_id)
+    story_ids = list(Story.objects.filter(writer_id=instance.user_id, published=True).values_list('id', flat=True))
+    if story_ids:
+        invalidate_story_detail(*story_ids)
+        invalidate_story_caches(None, None)
+
+
+@receiver(post_save, sender=User)
+def writer_saved(sender, instance, created, update_fields, **kwargs):
+    # Logins only update last_login.
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    invalidate_writer_comments(instance.pk)
+
+
+@receiver(post_save, sender=StoryTag)
+def story_tag_saved(sender, instance, created, **kwargs):
+    if get_redis() is None:
+        return
+    published_at = Story.objects. \
+        filter(id=instance.story_id, published=True). \
+        values_list('published_at', flat=True)
+    if published_at:
+        add_story_to_tags(instance.story_id, published_at[0], [instance.tag_id])
+
+
+# Deleting a story (or a tag) sends this for each of its StoryTags instead of fast-deleting them,
+# which is fine for the few tags a story has.
+@receiver(post_delete, sender=StoryTag)
+def story_tag_deleted(sender, instance, **kwargs):
+    remove_story_from_tags(instance.story_id, [instance.tag_id])
+
+
+@receiver(post_save, sender=StoryComment)
+def story_comment_saved(sender, instance, created, **kwargs):
+    if created:
+        count_provider.incr(story_comment_count_name(instance.story_id), 1)
+    invalidate_story_comments(instance.story_id)
+
+# There is no post_delete receiver for StoryComment on purpose: it would stop Django from
+# fast-deleting the comments of a deleted story. StoryViewSet.comment decreases the count
+# and invalidates the comment pages, and writer_deleted covers the cascade from a user.
+@receiver(pre_delete, sender=User)
+def writer_deleted(sender, instance, **kwargs):
+    # Their comments are fast-deleted by the cascade.
+    names = [story_comment_count_name(story_id) for story_id in invalidate_writer_comments(instance.pk)]
+    if names:
+        count_provider.delete(*names)
+        transaction.on_commit(lambda: count_provider.delete(*names))
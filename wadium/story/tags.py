@@ -0,0 +1,273 @@
+import hashlib
+import secrets
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from wadium.cache import get_redis
+from .models import Story, StoryTag, Tag
+
+TAG_MODES = ('and', 'or')
+# Published story ids of a tag, scored by published_at. Built on first use, then kept up to date
+# by story/signals.py; the timeout bounds staleness from changes that bypass model signals.
+TAG_STORIES_KEY = 'tag:{tag_id}:stories'
+TAG_STORIES_TIMEOUT = 60 * 60 * 24
+# Every index holds this member (scored -inf, so it sorts last): an empty tag still has an index.
+TAG_STORIES_MARKER = 'marker'
+# Bumped by every change to the stories of a tag, so that a build can tell whether it raced one.
+TAG_STORIES_VERSION_KEY = 'tag:{tag_id}:stories:version'
+# A build that raced a change may have missed it: it is only kept this long.
+TAG_STORIES_RACED_TIMEOUT = 30
+# Intersections and unions of several tags are not kept up to date, only briefly reused.
+TAG_COMBINED_STORIES_KEY = 'tag:stories:{mode}:{digest}'
+TAG_COMBINED_STORIES_TIMEOUT = 30
+
+# Record a change to a tag's stories, and apply it to the index if there is one: a missing index
+# is rebuilt in full on its next read.
+# KEYS: index, version. ARGV: 'add' or 'remove', story id, score, version timeout.
+UPDATE_TAG_STORIES = """
+redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[4])
+if redis.call('exists', KEYS[1]) == 1 then
+    if ARGV[1] == 'add' then
+        redis.call('zadd', KEYS[1], ARGV[3], ARGV[2])
+    else
+        redis.call('zrem', KEYS[1], ARGV[2])
+    end
+end
+"""
+
+# Move a built index into place; if the tag changed since the build read the database, the
+# build may have missed the change and is kept only briefly.
+# KEYS: built index, index, version. ARGV: version before the build, timeout, raced timeout.
+INSTALL_TAG_STORIES = """
+local version = redis.call('get', KEYS[3]) or '0'
+redis.call('rename', KEYS[1], KEYS[2])
+if version == ARGV[1] then
+    redis.call('expire', KEYS[2], ARGV[2])
+else
+    redis.call('expire', KEYS[2], ARGV[3])
+end
+"""
+
+_scripts = {}
+
+
+def get_script(redis, source):
+    """
+    The script registered once per process; call it with client=redis (or a pipeline).
+    """
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = redis.register_script(source)
+    return script
+
+
+def get_tag_names(query_params):
+    """
+    ?tag=a&tag=b and ?tag=a,b both mean the tags a and b.
+    """
+    names = []
+    for value in query_params.getlist('tag'):
+        names += [name.strip() for name in value.split(',') if name.strip()]
+    return list(dict.fromkeys(names))
+
+
+def get_tag_query(query_params):
+    """
+    Parse ?tag= and ?tag_mode=[and|or] (default: and) into (tag_ids, mode).
+    tag_ids is None when no story can match. Raises ValueError for an invalid tag_mode.
+    """
+    mode = query_params.get('tag_mode', 'and')
+    if mode not in TAG_MODES:
+        raise ValueError("'tag_mode' should either be 'and' or 'or'.")
+    names = get_tag_names(query_params)
+    tag_ids = list(Tag.objects.filter(name__in=names).values_list('id', flat=True))
+    if not tag_ids or (mode == 'and' and len(tag_ids) < len(names)):
+        return None, mode
+    return sorted(tag_ids), mode
+
+
+def filter_by_tags(queryset, tag_ids, mode):
+    """
+    Filter a story queryset through the StoryTag (tag, story) index.
+    """
+    story_tags = StoryTag.objects.filter(tag_id__in=tag_ids).values('story_id')
+    if mode == 'and' and len(tag_ids) > 1:
+        story_tags = story_tags.annotate(tag_count=Count('tag_id')).filter(tag_count=len(tag_ids))
+    return queryset.filter(id__in=story_tags.values('story_id'))
+
+
+def get_tag_stories_key(tag_id):
+    return cache.make_key(TAG_STORIES_KEY.format(tag_id=tag_id))
+
+
+def get_tag_stories_version_key(tag_id):
+    return cache.make_key(TAG_STORIES_VERSION_KEY.format(tag_id=tag_id))
+
+
+def build_tag_stories(redis, tag_ids):
+    """
+    Build the index of every given tag that does not exist yet, in a temporary key that is
+    then renamed into place.
+    """
+    pipeline = redis.pipeline(transaction=False)
+    for tag_id in tag_ids:
+        pipeline.exists(get_tag_stories_key(tag_id))
+    missing = [tag_id for tag_id, exists in zip(tag_ids, pipeline.execute()) if not exists]
+    if not missing:
+        return
+    # Read before the database, so that a change committed after the read shows as a new version.
+    versions = redis.mget([get_tag_stories_version_key(tag_id) for tag_id in missing])
+    rows = StoryTag.objects. \
+        filter(tag_id__in=missing, story__published=True). \
+        values_list('tag_id', 'story_id', 'story__published_at')
+    members = {tag_id: {TAG_STORIES_MARKER: '-inf'} for tag_id in missing}
+    for tag_id, story_id, published_at in rows:
+        members[tag_id][story_id] = published_at.timestamp() if published_at is not None else 0
+
+    install = get_script(redis, INSTALL_TAG_STORIES)
+    build_id = secrets.token_hex(8)
+    pipeline = redis.pipeline(transaction=False)
+    for tag_id, version in zip(missing, versions):
+        key = get_tag_stories_key(tag_id)
+        built_key = f'{key}:build:{build_id}'
+        pipeline.zadd(built_key, members[tag_id])
+        pipeline.expire(built_key, TAG_STORIES_RACED_TIMEOUT)
+        install(keys=[built_key, key, get_tag_stories_version_key(tag_id)],
+                args=[version or b'0', TAG_STORIES_TIMEOUT, TAG_STORIES_RACED_TIMEOUT], client=pipeline)
+    pipeline.execute()
+
+
+def update_tag_stories(redis, tag_ids, action, story_id, score=0):
+    update = get_script(redis, UPDATE_TAG_STORIES)
+    pipeline = redis.pipeline(transaction=False)
+    for tag_id in tag_ids:
+        update(keys=[get_tag_stories_key(tag_id), get_tag_stories_version_key(tag_id)],
+               args=[action, story_id, score, TAG_STORIES_TIMEOUT], client=pipeline)
+    pipeline.execute()
+
+
+def delete_tag_stories(tag_ids=None):
+    """
+    Drop the indexes of the given tags (by default, all of them); they are rebuilt on their next read.
+    """
+    redis = get_redis()
+    if redis is None:
+        return
+    if tag_ids is None:
+        tag_ids = Tag.objects.values_list('id', flat=True)
+    pipeline = redis.pipeline(transaction=False)
+    for tag_id in tag_ids:
+        # A build running meanwhile must not put back what it read before.
+        pipeline.incr(get_tag_stories_version_key(tag_id))
+        pipeline.expire(get_tag_stories_version_key(tag_id), TAG_STORIES_TIMEOUT)
+        pipeline.delete(get_tag_stories_key(tag_id))
+    pipeline.execute()
+
+
+def reset_story_tags(story_id):
+    """
+    Drop the indexes of the story's tags once the current transaction commits,
+    for when it is unknown how the story changed.
+    """
+    if get_redis() is None:
+        return
+    tag_ids = get_story_tag_ids(story_id)
+    if tag_ids:
+        transaction.on_commit(lambda: delete_tag_stories(tag_ids))
+
+
+class TaggedStories:
+    """
+    Published stories with the given tags, newest first, read from the Redis tag index.
+    Supports count() and slicing, so Django's Paginator can page over it: a page costs a
+    ZREVRANGE and a primary key lookup instead of a join over the story table.
+    """
+
+    def __init__(self, redis, tag_ids, mode, values):
+        self.redis = redis
+        self.tag_ids = tag_ids
+        self.mode = mode
+        self.values = values
+        self._key = None
+
+    @property
+    def key(self):
+        if self._key is None:
+            build_tag_stories(self.redis, self.tag_ids)
+            keys = [get_tag_stories_key(tag_id) for tag_id in self.tag_ids]
+            if len(keys) == 1:
+                self._key = keys[0]
+            else:
+                digest = hashlib.md5(','.join(map(str, self.tag_ids)).encode('utf-8')).hexdigest()
+                self._key = cache.make_key(TAG_COMBINED_STORIES_KEY.format(mode=self.mode, digest=digest))
+                if not self.redis.exists(self._key):
+                    pipeline = self.redis.pipeline()
+                    if self.mode == 'and':
+                        pipeline.zinterstore(self._key, keys, aggregate='MAX')
+                    else:
+                        pipeline.zunionstore(self._key, keys, aggregate='MAX')
+                    pipeline.expire(self._key, TAG_COMBINED_STORIES_TIMEOUT)
+                    pipeline.execute()
+        return self._key
+
+    def count(self):
+        return max(self.redis.zcard(self.key) - 1, 0)  # without the marker
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        if index.stop is not None and index.stop <= start:
+            return []
+        stop = index.stop - 1 if index.stop is not None else -1
+        ids = [int(story_id) for story_id in self.redis.zrevrange(self.key, start, stop)
+               if story_id != TAG_STORIES_MARKER.encode()]
+        stories = {story['id']: story for story in Story.objects.filter(id__in=ids, published=True).values(*self.values)}
+        return [stories[story_id] for story_id in ids if story_id in stories]
+
+
+def get_tagged_stories(tag_ids, mode, values):
+    """
+    Return TaggedStories for the tags, or None when the cache is not Redis.
+    """
+    redis = get_redis()
+    if redis is None:
+        return None
+    return TaggedStories(redis, tag_ids, mode, values)
+
+
+def get_story_tag_ids(story_id):
+    return list(StoryTag.objects.filter(story_id=story_id).values_list('tag_id', flat=True))
+
+
+def add_story_to_tags(story_id, published_at, tag_ids=None):
+    """
+    Add a published story to the indexes of its tags (by default, all of them) once the
+    current transaction commits.
+    """
+    redis = get_redis()
+    if redis is None:
+        return
+    if tag_ids is None:
+        tag_ids = get_story_tag_ids(story_id)
+    if not tag_ids:
+        return
+    score = published_at.timestamp() if published_at is not None else 0
+    transaction.on_commit(lambda: update_tag_stories(redis, tag_ids, 'add', story_id, score))
+
+
+def remove_story_from_tags(story_id, tag_ids=None):
+    redis = get_redis()
+    if redis is None:
+        return
+    if tag_ids is None:
+        tag_ids = get_story_tag_ids(story_id)
+    if not tag_ids:
+        return
+    transaction.on_commit(lambda: update_tag_stories(redis, tag_ids, 'remove', story_id))
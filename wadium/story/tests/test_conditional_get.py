@@ -0,0 +1,148 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, Client
+from wadium.cache import clear_all
+from rest_framework.authtoken.models import Token
+from rest_framework import status
+import json
+
+from story.caching import STORY_COMMENTS_GENERATION_KEY
+from story.models import Story, StoryComment
+from story.serializers import StorySerializer
+from user.models import UserProfile
+
+
+class ConditionalGetTestCase(TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.user_token = 'Token ' + Token.objects.create(user=self.user).key
+        self.story = Story.objects.create(writer=self.user, title='Hello', main_order=1, trending_order=1)
+        self.client.post(f'/story/{self.story.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+        self.client.post(f'/story/{self.story.id}/comment/', json.dumps({'body': 'Comment'}),
+                         content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+
+    def assertNotModified(self, uri, etag):
+        response = self.client.get(uri, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def assertModified(self, uri, etag):
+        response = self.client.get(uri, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_retrieve_not_modified(self):
+        uri = f'/story/{self.story.id}/'
+        response = self.client.get(uri)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertNotModified(uri, etag)
+
+        with self.subTest(msg='no serialization without the cached response'):
+            clear_all()
+            with mock.patch.object(StorySerializer, 'to_representation') as mock_to_representation:
+                self.assertNotModified(uri, etag)
+                mock_to_representation.assert_not_called()
+
+        with self.subTest(msg='If-Modified-Since'):
+            response = self.client.get(uri, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.subTest(msg='edit'):
+            self.client.put(uri, json.dumps({'body': [{'type': 'paragraph', 'detail': 'Edited'}]}),
+                            content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+            etag = self.assertModified(uri, etag)
+            self.assertNotModified(uri, etag)
+
+        with self.subTest(msg='writer profile'):
+            self.user.userprofile.name = 'Seoyoon'
+            self.user.userprofile.save()
+            self.assertModified(uri, etag)
+
+    def test_list_not_modified(self):
+        for uri in ('/story/', '/story/main/', '/story/trending/'):
+            with self.subTest(uri=uri):
+                etag = self.client.get(uri)['ETag']
+                self.assertNotModified(uri, etag)
+
+        etag = self.client.get('/story/')['ETag']
+        story = Story.objects.create(writer=self.user, title='Another')
+        self.client.post(f'/story/{story.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+        self.assertModified('/story/', etag)
+
+        etag = self.client.get('/story/main/')['ETag']
+        self.story.title = 'Edited'
+        self.story.save()
+        self.assertModified('/story/main/', etag)
+
+    def test_comment_list_not_modified(self):
+        uri = f'/story/{self.story.id}/comment/'
+        etag = self.client.get(uri)['ETag']
+        with self.assertNumQueries(1):  # only the story
+            self.assertNotModified(uri, etag)
+        self.assertNotModified(f'{uri}?page=01', etag)
+        self.assertModified(f'{uri}?page=1&b=1&a=1', etag)
+        self.assertNotModified(f'{uri}?a=1&b=1', self.client.get(f'{uri}?b=1&a=1')['ETag'])
+
+        with self.subTest(msg='post'):
+            self.client.post(uri, json.dumps({'body': 'Another comment'}),
+                             content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+            etag = self.assertModified(uri, etag)
+
+        comment = StoryComment.objects.first()
+        with self.subTest(msg='edit'):
+            self.client.put(f'{uri}?id={comment.id}', json.dumps({'body': 'Edited'}),
+                            content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+            etag = self.assertModified(uri, etag)
+
+        with self.subTest(msg='delete'):
+            self.client.delete(f'{uri}?id={comment.id}', HTTP_AUTHORIZATION=self.user_token)
+            etag = self.assertModified(uri, etag)
+
+        with self.subTest(msg='writer profile'):
+            self.user.userprofile.name = 'Seoyoon'
+            self.user.userprofile.save()
+            etag = self.assertModified(uri, etag)
+
+        with self.subTest(msg='writer username'):
+            self.user.username = 'seoyoon2'
+            self.user.save(update_fields=['username'])
+            etag = self.assertModified(uri, etag)
+
+        with self.subTest(msg='writer login'):
+            self.user.save(update_fields=['last_login'])
+            self.assertNotModified(uri, etag)
+
+    def test_comment_deleted_outside_view(self):
+        uri = f'/story/{self.story.id}/comment/'
+        reader = UserProfile.create_user('reader', {'name': 'Reader', 'email': 'reader@wadium.shop'})
+        StoryComment.objects.create(story=self.story, writer=reader, body='Reader comment')
+        response = self.client.get(uri)
+        self.assertEqual(response.json()['count'], 2)
+
+        with self.subTest(msg='writer deleted'):
+            reader.delete()  # the cascade fast-deletes the comment
+            response = self.client.get(uri, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['count'], 1)
+
+        with self.subTest(msg='queryset delete'):
+            etag = response['ETag']
+            StoryComment.objects.filter(story=self.story).delete()
+            cache.delete(STORY_COMMENTS_GENERATION_KEY.format(pk=self.story.id))  # expired
+            self.assertModified(uri, etag)
+
+    def test_browsable_api_has_no_etag(self):
+        for uri in ('/story/', f'/story/{self.story.id}/', f'/story/{self.story.id}/comment/'):
+            with self.subTest(uri=uri):
+                response = self.client.get(uri, HTTP_ACCEPT='text/html')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotIn('ETag', response)
@@ -0,0 +1,91 @@
+from unittest import mock
+
+from django.test import TestCase, Client
+from wadium.cache import clear_all
+from rest_framework.authtoken.models import Token
+from rest_framework import status
+import json
+
+from story.caching import bump_story_list_generation
+from story.models import Story, StoryComment
+from user.models import UserProfile
+from wadium.counts import CountProvider
+
+
+class CountCacheTestCase(TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.user_token = 'Token ' + Token.objects.create(user=self.user).key
+        for i in range(3):
+            story = Story.objects.create(writer=self.user, title=f'Story {i}')
+            self.client.post(f'/story/{story.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+        self.story = Story.objects.create(writer=self.user, title='Draft')
+
+    def get_list_count(self):
+        bump_story_list_generation()  # skip the page cache
+        data = self.client.get('/story/').json()
+        self.assertTrue(data['count_exact'])
+        return data['count']
+
+    def test_story_list_count_cached(self):
+        self.assertEqual(self.get_list_count(), 3)
+        bump_story_list_generation()
+        with self.assertNumQueries(1):  # only the page, no COUNT(*)
+            self.assertEqual(self.client.get('/story/').json()['count'], 3)
+
+    def test_story_list_count_incremental(self):
+        self.assertEqual(self.get_list_count(), 3)
+        with self.subTest(msg='publish'):
+            self.client.post(f'/story/{self.story.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(self.get_list_count(), 4)
+        with self.subTest(msg='unpublish'):
+            self.client.post(f'/story/{self.story.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(self.get_list_count(), 3)
+        with self.subTest(msg='main story leaves the list'):
+            story = Story.objects.filter(published=True).first()
+            story.main_order = 1
+            story.save()
+            self.assertEqual(self.get_list_count(), 2)
+        with self.subTest(msg='delete'):
+            story = Story.objects.filter(published=True, main_order=None).first()
+            self.client.delete(f'/story/{story.id}/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(self.get_list_count(), 1)
+        self.assertEqual(self.get_list_count(), Story.objects.filter(published=True, main_order=None).count())
+
+    def test_user_story_count_incremental(self):
+        uri = '/user/me/story/?public=false'
+        self.assertEqual(self.client.get(uri, HTTP_AUTHORIZATION=self.user_token).json()['count'], 1)
+        self.client.post('/story/', json.dumps({
+            'title': 'Another draft',
+            'subtitle': '',
+            'body': [],
+            'featured_image': '',
+        }), content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual(self.client.get(uri, HTTP_AUTHORIZATION=self.user_token).json()['count'], 2)
+
+    def test_comment_count_incremental(self):
+        story = Story.objects.filter(published=True).first()
+        uri = f'/story/{story.id}/comment/'
+        self.assertEqual(self.client.get(uri).json()['count'], 0)
+        for i in range(2):
+            self.client.post(uri, json.dumps({'body': f'Comment {i}'}),
+                             content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual(self.client.get(uri).json()['count'], 2)
+        comment = StoryComment.objects.first()
+        self.client.delete(f'{uri}?id={comment.id}', HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual(self.client.get(uri).json()['count'], 1)
+
+    @mock.patch.object(CountProvider, 'estimate', return_value=10 ** 6)
+    def test_estimated_count(self, mock_estimate):
+        response = self.client.get('/story/?page=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['count'], 10 ** 6)
+        self.assertFalse(data['count_exact'])
+        self.assertIsNotNone(data['next'])
@@ -0,0 +1,87 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, Client
+from django.core.cache import cache
+from wadium.cache import clear_all
+from django.utils import timezone
+
+from story import caching
+from story.caching import STORY_MAIN_KEY, STORY_TRENDING_KEY
+from story.models import Story
+from user.models import UserProfile
+
+
+class CurationCacheTestCase(TransactionTestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.stories = [
+            Story.objects.create(writer=self.user, title=f'Story {i}', published=True, published_at=timezone.now())
+            for i in range(3)
+        ]
+
+    def get_ids(self, uri):
+        return [story['id'] for story in self.client.get(uri).json()]
+
+    def test_main_rebuilt_on_save(self):
+        self.assertEqual(self.get_ids('/story/main/'), [])
+        story = self.stories[0]
+        story.main_order = 1
+        story.save()
+        self.assertEqual([story['id'] for story in json.loads(cache.get(STORY_MAIN_KEY)[0].content)], [story.id])
+        self.assertEqual(self.get_ids('/story/main/'), [story.id])
+
+        story.title = 'Edited'
+        story.save()
+        self.assertEqual(self.client.get('/story/main/').json()[0]['title'], 'Edited')
+
+        story.delete()
+        self.assertEqual(self.get_ids('/story/main/'), [])
+
+    def test_trending_rebuilt_on_save(self):
+        self.assertEqual(self.get_ids('/story/trending/'), [])
+        for order, story in enumerate(reversed(self.stories), start=1):
+            story.trending_order = order
+            story.save()
+        self.assertEqual(self.get_ids('/story/trending/'), [story.id for story in reversed(self.stories)])
+
+        story = self.stories[-1]
+        story.trending_order = None
+        story.save()
+        self.assertEqual(self.get_ids('/story/trending/'), [story.id for story in reversed(self.stories[:-1])])
+
+    def test_uncurated_story_keeps_cache(self):
+        self.client.get('/story/main/')
+        with mock.patch.object(caching, 'rebuild_story_main') as mock_rebuild:
+            story = self.stories[0]
+            story.title = 'Edited'
+            story.save()
+            mock_rebuild.assert_not_called()
+
+    def test_admin_bulk_edit_rebuilds_once(self):
+        User.objects.create_superuser('admin', 'admin@wadium.shop', 'password')
+        self.client.login(username='admin', password='password')
+        data = {
+            'form-TOTAL_FORMS': len(self.stories),
+            'form-INITIAL_FORMS': len(self.stories),
+            '_save': 'Save',
+        }
+        stories = Story.objects.order_by('-published_at')
+        for i, story in enumerate(stories):
+            data[f'form-{i}-id'] = story.id
+            data[f'form-{i}-main_order'] = i + 1
+            data[f'form-{i}-trending_order'] = ''
+
+        with mock.patch.object(caching, 'rebuild_story_main', wraps=caching.rebuild_story_main) as mock_rebuild:
+            response = self.client.post('/admin/story/story/', data)
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(mock_rebuild.call_count, 1)
+        self.assertEqual([story['id'] for story in json.loads(cache.get(STORY_MAIN_KEY)[0].content)], [story.id for story in stories])
+        self.assertIsNone(cache.get(STORY_TRENDING_KEY))
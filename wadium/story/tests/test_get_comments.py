@@ -103,3 +103,46 @@ class EditCommentTestCase(TestCase):
             make_comment_URI()
         )
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_comments_cursor(self):
+        expected_ids = list(StoryComment.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        response = self.client.get(
+            f'{make_comment_URI()}?cursor='
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertNotIn('count', data)
+        self.assertIsNone(data['previous'])
+        self.assertIsNotNone(data['next'])
+        self.assertEqual(len(data['comments']), 10)
+        ids = [comment['id'] for comment in data['comments']]
+
+        data = self.client.get(data['next']).json()
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+        ids += [comment['id'] for comment in data['comments']]
+        self.assertEqual(ids, expected_ids)
+
+    def test_get_comments_after(self):
+        comment_ids = list(StoryComment.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        response = self.client.get(
+            f'{make_comment_URI()}?after={comment_ids[11]}'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual([comment['id'] for comment in data['comments']], comment_ids[12:])
+        self.assertIsNone(data['next'])
+
+        with self.subTest(msg='Poll after the latest comment'):
+            response = self.client.get(
+                f'{make_comment_URI()}?after={comment_ids[-1]}'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['comments'], [])
+
+        with self.subTest(msg='Unknown comment id'):
+            for after in (comment_ids[-1] + 100, 'abc'):
+                response = self.client.get(
+                    f'{make_comment_URI()}?after={after}'
+                )
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,105 @@
+from django.test import TestCase, Client, override_settings
+from wadium.cache import clear_all
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework import status
+import datetime
+import json
+
+from story.caching import get_story_list_cache_stats
+from story.models import Story
+from user.models import UserProfile
+
+
+class ListStoryCacheTestCase(TestCase):
+    client = Client()
+    URI = '/story/'
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.user_token = 'Token ' + Token.objects.create(user=self.user).key
+        published_at = timezone.now() - datetime.timedelta(days=1)
+        for i in range(15):
+            Story.objects.create(
+                writer=self.user,
+                title=f'Story {i}',
+                published=True,
+                published_at=published_at + datetime.timedelta(minutes=i),
+            )
+        self.draft = Story.objects.create(writer=self.user, title='Draft')
+
+    def test_list_story_every_page_cached(self):
+        get_story_list_cache_stats()  # flush counts of earlier requests, then clear them
+        clear_all()
+        for page in (1, 2):
+            with self.subTest(page=page):
+                response = self.client.get(f'{self.URI}?page={page}')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                with self.assertNumQueries(0):
+                    cached_response = self.client.get(f'{self.URI}?page={page}')
+                self.assertEqual(cached_response.json(), response.json())
+
+        with self.subTest(msg='cursor pages'):
+            data = self.client.get(f'{self.URI}?cursor=').json()
+            self.client.get(data['next'])
+            with self.assertNumQueries(0):
+                self.client.get(data['next'])
+
+        stats = get_story_list_cache_stats()
+        self.assertEqual(stats['1'], {'hit': 1, 'miss': 1})
+        self.assertEqual(stats['2-10'], {'hit': 1, 'miss': 1})
+        self.assertEqual(stats['cursor'], {'hit': 1, 'miss': 2})
+        self.assertEqual(stats['11+'], {'hit': 0, 'miss': 0})
+
+    def test_list_story_page_normalized(self):
+        response = self.client.get(f'{self.URI}?page=2')
+        for page in ('02', 'last'):
+            with self.subTest(page=page):
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.client.get(f'{self.URI}?page={page}').json(), response.json())
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.wadium.shop'])
+    def test_list_story_links_not_shared(self):
+        self.client.get(self.URI)
+        data = self.client.get(self.URI, HTTP_HOST='api.wadium.shop').json()
+        self.assertEqual(data['next'], 'http://api.wadium.shop/story/?page=2')
+        data = self.client.get(f'{self.URI}?ref=home').json()
+        self.assertEqual(data['next'], 'http://testserver/story/?page=2&ref=home')
+
+    def test_list_story_unknown_params_not_cached(self):
+        self.client.get(f'{self.URI}?x=1')
+        with self.assertNumQueries(1):  # the page; the count is cached
+            data = self.client.get(f'{self.URI}?x=1').json()
+        self.assertEqual(data['next'], 'http://testserver/story/?page=2&x=1')
+
+    def test_list_story_cache_invalidated_on_publish(self):
+        self.client.get(f'{self.URI}?page=2')
+        self.client.post(f'/story/{self.draft.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+        data = self.client.get(self.URI).json()
+        self.assertEqual(data['count'], 16)
+        self.assertEqual(data['stories'][0]['id'], self.draft.id)
+        self.assertEqual(len(self.client.get(f'{self.URI}?page=2').json()['stories']), 6)
+
+    def test_list_story_cache_invalidated_on_update_and_delete(self):
+        story = Story.objects.filter(published=True).latest('published_at')
+        self.client.get(self.URI)
+        self.client.put(f'/story/{story.id}/', json.dumps({'title': 'New title'}),
+                        content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+        data = self.client.get(self.URI).json()
+        self.assertEqual(data['stories'][0]['title'], 'New title')
+
+        self.client.delete(f'/story/{story.id}/', HTTP_AUTHORIZATION=self.user_token)
+        data = self.client.get(self.URI).json()
+        self.assertNotEqual(data['stories'][0]['id'], story.id)
+        self.assertEqual(data['count'], 14)
+
+    def test_list_story_draft_update_keeps_cache(self):
+        self.client.get(self.URI)
+        self.client.put(f'/story/{self.draft.id}/', json.dumps({'title': 'Still a draft'}),
+                        content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+        with self.assertNumQueries(0):
+            self.client.get(self.URI)
@@ -0,0 +1,77 @@
+from django.test import TestCase, Client
+from wadium.cache import clear_all
+from django.utils import timezone
+from rest_framework import status
+import datetime
+import json
+from base64 import urlsafe_b64encode
+
+from story.models import Story
+from user.models import UserProfile
+
+
+class ListStoryCursorTestCase(TestCase):
+    client = Client()
+    URI = '/story/'
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        published_at = timezone.now()
+        for i in range(25):
+            # Every third story shares its timestamp with the previous one, so ties must be broken by id.
+            if i % 3 != 2:
+                published_at -= datetime.timedelta(minutes=1)
+            Story.objects.create(
+                writer=self.user,
+                title=f'Story {i}',
+                published=True,
+                published_at=published_at,
+            )
+        Story.objects.create(writer=self.user, title='Draft')
+        self.expected_ids = list(Story.objects.filter(published=True).
+                                 order_by('-published_at', '-id').values_list('id', flat=True))
+
+    def test_list_story_cursor_walk(self):
+        response = self.client.get(f'{self.URI}?cursor=')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertNotIn('count', data)
+        self.assertIsNone(data['previous'])
+        self.assertEqual(len(data['stories']), 10)
+
+        ids = [story['id'] for story in data['stories']]
+        pages = 1
+        while data['next'] is not None:
+            data = self.client.get(data['next']).json()
+            self.assertIsNotNone(data['previous'])
+            ids += [story['id'] for story in data['stories']]
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, self.expected_ids)
+
+        with self.subTest(msg='Walk back with previous links'):
+            ids = [story['id'] for story in data['stories']]
+            while data['previous'] is not None:
+                data = self.client.get(data['previous']).json()
+                ids = [story['id'] for story in data['stories']] + ids
+            self.assertEqual(ids, self.expected_ids)
+
+    def test_list_story_cursor_page_shape(self):
+        page = self.client.get(self.URI).json()
+        cursor_page = self.client.get(f'{self.URI}?cursor=').json()
+        self.assertEqual(set(page), {'count', 'count_exact', 'next', 'previous', 'stories'})
+        self.assertEqual(set(cursor_page), {'next', 'previous', 'stories'})
+        self.assertEqual(page['stories'][0], cursor_page['stories'][0])
+
+    def test_list_story_invalid_cursor(self):
+        out_of_range = urlsafe_b64encode(json.dumps({'r': 0, 'p': ['2020-01-01T00:00:00+00:00', 10 ** 30]}).encode())
+        bad_date = urlsafe_b64encode(json.dumps({'r': 0, 'p': ['99999-01-01', 1]}).encode())
+        for cursor in ('invalid', 'eyJyIjowfQ==', 'eyJyIjowLCJwIjpbIngiLDFdfQ==', out_of_range.decode(),
+                       bad_date.decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'{self.URI}?cursor={cursor}')
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,167 @@
+from unittest import mock
+
+from django.test import TransactionTestCase, Client
+from wadium.cache import clear_all, get_redis
+from django.utils import timezone
+from rest_framework import status
+import datetime
+
+from story import tags
+from story.models import Story, StoryTag, Tag
+from user.models import UserProfile
+
+
+class ListStoryTagTestCase(TransactionTestCase):
+    # The Redis tag index is updated once transactions commit.
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.other = UserProfile.create_user('jiwon', {
+            'name': 'Jiwon Kim',
+            'email': 'jiwon@wadium.shop',
+        })
+        self.python = Tag.objects.create(name='python')
+        self.django = Tag.objects.create(name='django')
+        Tag.objects.create(name='unused')
+        published_at = timezone.now()
+        self.stories = {}
+        for title, writer, tags in (
+                ('both', self.user, (self.python, self.django)),
+                ('python', self.user, (self.python,)),
+                ('django', self.other, (self.django,)),
+                ('none', self.user, ()),
+        ):
+            published_at -= datetime.timedelta(minutes=1)
+            story = Story.objects.create(writer=writer, title=title, published=True, published_at=published_at)
+            for tag in tags:
+                StoryTag.objects.create(story=story, tag=tag)
+            self.stories[title] = story
+        draft = Story.objects.create(writer=self.user, title='draft')
+        StoryTag.objects.create(story=draft, tag=self.python)
+
+    def get_titles(self, uri, check_count=True):
+        response = self.client.get(uri)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        titles = [story['title'] for story in data['stories']]
+        if check_count and 'count' in data:
+            self.assertEqual(data['count'], len(titles))
+        return titles
+
+    def test_list_story_tag(self):
+        self.assertEqual(self.get_titles('/story/?tag=python'), ['both', 'python'])
+        self.assertEqual(self.get_titles('/story/?tag=unused'), [])
+        self.assertEqual(self.get_titles('/story/?tag=nonexistent'), [])
+        self.assertEqual(self.get_titles('/story/?tag=django&title=bo'), ['both'])
+        self.assertEqual(self.get_titles('/story/?tag=django&cursor='), ['both', 'django'])
+
+    def test_list_story_tag_mode(self):
+        self.assertEqual(self.get_titles('/story/?tag=python&tag=django'), ['both'])
+        self.assertEqual(self.get_titles('/story/?tag=python,django&tag_mode=and'), ['both'])
+        self.assertEqual(self.get_titles('/story/?tag=python,django&tag_mode=or'), ['both', 'python', 'django'])
+        self.assertEqual(self.get_titles('/story/?tag=python,nonexistent'), [])
+        self.assertEqual(self.get_titles('/story/?tag=python,nonexistent&tag_mode=or'), ['both', 'python'])
+        response = self.client.get('/story/?tag=python&tag_mode=xor')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_story_tag_updated(self):
+        # Database counts of filtered lists are cached for a while, so only the pages are checked.
+        self.assertEqual(self.get_titles('/story/?tag=django', check_count=False), ['both', 'django'])
+        with self.subTest(msg='unpublish'):
+            story = self.stories['both']
+            story.published = False
+            story.save()
+            self.assertEqual(self.get_titles('/story/?tag=django', check_count=False), ['django'])
+        with self.subTest(msg='tag added'):
+            StoryTag.objects.create(story=self.stories['none'], tag=self.django)
+            self.assertEqual(self.get_titles('/story/?tag=django', check_count=False), ['django', 'none'])
+        with self.subTest(msg='tag removed'):
+            StoryTag.objects.filter(story=self.stories['django']).delete()
+            self.assertEqual(self.get_titles('/story/?tag=django', check_count=False), ['none'])
+        with self.subTest(msg='story deleted'):
+            self.stories['none'].delete()
+            self.assertEqual(self.get_titles('/story/?tag=django', check_count=False), [])
+
+    def test_user_story_tag(self):
+        uri = f'/user/{self.user.id}/story/'
+        self.assertEqual(self.get_titles(f'{uri}?tag=django'), ['both'])
+        self.assertEqual(self.get_titles(f'{uri}?tag=python,django&tag_mode=or'), ['both', 'python'])
+        self.assertEqual(self.get_titles(f'{uri}?tag=nonexistent'), [])
+
+
+class TagIndexTestCase(TransactionTestCase):
+    """
+    The Redis tag index itself; needs the django_redis cache, as in CI.
+    """
+
+    def setUp(self):
+        self.redis = get_redis()
+        if self.redis is None:
+            self.skipTest('Needs the django_redis cache.')
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.tag = Tag.objects.create(name='python')
+        self.key = tags.get_tag_stories_key(self.tag.id)
+
+    def create_story(self, title):
+        story = Story.objects.create(writer=self.user, title=title, published=True, published_at=timezone.now())
+        StoryTag.objects.create(story=story, tag=self.tag)
+        return story
+
+    def test_empty_tag(self):
+        tagged_stories = tags.get_tagged_stories([self.tag.id], 'and', ['id'])
+        self.assertEqual(tagged_stories.count(), 0)
+        self.assertEqual(tagged_stories[0:10], [])
+        with mock.patch.object(StoryTag.objects, 'filter') as mock_filter:
+            self.assertEqual(tags.get_tagged_stories([self.tag.id], 'and', ['id']).count(), 0)
+            mock_filter.assert_not_called()  # the empty index is not rebuilt
+
+    def test_build(self):
+        story = self.create_story('Story')
+        tagged_stories = tags.get_tagged_stories([self.tag.id], 'and', ['id'])
+        self.assertEqual(tagged_stories[0:10], [{'id': story.id}])
+        self.assertGreater(self.redis.ttl(self.key), tags.TAG_STORIES_RACED_TIMEOUT)
+        self.assertEqual(self.redis.keys(f'{self.key}:build:*'), [])
+
+    def test_build_racing_publish(self):
+        self.create_story('Old')
+        filter_story_tags = StoryTag.objects.filter
+        raced = []
+
+        def racing_filter(*args, **kwargs):
+            rows = list(filter_story_tags(*args, **kwargs).values_list('tag_id', 'story_id', 'story__published_at'))
+            if not raced:
+                # Published once the build read the database, before the index exists.
+                raced.append(self.create_story('New'))
+            return mock.Mock(values_list=mock.Mock(return_value=rows))
+
+        with mock.patch.object(StoryTag.objects, 'filter', side_effect=racing_filter):
+            tags.build_tag_stories(self.redis, [self.tag.id])
+        # The build missed the new story, so it is only kept briefly.
+        self.assertLessEqual(self.redis.ttl(self.key), tags.TAG_STORIES_RACED_TIMEOUT)
+        self.redis.delete(self.key)
+        tagged_stories = tags.get_tagged_stories([self.tag.id], 'and', ['id'])
+        self.assertEqual(tagged_stories.count(), 2)
+        self.assertEqual(tagged_stories[0]['id'], raced[0].id)
+
+    def test_unpublish_after_build(self):
+        story = self.create_story('Story')
+        tags.build_tag_stories(self.redis, [self.tag.id])
+        story.published = False
+        story.save()
+        self.assertEqual(tags.get_tagged_stories([self.tag.id], 'and', ['id']).count(), 0)
+
+    def test_script_registered_once(self):
+        tags._scripts.clear()
+        with mock.patch.object(self.redis, 'register_script', wraps=self.redis.register_script) as register:
+            self.create_story('First')
+            self.create_story('Second')
+        register.assert_called_once_with(tags.UPDATE_TAG_STORIES)
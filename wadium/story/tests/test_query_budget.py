@@ -0,0 +1,92 @@
+from django.test import TestCase, Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+import json
+
+from story.models import Story, StoryComment, StoryTag, Tag
+from story.tests.utils import body_example
+from user.models import UserProfile
+from wadium.cache import clear_all
+from wadium.testing import QueryBudgetMixin
+
+
+class StoryQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.user_token = 'Token ' + Token.objects.create(user=self.user).key
+        self.tag = Tag.objects.create(name='wadium')
+        self.story = self.create_story(self.user, 'Story of seoyoon')
+
+    def create_story(self, writer, title, **kwargs):
+        story = Story.objects.create(writer=writer, title=title, body=body_example, published=True,
+                                     published_at=timezone.now(), **kwargs)
+        StoryTag.objects.create(story=story, tag=self.tag)
+        return story
+
+    def grow(self, size):
+        """
+        One more writer, tagged story and comment on self.story per size; also a fresh
+        draft and comment of the user for the endpoints that change or delete them.
+        """
+        for i in range(self.story.comments.exclude(writer=self.user).count(), size):
+            writer = UserProfile.create_user(f'writer{i}', {
+                'name': f'Writer {i}',
+                'email': f'writer{i}@wadium.shop',
+            })
+            self.create_story(writer, f'Story {i}', main_order=i + 1, trending_order=i + 1)
+            StoryComment.objects.create(story=self.story, writer=writer, body=f'Comment {i}')
+        self.draft = Story.objects.create(writer=self.user, title='Draft', body=body_example)
+        self.comment = StoryComment.objects.create(story=self.story, writer=self.user, body='Mine')
+
+    def get(self, uri):
+        return lambda: self.client.get(uri)
+
+    def send(self, method, uri, data=None):
+        return lambda: getattr(self.client, method)(uri() if callable(uri) else uri, json.dumps(data or {}),
+                                                    content_type='application/json',
+                                                    HTTP_AUTHORIZATION=self.user_token)
+
+    def test_list_budget(self):
+        for uri, budget in (('/story/', 2), ('/story/?cursor=', 1), ('/story/?title=story', 2),
+                            ('/story/?tag=wadium', 3), ('/story/?q=wadium', 5)):
+            with self.subTest(uri=uri):
+                self.assertQueryBudget(self.get(uri), self.grow, budget=budget)
+
+    def test_curation_budget(self):
+        for uri in ('/story/main/', '/story/trending/'):
+            with self.subTest(uri=uri):
+                self.assertQueryBudget(self.get(uri), self.grow, budget=1)
+
+    def test_retrieve_budget(self):
+        self.assertQueryBudget(lambda: self.client.get(f'/story/{self.story.id}/'), self.grow, budget=1)
+
+    def test_comment_list_budget(self):
+        self.assertQueryBudget(lambda: self.client.get(f'/story/{self.story.id}/comment/'), self.grow, budget=3)
+
+    def test_create_budget(self):
+        self.assertQueryBudget(self.send('post', '/story/', {'title': 'New', 'subtitle': '', 'body': body_example, 'featured_image': ''}),
+                               self.grow, budget=7)
+
+    def test_update_budget(self):
+        self.assertQueryBudget(self.send('put', lambda: f'/story/{self.draft.id}/', {'title': 'Edited'}),
+                               self.grow, budget=10)
+
+    def test_publish_budget(self):
+        self.assertQueryBudget(self.send('post', lambda: f'/story/{self.draft.id}/publish/'), self.grow, budget=11)
+
+    def test_destroy_budget(self):
+        self.assertQueryBudget(self.send('delete', lambda: f'/story/{self.draft.id}/'), self.grow, budget=9)
+
+    def test_comment_budget(self):
+        for method, budget in (('post', 4), ('put', 6), ('delete', 5)):
+            with self.subTest(method=method):
+                self.assertQueryBudget(
+                    self.send(method, lambda: f'/story/{self.story.id}/comment/?id={self.comment.id}',
+                              {'body': 'Comment'}),
+                    self.grow, budget=budget)
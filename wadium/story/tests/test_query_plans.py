@@ -0,0 +1,94 @@
+import datetime
+import re
+
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from story.models import Story
+from user.models import UserProfile
+from wadium.cache import clear_all
+
+TABLE = Story._meta.db_table
+SQLITE_TABLE_SCAN = re.compile(r'^SCAN (TABLE )?%s\b' % TABLE)
+
+
+def get_plan_problems(sql):
+    """
+    EXPLAIN a query and return the plan steps that read the story table in full or sort it.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [
+                detail for _, _, _, detail in cursor.fetchall()
+                if 'TEMP B-TREE' in detail or (SQLITE_TABLE_SCAN.match(detail) and 'USING' not in detail)
+            ]
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [
+                f"{row['table']}: type={row['type']} key={row['key']} extra={row['Extra']}" for row in rows
+                if row['table'] == TABLE and (row['type'] == 'ALL' or 'filesort' in (row['Extra'] or ''))
+            ]
+    return []
+
+
+class StoryQueryPlanTestCase(TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.user_token = 'Token ' + Token.objects.create(user=self.user).key
+        other = UserProfile.create_user('jiwon', {
+            'name': 'Jiwon Kim',
+            'email': 'jiwon@wadium.shop',
+        })
+        published_at = timezone.now()
+        for i in range(40):
+            published_at -= datetime.timedelta(minutes=1)
+            Story.objects.create(
+                writer=self.user if i % 2 else other,
+                title=f'Story {i}',
+                published=i % 4 != 3,
+                published_at=published_at if i % 4 != 3 else None,
+                main_order=i + 1 if i < 5 else None,
+                trending_order=i - 4 if 5 <= i < 11 else None,
+            )
+        if connection.vendor == 'mysql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE TABLE {connection.ops.quote_name(TABLE)}')
+
+    def assertIndexedPlans(self, uri, **extra):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(uri, **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queries = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('SELECT') and TABLE in query['sql']]
+        self.assertTrue(queries, f'{uri} did not query {TABLE}')
+        for sql in queries:
+            self.assertEqual(get_plan_problems(sql), [], sql)
+        return response
+
+    def test_story_list_plans(self):
+        self.assertIndexedPlans('/story/')
+        self.assertIndexedPlans('/story/?page=2')
+        response = self.assertIndexedPlans('/story/?cursor=')
+        self.assertIndexedPlans(response.json()['next'])
+
+    def test_story_curation_plans(self):
+        self.assertIndexedPlans('/story/main/')
+        self.assertIndexedPlans('/story/trending/')
+
+    def test_user_story_plans(self):
+        self.assertIndexedPlans(f'/user/{self.user.id}/story/')
+        self.assertIndexedPlans('/user/me/story/?public=true', HTTP_AUTHORIZATION=self.user_token)
+        self.assertIndexedPlans('/user/me/story/?public=false', HTTP_AUTHORIZATION=self.user_token)
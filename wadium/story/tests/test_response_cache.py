@@ -0,0 +1,66 @@
+from django.test import TestCase, Client
+from wadium.cache import clear_all
+from rest_framework.authtoken.models import Token
+from rest_framework import status
+import json
+
+from story.models import Story
+from user.models import UserProfile
+
+
+class ResponseCacheTestCase(TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.user_token = 'Token ' + Token.objects.create(user=self.user).key
+        self.story = Story.objects.create(writer=self.user, title='Hello')
+        self.client.post(f'/story/{self.story.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+
+    def test_retrieve_cached(self):
+        uri = f'/story/{self.story.id}/'
+        response = self.client.get(uri)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(uri)
+        self.assertEqual(cached_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached_response['Content-Type'], 'application/json')
+        self.assertEqual(cached_response.content, response.content)
+
+    def test_retrieve_cache_invalidated(self):
+        uri = f'/story/{self.story.id}/'
+        self.client.get(uri)
+        self.client.put(uri, json.dumps({'title': 'Edited'}),
+                        content_type='application/json', HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual(self.client.get(uri).json()['title'], 'Edited')
+
+        with self.subTest(msg='unpublish'):
+            self.client.post(f'/story/{self.story.id}/publish/', HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(self.client.get(uri).status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(self.client.get(uri, HTTP_AUTHORIZATION=self.user_token).status_code,
+                             status.HTTP_200_OK)
+
+        with self.subTest(msg='delete'):
+            self.client.delete(uri, HTTP_AUTHORIZATION=self.user_token)
+            self.assertEqual(self.client.get(uri).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_bytes_match_rendering(self):
+        Story.objects.create(writer=self.user, title='Curated', published=True, main_order=1, trending_order=1)
+        for uri in ('/story/', '/story/main/', '/story/trending/', f'/story/{self.story.id}/'):
+            with self.subTest(uri=uri):
+                response = self.client.get(uri)
+                cached_response = self.client.get(uri)
+                indented_response = self.client.get(uri, HTTP_ACCEPT='application/json; indent=4')
+                self.assertEqual(cached_response.content, response.content)
+                self.assertEqual(json.loads(indented_response.content), json.loads(response.content))
+                self.assertIn(b'\n    ', indented_response.content)
+
+    def test_browsable_api(self):
+        self.client.get('/story/')
+        response = self.client.get('/story/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, Client
+from wadium.cache import clear_all
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+import datetime
+
+from story.models import Story
+from story.serializers import SimpleStorySerializer, StoryCardSerializer
+from user.models import UserProfile
+
+
+class StoryCardParityTestCase(TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        writer = UserProfile.create_user('seoyoon', {
+            'name': '문서윤',
+            'email': 'seoyoon@wadium.shop',
+            'profile_image': 'https://wadium.shop/image/',
+        })
+        writer_without_profile = User.objects.create_user('noprofile')
+        published_at = timezone.now().replace(microsecond=123456)
+        Story.objects.create(writer=writer, title='안녕하세요 "wadium"', subtitle='Say <hello>!',
+                             featured_image='https://wadium.shop/image/1', published=True,
+                             published_at=published_at)
+        Story.objects.create(writer=writer, title='Whole second', published=True,
+                             published_at=published_at.replace(microsecond=0))
+        Story.objects.create(writer=writer_without_profile, title='No profile', published=True,
+                             published_at=published_at - datetime.timedelta(days=400))
+        Story.objects.create(writer=writer, title='Draft')
+
+    def assertSameBytes(self, data, expected_data):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(data), renderer.render(expected_data))
+
+    def test_story_card_parity(self):
+        queryset = Story.objects.order_by('id')
+        expected = SimpleStorySerializer(queryset, many=True).data
+        cards = StoryCardSerializer(queryset.values(*StoryCardSerializer.values)).data
+        self.assertEqual(len(cards), 4)
+        for card, expected_card in zip(cards, expected):
+            with self.subTest(title=expected_card['title']):
+                self.assertEqual(list(card), list(expected_card))
+                self.assertEqual(list(card['writer']), list(expected_card['writer']))
+                self.assertSameBytes(card, expected_card)
+
+    def test_story_list_parity(self):
+        data = self.client.get('/story/').json()
+        expected = SimpleStorySerializer(Story.objects.filter(published=True).order_by('-published_at'),
+                                         many=True).data
+        self.assertSameBytes(data['stories'], expected)
+
+    def test_story_main_parity(self):
+        for order, story in enumerate(Story.objects.filter(published=True).order_by('id'), start=1):
+            Story.objects.filter(id=story.id).update(main_order=order, trending_order=order)
+        expected = SimpleStorySerializer(Story.objects.filter(published=True).order_by('main_order'), many=True).data
+        for uri in ('/story/main/', '/story/trending/'):
+            with self.subTest(uri=uri):
+                clear_all()
+                self.assertSameBytes(self.client.get(uri).json(), expected)
@@ -0,0 +1,113 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from wadium.cache import clear_all, get_redis
+from rest_framework.authtoken.models import Token
+
+from story.models import Story, StoryRead
+from story.reads import STORY_READ_PENDING_KEY, flush_story_reads, record_story_read
+from user.models import UserProfile
+
+
+class StoryReadTestCase(TestCase):
+    """
+    Reads buffered in Redis (the django_redis cache, as in CI) and flushed to StoryRead.
+    """
+    client = Client()
+
+    def setUp(self):
+        if get_redis() is None:
+            self.skipTest('Needs the django_redis cache.')
+        clear_all()
+        flush_story_reads()
+        self.writer = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.reader = UserProfile.create_user('jiwon', {
+            'name': 'Jiwon Kim',
+            'email': 'jiwon@wadium.shop',
+        })
+        self.reader_token = 'Token ' + Token.objects.create(user=self.reader).key
+        self.story = Story.objects.create(writer=self.writer, title='Hello', published=True)
+        self.uri = f'/story/{self.story.id}/'
+
+    def test_read_recorded_once_per_window(self):
+        for _ in range(3):
+            self.client.get(self.uri, HTTP_AUTHORIZATION=self.reader_token)
+        self.assertFalse(StoryRead.objects.exists())  # buffered until the flush
+        self.assertEqual(get_redis().hget(cache.make_key(STORY_READ_PENDING_KEY),
+                                          f'c:{self.story.id}:{self.reader.id}'), b'1')
+        self.assertEqual(flush_story_reads(), 1)
+        read = StoryRead.objects.get(story=self.story, user=self.reader)
+        self.assertEqual(read.count, 1)
+        self.assertIsNotNone(read.read_at)
+
+    @override_settings(STORY_READ_DEDUP_WINDOW=0)
+    def test_reads_accumulate(self):
+        for _ in range(3):
+            self.client.get(self.uri, HTTP_AUTHORIZATION=self.reader_token)
+        flush_story_reads()
+        read_at = StoryRead.objects.get().read_at
+        for _ in range(2):
+            self.client.get(self.uri, HTTP_AUTHORIZATION=self.reader_token)
+        out = StringIO()
+        call_command('flush_story_reads', stdout=out)
+        self.assertIn('1 (story, user) pairs', out.getvalue())
+        read = StoryRead.objects.get()
+        self.assertEqual(read.count, 5)
+        self.assertGreaterEqual(read.read_at, read_at)
+
+    def test_reads_not_recorded(self):
+        draft = Story.objects.create(writer=self.reader, title='Draft')
+        self.client.get(self.uri)
+        self.client.get(f'/story/{draft.id}/', HTTP_AUTHORIZATION=self.reader_token)
+        self.assertEqual(flush_story_reads(), 0)
+        self.assertFalse(StoryRead.objects.exists())
+
+    def test_deleted_story_skipped(self):
+        record_story_read(self.story.id, self.reader.id)
+        self.story.delete()
+        self.assertEqual(flush_story_reads(), 0)
+
+    def test_count_does_not_overflow(self):
+        StoryRead.objects.create(story=self.story, user=self.reader, count=2 ** 31, read_at=self.story.created_at)
+        record_story_read(self.story.id, self.reader.id)
+        flush_story_reads()
+        self.assertEqual(StoryRead.objects.get().count, 2 ** 31 + 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class WriteThroughStoryReadTestCase(TestCase):
+    """
+    Without Redis there is no buffer the flush command could reach: reads are written right away.
+    """
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.writer = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.reader = UserProfile.create_user('jiwon', {
+            'name': 'Jiwon Kim',
+            'email': 'jiwon@wadium.shop',
+        })
+        self.reader_token = 'Token ' + Token.objects.create(user=self.reader).key
+        self.story = Story.objects.create(writer=self.writer, title='Hello', published=True)
+        self.uri = f'/story/{self.story.id}/'
+
+    def test_read_written(self):
+        for _ in range(3):
+            self.client.get(self.uri, HTTP_AUTHORIZATION=self.reader_token)
+        self.assertEqual(StoryRead.objects.get(story=self.story, user=self.reader).count, 1)
+        self.assertEqual(flush_story_reads(), 0)
+
+    @override_settings(STORY_READ_DEDUP_WINDOW=0)
+    def test_reads_accumulate(self):
+        for _ in range(3):
+            record_story_read(self.story.id, self.reader.id)
+        self.assertEqual(StoryRead.objects.get().count, 3)
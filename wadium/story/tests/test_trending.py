@@ -0,0 +1,125 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, Client
+from wadium.cache import clear_all
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+import datetime
+
+from story.models import Story, StoryComment, StoryRead
+from story.trending import compute_trending_scores, update_trending
+from user.models import UserProfile
+
+
+class TrendingTestCase(TestCase):
+    client = Client()
+
+    def setUp(self):
+        clear_all()
+        self.now = timezone.now()
+        self.writer = UserProfile.create_user('seoyoon', {
+            'name': 'Seoyoon Moon',
+            'email': 'seoyoon@wadium.shop',
+        })
+        self.readers = [
+            UserProfile.create_user(f'reader{i}', {'name': f'Reader {i}', 'email': f'reader{i}@wadium.shop'})
+            for i in range(8)
+        ]
+        self.stories = [
+            Story.objects.create(writer=self.writer, title=f'Story {i}', published=True, published_at=self.now)
+            for i in range(8)
+        ]
+        # Story i is read by i readers an hour ago, so later stories score higher.
+        for i, story in enumerate(self.stories):
+            for reader in self.readers[:i]:
+                self.read(story, reader, hours=1)
+
+    def read(self, story, reader, hours, count=1):
+        StoryRead.objects.create(story=story, user=reader, count=count,
+                                 read_at=self.now - datetime.timedelta(hours=hours))
+
+    def get_trending_ids(self):
+        return [story['id'] for story in self.client.get('/story/trending/').json()]
+
+    def test_compute_trending_scores(self):
+        story = Story.objects.create(writer=self.writer, title='Scored', published=True)
+        self.read(story, self.readers[0], hours=1)
+        self.read(story, self.readers[1], hours=25)
+        self.read(story, self.readers[2], hours=24 * 30)  # out of the window
+        StoryComment.objects.create(story=story, writer=self.readers[0], body='Comment')
+        draft = Story.objects.create(writer=self.writer, title='Draft')
+        self.read(draft, self.readers[0], hours=1)
+
+        story_ids, scores = compute_trending_scores(self.now)
+        scores = dict(zip(story_ids.tolist(), scores.tolist()))
+        self.assertNotIn(draft.id, scores)
+        self.assertNotIn(self.stories[0].id, scores)
+        log2 = 0.6931471805599453
+        expected = log2 * 0.5 ** (1 / 24) + log2 * 0.5 ** (25 / 24) + 3.0
+        self.assertAlmostEqual(scores[story.id], expected, places=3)
+
+    def test_update_trending(self):
+        self.stories[0].trending_order = 1
+        self.stories[0].save()
+        trending = update_trending(self.now)
+        expected_ids = [story.id for story in reversed(self.stories[2:])]
+        self.assertEqual(sorted(trending, key=trending.get), expected_ids)
+        self.assertEqual(self.get_trending_ids(), expected_ids)
+        self.assertIsNone(Story.objects.get(id=self.stories[0].id).trending_order)
+        self.assertEqual(self.client.get('/story/').json()['count'], 2)
+
+    def test_pinned_story_kept(self):
+        pinned = self.stories[0]
+        pinned.trending_order = 3
+        pinned.trending_pinned = True
+        pinned.save()
+        update_trending(self.now)
+        expected_ids = [story.id for story in reversed(self.stories[3:])]
+        expected_ids.insert(2, pinned.id)
+        self.assertEqual(self.get_trending_ids(), expected_ids)
+
+    def test_few_candidates_keep_occupants(self):
+        picks = [Story.objects.create(writer=self.writer, title=f'Pick {i}', published=True, published_at=self.now,
+                                      trending_order=i + 1) for i in range(3)]
+        StoryRead.objects.exclude(story=self.stories[-1]).delete()
+        update_trending(self.now)
+        self.assertEqual(self.get_trending_ids(), [self.stories[-1].id] + [pick.id for pick in picks])
+
+        with self.subTest(msg='no activity'):
+            StoryRead.objects.all().delete()
+            update_trending(self.now)
+            self.assertEqual(self.get_trending_ids(), [self.stories[-1].id] + [pick.id for pick in picks])
+
+    def test_unpublished_candidate_skipped(self):
+        def compute(now):
+            scores = compute_trending_scores(now)
+            # Unpublished by its writer between the scoring and the update.
+            Story.objects.filter(id=self.stories[-1].id).update(published=False)
+            return scores
+
+        with mock.patch('story.trending.compute_trending_scores', side_effect=compute):
+            trending = update_trending(self.now)
+        expected_ids = [story.id for story in reversed(self.stories[1:-1])]
+        self.assertEqual(sorted(trending, key=trending.get), expected_ids)
+
+    def test_compute_trending_command(self):
+        out = StringIO()
+        call_command('compute_trending', '--dry-run', stdout=out)
+        self.assertEqual(out.getvalue().split()[0], str(self.stories[-1].id))
+        self.assertFalse(Story.objects.filter(trending_order__isnull=False).exists())
+
+        call_command('compute_trending', stdout=StringIO())
+        self.assertEqual(Story.objects.filter(trending_order__isnull=False).count(), 6)
+
+    def test_recorded_reads(self):
+        # From the story view through the read buffer (Redis in CI) to the trending slots.
+        story = Story.objects.create(writer=self.writer, title='Read', published=True, published_at=self.now)
+        for i in range(len(self.readers) + 1):
+            reader = UserProfile.create_user(f'viewer{i}', {'name': f'Viewer {i}', 'email': f'viewer{i}@wadium.shop'})
+            token = Token.objects.create(user=reader)
+            self.client.get(f'/story/{story.id}/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        update_trending()
+        self.assertEqual(StoryRead.objects.filter(story=story).count(), len(self.readers) + 1)
+        self.assertEqual(Story.objects.get(id=story.id).trending_order, 1)
@@ -0,0 +1,124 @@
+import datetime
+import math
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Story, StoryComment, StoryRead
+from .reads import flush_story_reads
+
+TRENDING_SLOTS = tuple(value for value, _ in Story.TRENDING_ORDER_CHOICES)
+
+
+def get_decay(timestamps, now):
+    """
+    Exponential time decay of event timestamps (POSIX seconds), halving every TRENDING_HALF_LIFE_HOURS.
+    """
+    ages = np.maximum(now - timestamps, 0.0)
+    return np.exp(-math.log(2) * ages / (settings.TRENDING_HALF_LIFE_HOURS * 60 * 60))
+
+
+def compute_trending_scores(now=None):
+    """
+    Return (story_ids, scores) arrays with the time-decayed popularity of every published
+    story that was read or commented on within TRENDING_WINDOW_DAYS.
+
+    Every reader adds log(1 + reads) decayed from their latest read; every comment adds
+    TRENDING_COMMENT_WEIGHT decayed from when it was written. Buffered reads are flushed
+    to StoryRead first.
+    """
+    flush_story_reads()
+    if now is None:
+        now = timezone.now()
+    since = now - datetime.timedelta(days=settings.TRENDING_WINDOW_DAYS)
+
+    reads = StoryRead.objects. \
+        filter(story__published=True, read_at__gte=since). \
+        values_list('story_id', 'count', 'read_at')
+    comments = StoryComment.objects. \
+        filter(story__published=True, created_at__gte=since). \
+        values_list('story_id', 'created_at')
+    read_story_ids, read_counts, read_times = zip(*reads) if reads else ((), (), ())
+    comment_story_ids, comment_times = zip(*comments) if comments else ((), ())
+
+    story_ids = np.array(read_story_ids + comment_story_ids, dtype=np.int64)
+    if not len(story_ids):
+        return story_ids, np.zeros(0)
+    timestamps = np.array([t.timestamp() for t in read_times + comment_times], dtype=np.float64)
+    weights = np.concatenate((
+        np.log1p(np.array(read_counts, dtype=np.float64)),
+        np.full(len(comment_story_ids), settings.TRENDING_COMMENT_WEIGHT, dtype=np.float64),
+    ))
+
+    unique_ids, index = np.unique(story_ids, return_inverse=True)
+    scores = np.bincount(index, weights=weights * get_decay(timestamps, now.timestamp()), minlength=len(unique_ids))
+    return unique_ids, scores
+
+
+def rank_stories(story_ids, scores):
+    """
+    Story ids, highest score first; ties go to the newer story.
+    """
+    return [int(story_id) for story_id in story_ids[np.lexsort((-story_ids, -scores))]]
+
+
+def select_trending(candidates, pinned, occupants=()):
+    """
+    Fill the trending slots: pinned stories ({story_id: slot}) keep theirs, the free slots go
+    to the candidates in order, then to the current occupants in slot order, so that slots
+    are not emptied when there are too few candidates. Returns {story_id: slot}.
+    """
+    free_slots = [slot for slot in TRENDING_SLOTS if slot not in pinned.values()]
+    stories = [story_id for story_id in dict.fromkeys(list(candidates) + list(occupants)) if story_id not in pinned]
+    trending = dict(pinned)
+    trending.update(zip(stories, free_slots))
+    return trending
+
+
+def update_trending(now=None):
+    """
+    Recompute the trending stories and swap them into trending_order in one transaction.
+    Candidates are locked and checked to be published before they are given a slot.
+    Stories are saved one by one so that story/signals.py updates the cached counts and
+    list pages; story:trending is rebuilt once, when the transaction commits.
+    Returns the new {story_id: slot}.
+    """
+    fields = ('writer_id', 'published', 'published_at', 'main_order', 'trending_order', 'trending_pinned')
+    ranked = rank_stories(*compute_trending_scores(now))
+    with transaction.atomic():
+        stories = {
+            story.id: story for story in Story.objects.
+            select_for_update().
+            filter(trending_order__isnull=False).
+            only(*fields)
+        }
+        pinned = {story.id: story.trending_order for story in stories.values() if story.trending_pinned}
+        occupants = sorted((story for story in stories.values() if story.published and not story.trending_pinned),
+                           key=lambda story: story.trending_order)
+
+        # Lock the best scoring stories a slot's worth at a time, until the free slots can be filled
+        # with published ones.
+        free = len(TRENDING_SLOTS) - len(pinned)
+        candidates = []
+        for start in range(0, len(ranked), len(TRENDING_SLOTS)):
+            if len(candidates) >= free:
+                break
+            chunk = ranked[start:start + len(TRENDING_SLOTS)]
+            published = {
+                story.id: story for story in Story.objects.
+                select_for_update().
+                filter(id__in=chunk, published=True).
+                only(*fields)
+            }
+            stories.update((story_id, story) for story_id, story in published.items() if story_id not in stories)
+            candidates.extend(story_id for story_id in chunk if story_id in published and story_id not in pinned)
+        trending = select_trending(candidates, pinned, [story.id for story in occupants])
+
+        for story in stories.values():
+            trending_order = trending.get(story.id)
+            if story.trending_order != trending_order:
+                story.trending_order = trending_order
+                story.save(update_fields=['trending_order'])
+    return {story.id: story.trending_order for story in stories.values() if story.trending_order is not None}
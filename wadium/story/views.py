@@ -1,13 +1,30 @@
+import math
+
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.core.cache import cache
 from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.core.cache import cache
+
+from search.index import search_stories
+from search.models import NgramToken
+from search.ngrams import filter_contains
+from wadium.cache import get_or_compute
+from wadium.counts import count_provider
+from wadium.responses import not_modified_response, render_content, rendered_response, set_validators
+from wadium.timing import timed
 
 from .models import Story, StoryComment, StoryRead, StoryTag
-from .serializers import StorySerializer, SimpleStorySerializer, CommentSerializer
-from .paginators import StoryPagination, CommentPagination
+from .serializers import StorySerializer, SimpleStorySerializer, StoryCardSerializer, CommentSerializer
+from .caching import STORY_DETAIL_TIMEOUT, get_story_comments_etag, get_story_detail_key, get_story_list_link_id, \
+    get_story_list_page_id, get_story_list_page_key, get_story_main, get_story_trending, get_story_validators, \
+    invalidate_story_comments, record_story_list_cache_access
+from .signals import STORY_LIST_COUNT, story_comment_count_name
+from .reads import record_story_read
+from .tags import filter_by_tags, get_tag_query, get_tagged_stories
+from .paginators import StoryPagination, CommentPagination, KeysetPagination, StoryCursorPagination, \
+    CommentCursorPagination
 
 
 class StoryViewSet(viewsets.GenericViewSet):
@@ -15,11 +32,12 @@ class StoryViewSet(viewsets.GenericViewSet):
     serializer_class = StorySerializer
     permission_classes = (IsAuthenticated(),)
 
-    cache_story_page1_key = 'story:list-1'
-    cache_story_main_key = 'story:main'
-    cache_story_trending_key = 'story:trending'
-    cache_timeout = 60
-    cache_timeout_long = 600
+    cache_timeout_list = 600
+
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return self.queryset.select_related('writer__userprofile')
+        return super(StoryViewSet, self).get_queryset()
 
     def get_serializer_class(self):
         if self.action in ('list', 'main', 'trending'):
@@ -36,12 +54,26 @@ class StoryViewSet(viewsets.GenericViewSet):
         return self.permission_classes
 
     def get_pagination_class(self):
+        if self.action == 'comment_list' and self.is_cursor_mode:
+            return CommentCursorPagination
         if self.action in ('comment', 'comment_list'):
             return CommentPagination
+        if self.action == 'list' and self.is_cursor_mode:
+            return StoryCursorPagination
         return StoryPagination
 
     pagination_class = property(fget=get_pagination_class)
 
+    @property
+    def is_cursor_mode(self):
+        # /story/?cursor= starts keyset pagination; following pages carry the cursor given in `next`.
+        # /story/{id}/comment/?after={comment_id} polls for comments newer than the given one.
+        query_params = self.request.query_params
+        if self.action == 'list' and 'q' in query_params:
+            return False  # search results are ranked, not ordered by a key
+        return KeysetPagination.cursor_query_param in query_params or \
+            (self.action == 'comment_list' and CommentCursorPagination.after_query_param in query_params)
+
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -58,81 +90,100 @@ class StoryViewSet(viewsets.GenericViewSet):
         return Response(serializer.data)
 
     def retrieve(self, request, pk=None):
+        # Only published stories are cached, so a hit needs no query at all.
+        key = get_story_detail_key(int(pk)) if pk.isdigit() else None
+        rendered = cache.get(key) if key is not None else None
+        if rendered is not None:
+            if request.user.is_authenticated:
+                record_story_read(int(pk), request.user.id)
+            return rendered_response(request, rendered)
+
         story = self.get_object()
-        if story.published or story.writer == request.user:
-            return Response(self.get_serializer(story).data)
-        return Response({'error': "This story is not published yet"}, status=status.HTTP_404_NOT_FOUND)
+        if not story.published:
+            if story.writer == request.user:
+                return Response(self.get_serializer(story).data)
+            return Response({'error': "This story is not published yet"}, status=status.HTTP_404_NOT_FOUND)
+        if request.user.is_authenticated:
+            record_story_read(story.id, request.user.id)
+        etag, last_modified = get_story_validators(story)
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        with timed('serialize'):
+            data = self.get_serializer(story).data
+        rendered = render_content(data, etag, last_modified)
+        if key is not None:
+            cache.set(key, rendered, timeout=STORY_DETAIL_TIMEOUT)
+        return rendered_response(request, rendered)
 
     def list(self, request):
         queryset = self.get_queryset(). \
             filter(published=True). \
             order_by('-published_at'). \
-            defer('body'). \
-            select_related('writer'). \
-            prefetch_related('writer__userprofile')
+            values(*StoryCardSerializer.values)
         is_cacheable = True
         if 'title' in request.query_params:
             title = request.query_params.get('title')
-            queryset = queryset.filter(title__icontains=title)
+            queryset = filter_contains(queryset, NgramToken.STORY_TITLE, 'title', title)
             is_cacheable = False
         if 'tag' in request.query_params:
-            return Response({'error': 'tag query is not implemented'}, status=status.HTTP_501_NOT_IMPLEMENTED)
-            # is_cacheable = False
+            try:
+                tag_ids, tag_mode = get_tag_query(request.query_params)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if tag_ids is None:
+                queryset = queryset.none()
+            else:
+                tagged_stories = None
+                if is_cacheable and not self.is_cursor_mode and 'q' not in request.query_params:
+                    # Page over the Redis tag index: no join over the story table.
+                    tagged_stories = get_tagged_stories(tag_ids, tag_mode, StoryCardSerializer.values)
+                if tagged_stories is not None:
+                    queryset = tagged_stories
+                else:
+                    queryset = filter_by_tags(queryset, tag_ids, tag_mode)
+            is_cacheable = False
+        if 'q' in request.query_params:
+            queryset = search_stories(queryset, request.query_params.get('q'))
+            is_cacheable = False
         if is_cacheable:
             queryset = queryset.filter(main_order=None, trending_order=None)
-        if is_cacheable and request.query_params.get('page', 1) in (1, '1'):
-            cached_data = cache.get(self.cache_story_page1_key)
-            if cached_data is None:
-                page = self.paginate_queryset(queryset)
-                assert page is not None
-                serializer = self.get_serializer(page, many=True)
-                response = self.get_paginated_response(serializer.data)
-                data = response.data
-                cache.set(self.cache_story_page1_key, data, timeout=self.cache_timeout)
-                return response
-            else:
-                data = cached_data
-                return Response(data)
+            self.paginator.count_name = STORY_LIST_COUNT
+        computed = False
 
-        page = self.paginate_queryset(queryset)
-        assert page is not None
-        serializer = self.get_serializer(page, many=True)
+        def render_page():
+            nonlocal computed
+            computed = True
+            page = self.paginate_queryset(queryset)
+            assert page is not None
+            serializer = StoryCardSerializer(page)
+            return render_content(self.paginator.get_paginated_data(serializer.data))
 
-        return self.get_paginated_response(serializer.data)
+        if not is_cacheable:
+            return rendered_response(request, render_page())
+
+        def get_last_page():
+            count, _ = count_provider.get(queryset, STORY_LIST_COUNT)
+            return max(math.ceil(count / self.paginator.page_size), 1)
+
+        link_id = get_story_list_link_id(request)
+        page_id = get_story_list_page_id(request.query_params, get_last_page) if link_id is not None else None
+        if page_id is None:
+            return rendered_response(request, render_page())
+        # Every page is cached under the current list generation, which signals bump
+        # whenever a published story changes.
+        rendered = get_or_compute(get_story_list_page_key(page_id, link_id), render_page,
+                                  timeout=self.cache_timeout_list, local=page_id == 'page-1')
+        record_story_list_cache_access(page_id, hit=not computed)
+        return rendered_response(request, rendered)
 
     @action(methods=['GET'], detail=False)
     def main(self, request):
-        cached_data = cache.get(self.cache_story_main_key)
-        if cached_data is None:
-            queryset = self.get_queryset(). \
-                filter(published=True). \
-                filter(main_order__gte=1, main_order__lte=5). \
-                order_by('main_order'). \
-                defer('body'). \
-                select_related('writer'). \
-                prefetch_related('writer__userprofile')
-            data = self.get_serializer(queryset, many=True).data
-            cache.set(self.cache_story_main_key, data, timeout=self.cache_timeout_long)
-        else:
-            data = cached_data
-        return Response(data)
+        return rendered_response(request, get_story_main())
 
     @action(methods=['GET'], detail=False)
     def trending(self, request):
-        cached_data = cache.get(self.cache_story_trending_key)
-        if cached_data is None:
-            queryset = self.get_queryset(). \
-                filter(published=True). \
-                filter(trending_order__gte=1, trending_order__lte=6). \
-                order_by('trending_order'). \
-                defer('body'). \
-                select_related('writer'). \
-                prefetch_related('writer__userprofile')
-            data = self.get_serializer(queryset, many=True).data
-            cache.set(self.cache_story_trending_key, data, timeout=self.cache_timeout_long)
-        else:
-            data = cached_data
-        return Response(data)
+        return rendered_response(request, get_story_trending())
 
     @action(methods=['POST'], detail=True)
     def publish(self, request, pk=None):
@@ -188,6 +239,8 @@ class StoryViewSet(viewsets.GenericViewSet):
 
             elif request.method == 'DELETE':
                 comment.delete()
+                count_provider.incr(story_comment_count_name(story.id), -1)
+                invalidate_story_comments(story.id)
                 return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -201,8 +254,14 @@ class StoryViewSet(viewsets.GenericViewSet):
             order_by('created_at'). \
             select_related('writer'). \
             select_related('writer__userprofile')
-            
+
+        etag = get_story_comments_etag(story.id, request.query_params)
+        response = not_modified_response(request, etag)
+        if response is not None:
+            return response
+        self.paginator.count_name = story_comment_count_name(story.id)
         page = self.paginate_queryset(queryset)
         assert page is not None
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
\ No newline at end of file
+        with timed('serialize'):
+            data = self.get_serializer(page, many=True).data
+        return set_validators(request, self.get_paginated_response(data), etag)
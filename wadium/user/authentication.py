@@ -0,0 +1,110 @@
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.contrib.auth import login
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from wadium.cache import delete_value, get_or_compute
+
+TOKEN_USER_KEY = 'auth:token:{digest}'
+TOKEN_GENERATION_KEY = 'auth:token:{digest}:generation'
+
+# User fields kept in the cache, in model order as Model.from_db() expects them; the others
+# are deferred and loaded on first access.
+USER_SNAPSHOT_FIELDS = ('id', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff',
+                        'is_active')
+
+
+def token_digest(key):
+    # Tokens are credentials: the cache only sees their digest.
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def token_user_key(key):
+    return TOKEN_USER_KEY.format(digest=token_digest(key))
+
+
+def token_generation_key(key):
+    return TOKEN_GENERATION_KEY.format(digest=token_digest(key))
+
+
+def bump_token_generation(key):
+    # Random rather than incremented, so that an evicted generation never comes back. It outlives
+    # every snapshot taken under it.
+    cache.set(token_generation_key(key), secrets.token_hex(8), timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT * 2)
+    delete_value(token_user_key(key), local=True)
+
+
+def invalidate_token(key):
+    """
+    Drop the snapshot of the token, now and again once the current transaction commits, so that
+    a snapshot of pre-commit data is never served under the new generation.
+    """
+    bump_token_generation(key)
+    transaction.on_commit(lambda: bump_token_generation(key))
+
+
+class TokenInvalidated(Exception):
+    pass
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps a snapshot of the token's user in the cache (L1 and Redis)
+    for AUTH_TOKEN_CACHE_TIMEOUT seconds, instead of joining Token and User on every request.
+    The entry is dropped on logout, when the token is deleted and when the user is saved.
+    """
+
+    def authenticate_credentials(self, key):
+        generation_key = token_generation_key(key)
+
+        def load_user():
+            try:
+                token = self.get_model().objects.select_related('user').get(key=key)
+            except self.get_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            return tuple(getattr(token.user, field) for field in USER_SNAPSHOT_FIELDS)
+
+        def load():
+            generation = cache.get(generation_key)
+            snapshot = load_user()
+            if cache.get(generation_key) != generation:
+                raise TokenInvalidated  # while loading: the snapshot may predate the change
+            return generation, snapshot
+
+        # Snapshots are tagged with the token generation, so that one stored by a request that
+        # raced invalidate_token() is never served.
+        try:
+            generation, snapshot = get_or_compute(token_user_key(key), load, settings.AUTH_TOKEN_CACHE_TIMEOUT,
+                                                  stale_timeout=0, local=True)
+        except TokenInvalidated:
+            generation, snapshot = None, None
+        if snapshot is None or cache.get(generation_key) != generation:
+            delete_value(token_user_key(key), local=True)
+            snapshot = load_user()
+        user = User.from_db(router.db_for_read(User), USER_SNAPSHOT_FIELDS, snapshot)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        token = self.get_model().from_db(router.db_for_read(self.get_model()), ('key', 'user_id'), (key, user.id))
+        token.user = user
+        return user, token
+
+
+def login_user(request, user):
+    """
+    Log in a user who authenticated through the API. With TOKEN_ONLY_LOGIN, clients use the
+    DRF token only: no session is created, but user_logged_in is still sent (it updates last_login).
+    """
+    if not settings.TOKEN_ONLY_LOGIN:
+        login(request, user)
+        return
+    user_logged_in.send(sender=user.__class__, request=request, user=user)
+    request.user = user
@@ -1,62 +1,144 @@
-from mailjet_rest import Client
+import threading
+from abc import ABC, abstractmethod
+from email.utils import parsedate_to_datetime
+
+import requests
 from django.conf import settings
-from datetime import datetime
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
 
-mailjet = Client(auth=(settings.MAILJET_API_KEY, settings.MAILJET_API_SECRET), version='v3.1')
+SIGNUP_TEMPLATE_ID = 2118400
+LOGIN_TEMPLATE_ID = 2118280
 
 
-def send_access_token(email, signup=False, token=None):
+def build_message(email, signup, token):
+    """
+    One entry of the `Messages` array of the Mailjet v3.1 send API.
+    """
     if signup:
-        data = {
-            'Messages': [
-                {
-                    "From": {
-                        "Email": "noreply@wadium.shop",
-                        "Name": "Wadium"
-                    },
-                    "To": [
-                        {
-                            "Email": email,
-                            "Name": ""
-                        }
-                    ],
-                    "TemplateID": 2118400,  # 2118400 for signup, 2118280 for signin
-                    "TemplateLanguage": True,
-                    "Subject": "Finish creating your account on Wadium",
-                    "Variables": {
-                        "callback_uri": f"https://www.wadium.shop/callback/email?token={token}&operation=register"
-                    }
-                }
-            ]
-        }
+        template_id, subject, operation = SIGNUP_TEMPLATE_ID, 'Finish creating your account on Wadium', 'register'
     else:  # login
-        data = {
-            'Messages': [
-                {
-                    "From": {
-                        "Email": "noreply@wadium.shop",
-                        "Name": "Wadium"
-                    },
-                    "To": [
-                        {
-                            "Email": email,
-                            "Name": ""
-                        }
-                    ],
-                    "TemplateID": 2118280,  # 2118400 for signup, 2118280 for signin
-                    "TemplateLanguage": True,
-                    "Subject": "Sign in to Wadium",
-                    "Variables": {
-                        "callback_uri": f"https://www.wadium.shop/callback/email?token={token}&operation=login"
-                    }
-                }
-            ]
+        template_id, subject, operation = LOGIN_TEMPLATE_ID, 'Sign in to Wadium', 'login'
+    return {
+        "From": {
+            "Email": "noreply@wadium.shop",
+            "Name": "Wadium"
+        },
+        "To": [
+            {
+                "Email": email,
+                "Name": ""
+            }
+        ],
+        "TemplateID": template_id,
+        "TemplateLanguage": True,
+        "Subject": subject,
+        "Variables": {
+            "callback_uri": f"https://www.wadium.shop/callback/email?token={token}&operation={operation}"
         }
-    result = mailjet.send.create(data=data)
-    try:
-        if result.json()['Messages'][0]['Status'] == 'success':
-            time = datetime.strptime(result.headers['date'], '%a, %d %b %Y %H:%M:%S %Z')
-            return True, time
-    except KeyError:
-        pass
-    return False, None
+    }
+
+
+class Transport(ABC):
+    @abstractmethod
+    def send(self, email, signup, token):
+        """
+        Returns (sent, sent_at).
+        """
+
+    def send_many(self, messages):
+        """
+        Send (email, signup, token) messages. Returns a (sent, sent_at, error) result per message, in order.
+        """
+        results = []
+        for email, signup, token in messages:
+            try:
+                sent, sent_at = self.send(email, signup, token)
+                results.append((sent, sent_at, '' if sent else 'Not accepted by the mail provider'))
+            except Exception as e:  # a network error must not stop the other emails
+                results.append((False, None, repr(e)[:300]))
+        return results
+
+
+class MailjetTransport(Transport):
+    """
+    Sends up to `batch_size` messages per call to the Mailjet send API, over a keep-alive
+    session shared by the transports of the process.
+    """
+    batch_size = 50  # the most messages Mailjet accepts per call
+    _session = None
+    _session_lock = threading.Lock()
+
+    @classmethod
+    def get_session(cls):
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                session.auth = (settings.MAILJET_API_KEY, settings.MAILJET_API_SECRET)
+                # Failed sends are retried by the outbox, not by the adapter.
+                session.mount('https://', HTTPAdapter(pool_maxsize=4, max_retries=0))
+                session.mount('http://', HTTPAdapter(pool_maxsize=4, max_retries=0))
+                cls._session = session
+            return cls._session
+
+    def send(self, email, signup, token):
+        sent, sent_at, error = self.send_many([(email, signup, token)])[0]
+        return sent, sent_at
+
+    def send_many(self, messages):
+        results = []
+        for i in range(0, len(messages), self.batch_size):
+            results.extend(self.send_batch(messages[i:i + self.batch_size]))
+        return results
+
+    def send_batch(self, messages):
+        try:
+            response = self.get_session().post(
+                settings.MAILJET_API_URL,
+                json={'Messages': [build_message(*message) for message in messages]},
+                timeout=settings.MAILJET_TIMEOUT,
+            )
+        except requests.RequestException as e:
+            return [(False, None, repr(e)[:300])] * len(messages)
+        try:
+            statuses = response.json().get('Messages') or []
+        except (ValueError, AttributeError):
+            statuses = []
+        if len(statuses) != len(messages):
+            return [(False, None, f'HTTP {response.status_code}')] * len(messages)
+
+        try:
+            sent_at = parsedate_to_datetime(response.headers['Date'])
+        except (KeyError, TypeError, ValueError):
+            sent_at = timezone.now()
+        results = []
+        for message_status in statuses:
+            if message_status.get('Status') == 'success':
+                results.append((True, sent_at, ''))
+            else:
+                errors = message_status.get('Errors') or [{}]
+                error = errors[0].get('ErrorMessage') or f'HTTP {response.status_code}'
+                results.append((False, None, error[:300]))
+        return results
+
+
+class LocalTransport(Transport):
+    """
+    Keeps the emails it is given in `messages` instead of sending them, for tests and local
+    development. Set `fail` to make every send fail.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.fail = False
+
+    def send(self, email, signup, token):
+        if self.fail:
+            return False, None
+        self.messages.append((email, signup, token))
+        return True, timezone.now()
+
+
+def get_transport():
+    return import_string(settings.EMAIL_TRANSPORT)()
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.outbox import send_emails
+
+
+class Command(BaseCommand):
+    help = 'Send the queued emails of the outbox. Run it from cron, or keep it running with --interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Send every INTERVAL seconds until interrupted.')
+        parser.add_argument('--limit', type=int, default=50, help='Emails taken at a time.')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            sent, failed = send_emails(options['limit'])
+            if options['verbosity'] >= 1 and (sent or failed or interval is None):
+                self.stdout.write(f'Sent {sent} emails, {failed} failed.')
+            if interval is None:
+                return
+            if sent + failed < options['limit']:
+                time.sleep(interval)
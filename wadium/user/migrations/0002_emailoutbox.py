@@ -0,0 +1,35 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import user.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(default=user.models.generate_outbox_key, max_length=32, unique=True)),
+                ('signup', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('sent', 'sent'), ('failed', 'failed')], default='pending', max_length=7)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(null=True)),
+                ('last_error', models.CharField(blank=True, max_length=300)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('email_auth', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='user.emailauth')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='emailoutbox',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='user_emailo_status_576558_idx'),
+        ),
+    ]
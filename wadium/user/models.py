@@ -1,14 +1,36 @@
+import itertools
+
+from django.core.cache import cache
 from django.db import models, transaction
+from django.db.models import Prefetch
 from django.db.utils import IntegrityError
 from django.contrib.auth.models import User
 import secrets
 from django.utils import timezone
 from rest_framework.serializers import ValidationError
 from rest_framework.exceptions import AuthenticationFailed
-from .email_backend import send_access_token
 from rest_framework import status
 
 
+USERNAME_HINT_KEY = 'username:next:{basename}'
+USERNAME_HINT_TIMEOUT = 60 * 60 * 24
+USERNAME_RESERVATION_KEY = 'username:reserved:{username}'
+USERNAME_RESERVATION_TIMEOUT = 60
+USERNAME_PROBE_SIZE = 16
+USERNAME_PROBE_MAX_SIZE = 1000
+
+
+def numbered_usernames(basename, start):
+    """
+    Batches of `basename` followed by a number from `start` on, each batch twice as large as the previous one.
+    """
+    size = USERNAME_PROBE_SIZE
+    while True:
+        yield [basename + str(n) for n in range(start, start + size)]
+        start += size
+        size = min(size * 2, USERNAME_PROBE_MAX_SIZE)
+
+
 class EmailAddress(models.Model):
     email = models.EmailField(primary_key=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='emails', null=True)
@@ -49,13 +71,16 @@ class EmailAuth(models.Model):
         return self.expires_at <= timezone.now()
 
     def send(self, signup=False):
-        sent, at = send_access_token(self.email_address.email, signup, self.token)
-        if sent:
-            self.is_email_token = True
-            self.expires_at = timezone.now() + timezone.timedelta(hours=2)
-            self.valid = True
-            self.save()
-        return sent
+        """
+        Queue the email with the token; `manage.py send_emails` sends it (user/outbox.py).
+        """
+        return EmailOutbox.objects.create(email_auth=self, signup=signup)
+
+    def sent(self, at):
+        self.is_email_token = True
+        self.expires_at = at + timezone.timedelta(hours=2)
+        self.valid = True
+        self.save()
 
     def is_valid(self, must_be_email=True):
         if not self.valid:
@@ -80,6 +105,47 @@ class EmailAuth(models.Model):
             return True
 
 
+def generate_outbox_key():
+    return secrets.token_hex(16)
+
+
+class EmailOutbox(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'pending'),
+        (SENT, 'sent'),
+        (FAILED, 'failed'),
+    ]
+    # Public id the client polls the status with.
+    key = models.CharField(max_length=32, unique=True, default=generate_outbox_key)
+    email_auth = models.ForeignKey(EmailAuth, related_name='outbox', on_delete=models.CASCADE)
+    signup = models.BooleanField(default=False)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When a pending email is due: its first try, its next retry, or the end of a worker's claim on it.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True)
+    last_error = models.CharField(max_length=300, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'])
+        ]
+
+
+class UserProfileQuerySet(models.QuerySet):
+    def with_email(self):
+        """
+        Load the user and primary email of every profile along with it, in two queries in total.
+        """
+        primary_emails = Prefetch('user__emails', queryset=EmailAddress.objects.filter(primary=True),
+                                  to_attr='primary_emails')
+        return self.select_related('user').prefetch_related(primary_emails)
+
+
 class UserProfile(models.Model):
     TEST_PW = 'test'
     NORMAL_PW = 'none'
@@ -90,13 +156,20 @@ class UserProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UserProfileQuerySet.as_manager()
+
     @property
     def email_address(self):
-        return self.user.emails.get(primary=True)
+        primary_emails = getattr(self.user, 'primary_emails', None)  # UserProfileQuerySet.with_email()
+        if primary_emails is None:
+            return self.user.emails.get(primary=True)
+        if not primary_emails:
+            raise EmailAddress.DoesNotExist('EmailAddress matching query does not exist.')
+        return primary_emails[0]
 
     @property
     def email(self):
-        return self.user.emails.get(primary=True).email
+        return self.email_address.email
 
     @classmethod
     @transaction.atomic
@@ -128,15 +201,45 @@ class UserProfile(models.Model):
         return user
 
     @classmethod
-    def get_unique_username(cls, email):
+    def get_unique_username(cls, email, reserve=False):
+        """
+        The local part of the email, or the local part followed by the smallest number that is
+        not a username yet. Candidates are probed in growing batches on the username index,
+        starting from the number found free last time for the same local part.
+        With `reserve`, the username is held for USERNAME_RESERVATION_TIMEOUT seconds so that
+        concurrent signups are given different ones.
+        """
         basename = email[:email.index('@')]
-        similar_names = {u.username for u in User.objects.filter(username__startswith=basename)}
-        if basename not in similar_names:
-            return basename
-        postfixes = {n[len(basename):] for n in similar_names}
-        for postfix in map(str, range(len(postfixes) + 1)):
-            if postfix not in postfixes:
-                return basename + postfix
+        hint_key = USERNAME_HINT_KEY.format(basename=basename)
+        batches = itertools.chain([[basename]], numbered_usernames(basename, cache.get(hint_key, 0)))
+        for batch in batches:
+            # Compared case-insensitively: with MySQL's _ci collation the probe matches 'Kim' for 'kim',
+            # and inserting 'kim' would collide with it.
+            probed = User.objects.filter(username__in=batch).values_list('username', flat=True)
+            taken = {username.lower() for username in probed}
+            for username in batch:
+                if username.lower() in taken:
+                    continue
+                if reserve and not cache.add(USERNAME_RESERVATION_KEY.format(username=username.lower()), True,
+                                             timeout=USERNAME_RESERVATION_TIMEOUT):
+                    continue
+                if username != basename:
+                    cache.set(hint_key, int(username[len(basename):]), timeout=USERNAME_HINT_TIMEOUT)
+                return username
+
+    @classmethod
+    def create_user_with_unique_username(cls, userprofile, attempts=3):
+        """
+        Create a user named after the email of `userprofile`, retrying with another username
+        if a concurrent signup took it first.
+        """
+        for attempt in range(attempts):
+            username = cls.get_unique_username(userprofile['email'], reserve=True)
+            try:
+                return cls.create_user(username, userprofile)
+            except ValidationError as e:
+                if 'username' not in e.detail or attempt == attempts - 1:
+                    raise
 
 
 class UserSocial(models.Model):
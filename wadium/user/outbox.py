@@ -0,0 +1,66 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .email_backend import get_transport
+from .models import EmailOutbox
+
+
+def get_retry_delay(attempts):
+    """
+    Seconds to wait after the given number of failed attempts: EMAIL_OUTBOX_RETRY_DELAY, doubling every time.
+    """
+    return settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def claim_emails(limit, now):
+    """
+    Take up to `limit` due emails for this worker: they are not due again until
+    EMAIL_OUTBOX_CLAIM_TIMEOUT has passed, so that another worker would only retry them
+    if this one died while sending.
+    """
+    with transaction.atomic():
+        emails = list(EmailOutbox.objects.
+                      select_for_update(skip_locked=True, of=('self',)).
+                      filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now).
+                      select_related('email_auth__email_address').
+                      order_by('next_attempt_at')[:limit])
+        EmailOutbox.objects. \
+            filter(id__in=[email.id for email in emails]). \
+            update(next_attempt_at=now + datetime.timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT))
+    return emails
+
+
+def record_result(email, sent, sent_at, error='', now=None):
+    email.attempts += 1
+    if sent:
+        email.status = EmailOutbox.SENT
+        email.sent_at = sent_at or timezone.now()
+        email.last_error = ''
+        email.email_auth.sent(email.sent_at)
+    elif email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = EmailOutbox.FAILED
+        email.last_error = error
+    else:
+        email.next_attempt_at = (now or timezone.now()) + datetime.timedelta(seconds=get_retry_delay(email.attempts))
+        email.last_error = error
+    email.save(update_fields=['attempts', 'status', 'sent_at', 'next_attempt_at', 'last_error'])
+
+
+def send_emails(limit=50, now=None):
+    """
+    Send the due emails of the outbox, as one batch of the transport. Returns (sent, failed) counts.
+    """
+    now = now or timezone.now()
+    emails = claim_emails(limit, now)
+    if not emails:
+        return 0, 0
+    results = get_transport().send_many([
+        (email.email_auth.email_address.email, email.signup, email.email_auth.token) for email in emails
+    ])
+    for email, (sent, sent_at, error) in zip(emails, results):
+        record_result(email, sent, sent_at, error, now)
+    sent = sum(result[0] for result in results)
+    return sent, len(emails) - sent
@@ -1,8 +1,10 @@
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+from wadium.counts import CountedPaginationMixin
 
-class UserPagination(PageNumberPagination):
+
+class UserPagination(CountedPaginationMixin, PageNumberPagination):
     page_size = 5
 
     def get_paginated_response(self, data):
@@ -11,6 +13,7 @@ class UserPagination(PageNumberPagination):
     def get_paginated_data(self, data):
         return {
             'count': self.page.paginator.count,
+            'count_exact': self.page.paginator.count_exact,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'users': data
@@ -1,13 +1,31 @@
+import io
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import mock
 
-from django.test import SimpleTestCase, TestCase
-from .models import EmailAuth, generate_token, EmailAddress, UserProfile
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from .models import EmailAuth, EmailOutbox, generate_token, EmailAddress, UserProfile
 from django.contrib.auth.models import User
 from django.utils import timezone
 import datetime
 from rest_framework.authtoken.models import Token
 from rest_framework import status
-from .email_backend import send_access_token
+from rest_framework.serializers import ValidationError
+from .authentication import invalidate_token, token_user_key
+from .email_backend import LocalTransport, MailjetTransport, get_transport
+from .outbox import send_emails
+from story.models import Story
+from wadium.cache import clear_all
+from wadium.testing import QueryBudgetMixin
 
 
 class EmailAuthTestCase(SimpleTestCase):
@@ -453,11 +471,12 @@ class UserLogoutTestCase(TestCase):
         self.assertEqual(len(response.content), 0)
 
 
+@override_settings(EMAIL_TRANSPORT='user.email_backend.LocalTransport')
 class UserSignupEmailInitTestCase(TestCase):
     URI = '/user/'
     email = 'test@example.com'
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_email_init_success(self, MockSend):
         MockSend.return_value = True, timezone.now()
         response = self.client.post(
@@ -469,14 +488,15 @@ class UserSignupEmailInitTestCase(TestCase):
             },
             format='json'
         )
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(send_emails(), (1, 0))
         token = EmailAuth.objects.filter(email_address__email=self.email).first().token
         try:
             MockSend.assert_called_once_with(self.email, True, token)
         except AssertionError as e:
             self.fail(e)
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_email_init_quota_exceeded(self, MockSend):
         MockSend.return_value = False, None
         response = self.client.post(
@@ -488,14 +508,16 @@ class UserSignupEmailInitTestCase(TestCase):
             },
             format='json'
         )
-        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(send_emails(), (0, 1))
+        self.assertEqual(EmailOutbox.objects.get(key=response.json()['id']).status, EmailOutbox.PENDING)
         token = EmailAuth.objects.filter(email_address__email=self.email).first().token
         try:
             MockSend.assert_called_once_with(self.email, True, token)
         except AssertionError as e:
             self.fail(e)
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_email_init_required_field(self, MockSend):
         payload = {
             'auth_type': 'EMAIL',
@@ -527,7 +549,7 @@ class UserSignupEmailInitTestCase(TestCase):
         except AssertionError as e:
             self.fail(e)
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_email_init_invalid_email(self, MockSend):
         invalid_payload = {
             'auth_type': 'EMAIL',
@@ -545,7 +567,7 @@ class UserSignupEmailInitTestCase(TestCase):
         except AssertionError as e:
             self.fail(e)
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_email_init_duplicate_email(self, MockSend):
         MockSend.return_value = True, timezone.now()
         user = UserProfile.create_user('other-username', {
@@ -561,7 +583,8 @@ class UserSignupEmailInitTestCase(TestCase):
             },
             format='json'
         )
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(send_emails(), (1, 0))
         email_auth = EmailAuth.objects.filter(email_address__email=self.email).first()
         token = email_auth.token
         try:
@@ -572,6 +595,7 @@ class UserSignupEmailInitTestCase(TestCase):
         self.assertTrue(email_auth.is_email_token)
 
 
+@override_settings(EMAIL_TRANSPORT='user.email_backend.LocalTransport')
 class UserSignupEmailCheckTestCase(TestCase):
     URI = '/user/'
     email = 'test@example.com'
@@ -582,7 +606,7 @@ class UserSignupEmailCheckTestCase(TestCase):
         'email': email
     }
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def setUp(self, MockSend):
         def mock_send_token(email, signup=False, token=None):
             assert email == self.email
@@ -595,7 +619,8 @@ class UserSignupEmailCheckTestCase(TestCase):
             self.init_payload,
             format='json'
         )
-        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        send_emails()
         MockSend.assert_called_once()
 
     def test_user_signup_email_check_success(self):
@@ -786,7 +811,8 @@ class UserSignupEmailCheckTestCase(TestCase):
         self.assertEqual(data, expected_data)
 
     def test_user_get_unique_username(self):
-        existing_usernames = ('test', 'test1', 'test3', 'test10', 'test1000', 'othertest', 'TEST0')
+        clear_all()
+        existing_usernames = ('test', 'test1', 'test3', 'test10', 'test1000', 'othertest')
         for username in existing_usernames:
             UserProfile.create_user(username, {
                 'name': username,
@@ -798,7 +824,6 @@ class UserSignupEmailCheckTestCase(TestCase):
             'test1': 'test11',
             'test10': 'test100',
             'other': 'other',
-            'TEST': 'TEST'
         }
         for username, result in expected_returns.items():
             with self.subTest(username=username, expected=result):
@@ -808,6 +833,55 @@ class UserSignupEmailCheckTestCase(TestCase):
                 )
 
 
+class UniqueUsernameTestCase(TestCase):
+    def setUp(self):
+        clear_all()
+        User.objects.bulk_create([User(username='kim')] + [User(username=f'kim{i}') for i in range(100)])
+
+    def test_probes(self):
+        # The exact name, then batches of 16, 32 and 64 numbered names.
+        with self.assertNumQueries(4):
+            self.assertEqual(UserProfile.get_unique_username('kim@example.com'), 'kim100')
+        User.objects.create(username='kim100')
+        # The next call starts from where the last one found a free name.
+        with self.assertNumQueries(2):
+            self.assertEqual(UserProfile.get_unique_username('kim@example.com'), 'kim101')
+
+    def test_free_basename(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(UserProfile.get_unique_username('lee@example.com'), 'lee')
+
+    def test_case_insensitive_collation(self):
+        # What the probe returns for 'lee' and 'lee0'...'lee15' under MySQL's _ci collation.
+        def probe(username__in):
+            taken = [name for name in ('Lee', 'LEE0') if name.lower() in username__in]
+            return mock.Mock(values_list=mock.Mock(return_value=taken))
+
+        with mock.patch.object(User.objects, 'filter', side_effect=probe):
+            self.assertEqual(UserProfile.get_unique_username('lee@example.com'), 'lee1')
+
+    def test_reserve(self):
+        usernames = [UserProfile.get_unique_username('kim@example.com', reserve=True) for _ in range(3)]
+        self.assertEqual(usernames, ['kim100', 'kim101', 'kim102'])
+        self.assertEqual(UserProfile.get_unique_username('lee@example.com', reserve=True), 'lee')
+        self.assertEqual(UserProfile.get_unique_username('lee@example.com', reserve=True), 'lee0')
+
+    def test_create_retries(self):
+        # A concurrent signup takes the name between the probe and the insert.
+        with mock.patch.object(UserProfile, 'get_unique_username', side_effect=['kim5', 'kim100']):
+            user = UserProfile.create_user_with_unique_username({'email': 'kim@example.com', 'name': 'Kim'})
+        self.assertEqual(user.username, 'kim100')
+        self.assertEqual(user.userprofile.name, 'Kim')
+
+    def test_create_duplicate_email(self):
+        UserProfile.create_user('lee', {'email': 'lee@example.com', 'name': 'Lee'})
+        with mock.patch.object(UserProfile, 'get_unique_username', wraps=UserProfile.get_unique_username) as probe:
+            with self.assertRaises(ValidationError):
+                UserProfile.create_user_with_unique_username({'email': 'lee@example.com', 'name': 'Lee'})
+        probe.assert_called_once()
+
+
+@override_settings(EMAIL_TRANSPORT='user.email_backend.LocalTransport')
 class UserSignupEmailCreateTestCase(TestCase):
     URI = '/user/'
     email = 'test@example.com'
@@ -827,7 +901,7 @@ class UserSignupEmailCreateTestCase(TestCase):
         'username': username,
     }
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def setUp(self, MockSend):
         def mock_send_token(email, signup=False, token=None):
             assert email == self.email
@@ -840,7 +914,8 @@ class UserSignupEmailCreateTestCase(TestCase):
             self.init_payload,
             format='json'
         )
-        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        send_emails()
         MockSend.assert_called_once()
 
         response = self.client.post(
@@ -1025,6 +1100,7 @@ class UserSignupEmailCreateTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@override_settings(EMAIL_TRANSPORT='user.email_backend.LocalTransport')
 class UserLoginEmailInitTestCase(TestCase):
     URI = '/user/login/'
     auth_type = 'EMAIL'
@@ -1040,7 +1116,7 @@ class UserLoginEmailInitTestCase(TestCase):
         self.user = UserProfile.create_user(self.username, self.userprofile)
         self.token = Token.objects.create(user=self.user).key
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_login_email_init_success(self, MockSend):
         MockSend.return_value = True, timezone.now()
         response = self.client.post(
@@ -1052,14 +1128,15 @@ class UserLoginEmailInitTestCase(TestCase):
             },
             format='json'
         )
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(send_emails(), (1, 0))
         token = EmailAuth.objects.filter(email_address__email=self.email).first().token
         try:
             MockSend.assert_called_once_with(self.email, False, token)
         except AssertionError as e:
             self.fail(e)
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_login_email_init_quota_exceeded(self, MockSend):
         MockSend.return_value = False, None
         response = self.client.post(
@@ -1071,14 +1148,16 @@ class UserLoginEmailInitTestCase(TestCase):
             },
             format='json'
         )
-        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(send_emails(), (0, 1))
+        self.assertEqual(EmailOutbox.objects.get(key=response.json()['id']).status, EmailOutbox.PENDING)
         token = EmailAuth.objects.filter(email_address__email=self.email).first().token
         try:
             MockSend.assert_called_once_with(self.email, False, token)
         except AssertionError as e:
             self.fail(e)
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_email_init_required_field(self, MockSend):
         payload = {
             'auth_type': 'EMAIL',
@@ -1110,7 +1189,7 @@ class UserLoginEmailInitTestCase(TestCase):
         except AssertionError as e:
             self.fail(e)
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def test_user_email_init_invalid_email(self, MockSend):
         invalid_payload = {
             'auth_type': 'EMAIL',
@@ -1156,6 +1235,7 @@ class UserLoginEmailInitTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+@override_settings(EMAIL_TRANSPORT='user.email_backend.LocalTransport')
 class UserLoginEmailLoginTestCase(TestCase):
     URI = '/user/login/'
     auth_type = 'EMAIL'
@@ -1172,7 +1252,7 @@ class UserLoginEmailLoginTestCase(TestCase):
         'access_token': None
     }
 
-    @mock.patch('user.models.send_access_token')
+    @mock.patch.object(LocalTransport, 'send')
     def setUp(self, MockSend):
         self.user = UserProfile.create_user(self.username, self.userprofile)
         self.auth_token = Token.objects.create(user=self.user).key
@@ -1193,7 +1273,8 @@ class UserLoginEmailLoginTestCase(TestCase):
             },
             format='json'
         )
-        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        send_emails()
         MockSend.assert_called_once()
 
     def test_user_email_login_required_field(self):
@@ -1300,3 +1381,396 @@ class UserLoginEmailLoginTestCase(TestCase):
         self.assertEqual(data, expected_data)
         email_auth = EmailAuth.objects.get(token=self.token)
         self.assertFalse(email_auth.valid)
+
+
+@override_settings(EMAIL_TRANSPORT='user.email_backend.LocalTransport', EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+                   EMAIL_OUTBOX_RETRY_DELAY=30)
+class EmailOutboxTestCase(TestCase):
+    email = 'outbox@example.com'
+
+    def setUp(self):
+        # The transport that send_emails() builds from EMAIL_TRANSPORT.
+        self.transport = get_transport()
+        self.assertIsInstance(self.transport, LocalTransport)
+        patcher = mock.patch('user.outbox.get_transport', return_value=self.transport)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def init(self):
+        response = self.client.post('/user/', {'auth_type': 'EMAIL', 'req_type': 'INIT', 'email': self.email},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()['status'], EmailOutbox.PENDING)
+        return response.json()['id']
+
+    def poll(self, key):
+        response = self.client.get('/user/email/', {'id': key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_send(self):
+        key = self.init()
+        self.assertEqual(self.transport.messages, [])
+        self.assertFalse(EmailAuth.objects.get(email_address__email=self.email).is_email_token)
+
+        self.assertEqual(send_emails(), (1, 0))
+        email_auth = EmailAuth.objects.get(email_address__email=self.email)
+        self.assertEqual(self.transport.messages, [(self.email, True, email_auth.token)])
+        self.assertTrue(email_auth.is_email_token)
+        self.assertTrue(email_auth.valid)
+        self.assertEqual(self.poll(key)['status'], EmailOutbox.SENT)
+        self.assertEqual(send_emails(), (0, 0))
+
+    def test_retry(self):
+        key = self.init()
+        self.transport.fail = True
+        now = timezone.now()
+        self.assertEqual(send_emails(now=now), (0, 1))
+        email = EmailOutbox.objects.get(key=key)
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.PENDING, 1))
+        self.assertGreaterEqual(email.next_attempt_at, now + datetime.timedelta(seconds=30))
+
+        # Not due before the backoff has passed; the delay doubles.
+        self.assertEqual(send_emails(now=now), (0, 0))
+        self.assertEqual(send_emails(now=email.next_attempt_at), (0, 1))
+        retried = EmailOutbox.objects.get(key=key)
+        self.assertGreaterEqual(retried.next_attempt_at - email.next_attempt_at, datetime.timedelta(seconds=60))
+
+        self.transport.fail = False
+        self.assertEqual(send_emails(now=retried.next_attempt_at), (1, 0))
+        self.assertEqual(self.poll(key)['attempts'], 3)
+
+    def test_failed(self):
+        key = self.init()
+        self.transport.fail = True
+        for day in range(1, 4):
+            send_emails(now=timezone.now() + datetime.timedelta(days=day))
+        self.assertEqual(self.poll(key)['status'], EmailOutbox.FAILED)
+        self.assertEqual(send_emails(now=timezone.now() + datetime.timedelta(days=7)), (0, 0))
+        self.assertFalse(EmailAuth.objects.get(email_address__email=self.email).is_email_token)
+
+    def test_transport_error(self):
+        key = self.init()
+        with mock.patch.object(LocalTransport, 'send', side_effect=ConnectionError('down')):
+            self.assertEqual(send_emails(), (0, 1))
+        self.assertIn('down', EmailOutbox.objects.get(key=key).last_error)
+
+    def test_claimed(self):
+        self.init()
+        now = timezone.now()
+        with mock.patch.object(LocalTransport, 'send_many', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                send_emails(now=now)
+        # A worker that died while sending leaves the email to be retried after the claim timeout.
+        self.assertEqual(send_emails(now=now), (0, 0))
+        self.assertEqual(send_emails(now=now + datetime.timedelta(hours=1)), (1, 0))
+
+    def test_poll_invalid(self):
+        self.assertEqual(self.client.get('/user/email/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/user/email/', {'id': 'missing'}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_command(self):
+        self.init()
+        out = io.StringIO()
+        call_command('send_emails', stdout=out)
+        self.assertEqual(len(self.transport.messages), 1)
+        self.assertIn('Sent 1 emails, 0 failed.', out.getvalue())
+
+
+class FakeMailjetHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server.calls.append({
+            'authorization': self.headers['Authorization'],
+            'connection': self.client_address,
+            'messages': body['Messages'],
+        })
+        time.sleep(server.delay)
+        if server.status:
+            code, payload = server.status, {'ErrorMessage': 'Unavailable'}
+        else:
+            statuses = [
+                {'Status': 'error', 'Errors': [{'ErrorMessage': 'Invalid recipient'}]}
+                if message['To'][0]['Email'] in server.rejected else {'Status': 'success'}
+                for message in body['Messages']
+            ]
+            code = 400 if server.rejected else 200
+            payload = {'Messages': statuses}
+        content = json.dumps(payload).encode()
+        try:
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except ConnectionError:  # the client timed out
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeMailjetTestMixin:
+    def setUp(self):
+        super(FakeMailjetTestMixin, self).setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeMailjetHandler)
+        self.server.daemon_threads = True
+        self.server.calls, self.server.rejected, self.server.delay, self.server.status = [], set(), 0, None
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        settings = override_settings(MAILJET_API_URL=f'http://127.0.0.1:{self.server.server_port}/v3.1/send',
+                                     MAILJET_API_KEY='key', MAILJET_API_SECRET='secret')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.close)
+
+    def close(self):
+        if MailjetTransport._session is not None:
+            MailjetTransport._session.close()
+            MailjetTransport._session = None
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MailjetTransportTestCase(FakeMailjetTestMixin, SimpleTestCase):
+    def test_batches(self):
+        messages = [(f'user{i}@example.com', i % 2 == 0, f'token{i}') for i in range(120)]
+        results = MailjetTransport().send_many(messages)
+        self.assertEqual([len(call['messages']) for call in self.server.calls], [50, 50, 20])
+        self.assertTrue(all(sent for sent, sent_at, error in results))
+        self.assertEqual(len(results), 120)
+        # One keep-alive connection for all the batches, authenticated with the API key.
+        self.assertEqual(len({call['connection'] for call in self.server.calls}), 1)
+        self.assertTrue(all(call['authorization'].startswith('Basic ') for call in self.server.calls))
+
+    def test_message(self):
+        MailjetTransport().send_many([('signup@example.com', True, 'abc'), ('login@example.com', False, 'def')])
+        signup, login = self.server.calls[0]['messages']
+        self.assertEqual(signup['To'][0]['Email'], 'signup@example.com')
+        self.assertEqual(signup['TemplateID'], 2118400)
+        self.assertTrue(signup['Variables']['callback_uri'].endswith('token=abc&operation=register'))
+        self.assertEqual(login['TemplateID'], 2118280)
+        self.assertTrue(login['Variables']['callback_uri'].endswith('token=def&operation=login'))
+
+    def test_rejected(self):
+        self.server.rejected = {'bad@example.com'}
+        results = MailjetTransport().send_many([('good@example.com', True, 'a'), ('bad@example.com', True, 'b')])
+        self.assertTrue(results[0][0])
+        self.assertIsNotNone(results[0][1])
+        self.assertEqual(results[1], (False, None, 'Invalid recipient'))
+
+    def test_server_error(self):
+        self.server.status = 503
+        results = MailjetTransport().send_many([('a@example.com', True, 'a'), ('b@example.com', True, 'b')])
+        self.assertEqual(results, [(False, None, 'HTTP 503')] * 2)
+
+    @override_settings(MAILJET_TIMEOUT=(1, 0.1))
+    def test_timeout(self):
+        self.server.delay = 0.5
+        (sent, sent_at, error), = MailjetTransport().send_many([('a@example.com', True, 'a')])
+        self.assertFalse(sent)
+        self.assertIn('Timeout', error)
+
+    def test_connection_error(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with override_settings(MAILJET_API_URL='http://127.0.0.1:9/v3.1/send'):
+            (sent, sent_at, error), = MailjetTransport().send_many([('a@example.com', True, 'a')])
+        self.assertFalse(sent)
+        self.assertIn('ConnectionError', error)
+
+
+@override_settings(EMAIL_TRANSPORT='user.email_backend.MailjetTransport')
+class MailjetOutboxTestCase(FakeMailjetTestMixin, TestCase):
+    def test_send_emails(self):
+        for email in ('good@example.com', 'bad@example.com'):
+            EmailAuth.objects.create(email_address=EmailAddress.objects.create(email=email)).send(True)
+        self.server.rejected = {'bad@example.com'}
+        self.assertEqual(send_emails(), (1, 1))
+        self.assertEqual(len(self.server.calls), 1)
+
+        good = EmailOutbox.objects.get(email_auth__email_address__email='good@example.com')
+        self.assertEqual(good.status, EmailOutbox.SENT)
+        self.assertTrue(good.email_auth.is_email_token)
+        bad = EmailOutbox.objects.get(email_auth__email_address__email='bad@example.com')
+        self.assertEqual((bad.status, bad.last_error), (EmailOutbox.PENDING, 'Invalid recipient'))
+        self.assertFalse(bad.email_auth.is_email_token)
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user('cached', {'name': 'Cached User', 'email': 'cached@example.com'})
+        self.token = Token.objects.create(user=self.user)
+
+    def get_me(self, token=None):
+        return self.client.get('/user/me/', HTTP_AUTHORIZATION=f'Token {token or self.token.key}')
+
+    def test_cached(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.get_me().status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as second:
+            response = self.get_me()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['username'], 'cached')
+        self.assertEqual(len(second), len(first) - 1)
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in second.captured_queries))
+        self.assertNotIn(self.token.key, str(cache.get(token_user_key(self.token.key))))
+
+    def test_invalid_token(self):
+        self.assertEqual(self.get_me('invalid').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated(self):
+        self.get_me()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_renamed(self):
+        self.get_me()
+        self.user.username = 'renamed'
+        self.user.save(update_fields=['username'])
+        self.assertEqual(self.get_me().json()['username'], 'renamed')
+
+    def test_token_deleted(self):
+        self.get_me()
+        self.token.delete()
+        self.assertEqual(self.get_me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalidated_while_loading(self):
+        def deactivate(*args, **kwargs):
+            # The change commits between the token lookup and the snapshot being stored.
+            User.objects.filter(id=self.user.id).update(is_active=False)
+            invalidate_token(self.token.key)
+            return self.user
+
+        with mock.patch('rest_framework.authtoken.models.Token.user', new_callable=mock.PropertyMock,
+                        side_effect=deactivate):
+            self.assertEqual(self.get_me().status_code, status.HTTP_200_OK)
+        self.assertIsNone(cache.get(token_user_key(self.token.key)))
+        self.assertEqual(self.get_me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_stored_after_invalidation(self):
+        self.get_me()
+        snapshot = cache.get(token_user_key(self.token.key))
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        invalidate_token(self.token.key)
+        # A request that loaded the user before the change stores its snapshot afterwards.
+        cache.set(token_user_key(self.token.key), snapshot)
+        self.assertEqual(self.get_me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout(self):
+        self.get_me()
+        self.assertIsNotNone(cache.get(token_user_key(self.token.key)))
+        response = self.client.post('/user/logout/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertIsNone(cache.get(token_user_key(self.token.key)))
+
+
+class TokenOnlyLoginTestCase(TestCase):
+    def setUp(self):
+        self.user = UserProfile.create_user('tokenonly', {'name': 'Token Only', 'email': 'tokenonly@example.com'},
+                                            True)
+        Token.objects.create(user=self.user)
+
+    def login(self):
+        response = self.client.post('/user/login/', json.dumps({'auth_type': 'TEST', 'username': 'tokenonly'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_login(self):
+        response = self.login()
+        self.assertEqual(response.json()['token'], self.user.auth_token.key)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_signup(self):
+        response = self.client.post('/user/', json.dumps({
+            'auth_type': 'TEST',
+            'username': 'signup',
+            'name': 'Signup User',
+            'email': 'signup@example.com',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Session.objects.exists())
+
+    @override_settings(TOKEN_ONLY_LOGIN=False)
+    def test_session_login(self):
+        response = self.login()
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(Session.objects.count(), 1)
+
+
+class UserQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    username = 'budget'
+    userprofile = {
+        'name': 'Budget User',
+        'email': 'budget@example.com'
+    }
+
+    def setUp(self):
+        clear_all()
+        self.user = UserProfile.create_user(self.username, self.userprofile, True)
+        self.token = Token.objects.create(user=self.user).key
+        self.counter = itertools.count()
+
+    def grow(self, size):
+        """
+        One more user matching ?username=budget, and one more story of each kind of self.user, per size.
+        """
+        for i in range(Story.objects.filter(writer=self.user, published=True).count(), size):
+            UserProfile.create_user(f'{self.username}{i}', {
+                'name': f'Budget User {i}',
+                'email': f'{self.username}{i}@example.com',
+            })
+            Story.objects.create(writer=self.user, title=f'Story {i}', published=True, published_at=timezone.now())
+            Story.objects.create(writer=self.user, title=f'Draft {i}')
+
+    def get(self, uri, **extra):
+        return lambda: self.client.get(uri, HTTP_AUTHORIZATION=f'Token {self.token}', **extra)
+
+    def post(self, uri, data=None, **extra):
+        # A new client every time, so that no session is carried over from the previous request.
+        return lambda: self.client_class().post(uri, json.dumps(data() if callable(data) else data or {}),
+                                                content_type='application/json', **extra)
+
+    def test_list_budget(self):
+        self.assertQueryBudget(self.get('/user/', data={'username': self.username}), self.grow, budget=4)
+
+    def test_read_budget(self):
+        for uri, budget in (('/user/me/', 5), ('/user/me/about/', 3), (f'/user/{self.user.id}/about/', 4)):
+            with self.subTest(uri=uri):
+                self.assertQueryBudget(self.get(uri), self.grow, budget=budget)
+
+    def test_story_budget(self):
+        for uri, budget in (('/user/me/story/?public=true', 3), ('/user/me/story/?public=false', 3),
+                            (f'/user/{self.user.id}/story/', 4)):
+            with self.subTest(uri=uri):
+                self.assertQueryBudget(self.get(uri), self.grow, budget=budget)
+
+    def test_update_budget(self):
+        self.assertQueryBudget(
+            lambda: self.client.put('/user/me/', json.dumps({'bio': 'Edited'}), content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'Token {self.token}'),
+            self.grow, budget=8)
+
+    def test_signup_budget(self):
+        self.assertQueryBudget(self.post('/user/', lambda: {
+            'auth_type': 'TEST',
+            'username': f'signup{next(self.counter)}',
+            'name': 'Signup User',
+            'email': f'signup{next(self.counter)}@example.com',
+        }), self.grow, budget=13)
+
+    def test_login_budget(self):
+        self.assertQueryBudget(self.post('/user/login/', {'auth_type': 'TEST', 'username': self.username}),
+                               self.grow, budget=4)
+
+    def test_logout_budget(self):
+        self.assertQueryBudget(self.post('/user/logout/', HTTP_AUTHORIZATION=f'Token {self.token}'),
+                               self.grow, budget=1)
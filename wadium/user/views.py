@@ -1,4 +1,4 @@
-from django.contrib.auth import login, logout
+from django.contrib.auth import logout
 from django.contrib.auth.models import User
 from django.db import transaction
 from django.shortcuts import get_object_or_404
@@ -9,8 +9,15 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 
+from search.index import search_stories
+from search.models import NgramToken
+from search.ngrams import filter_contains
 from story.paginators import StoryPagination
-from .models import EmailAddress, EmailAuth, UserProfile
+from story.signals import user_story_count_name
+from story.tags import filter_by_tags, get_tag_query
+from wadium.timing import timed
+from .authentication import invalidate_token, login_user
+from .models import EmailAddress, EmailAuth, EmailOutbox, UserProfile
 from .paginators import UserPagination
 from .permissions import UserAccessPermission
 from .serializers import UserSerializer, UserLoginSerializer, UserSelfSerializer, MyStorySerializer, \
@@ -61,11 +68,8 @@ class UserViewSet(viewsets.GenericViewSet):
                 with transaction.atomic():
                     email_address, created = EmailAddress.objects.get_or_create(email=data['userprofile']['email'])
                     email_auth = EmailAuth.objects.create(email_address=email_address)
-                    sent = email_auth.send(signup=email_address.available)
-                    if sent:
-                        return Response(status=status.HTTP_204_NO_CONTENT)
-                    else:
-                        return Response(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                    email = email_auth.send(signup=email_address.available)
+                return self.email_queued_response(email)
             elif data['req_type'] == UserSerializer.CHECK:
                 email_auth = get_object_or_404(EmailAuth, token=data['access_token'])
                 email_auth.is_valid(must_be_email=True)
@@ -87,7 +91,7 @@ class UserViewSet(viewsets.GenericViewSet):
         else:
             return Response(status=status.HTTP_501_NOT_IMPLEMENTED)
 
-        login(request, user)
+        login_user(request, user)
         data = serializer.data
         data['token'] = user.auth_token.key
         return Response(data=data, status=status.HTTP_201_CREATED)
@@ -108,25 +112,42 @@ class UserViewSet(viewsets.GenericViewSet):
                             'email': 'No user is associated with given email'
                         }, status=status.HTTP_404_NOT_FOUND)
                     email_auth = EmailAuth.objects.create(email_address=email_address)
-                    sent = email_auth.send(signup=False)
-                    if sent:
-                        return Response(status=status.HTTP_204_NO_CONTENT)
-                    else:
-                        return Response(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                    email = email_auth.send(signup=False)
+                return self.email_queued_response(email)
             elif data['req_type'] == UserLoginSerializer.LOGIN:
                 user = login_serializer.get_user(data)
         else:
             return Response(status=status.HTTP_501_NOT_IMPLEMENTED)
 
-        login(request, user)
+        login_user(request, user)
 
         data = self.get_serializer(instance=user).data
         token, created = Token.objects.get_or_create(user=user)
         data['token'] = token.key
         return Response(data=data)
 
+    @staticmethod
+    def email_queued_response(email):
+        # The email is sent by the outbox worker; its status can be polled at /user/email/?id=
+        return Response({'id': email.key, 'status': email.status}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['GET'])
+    def email(self, request):
+        key = request.query_params.get('id')
+        if not key:
+            return Response({'error': "'id' is required."}, status=status.HTTP_400_BAD_REQUEST)
+        email = get_object_or_404(EmailOutbox, key=key)
+        return Response({
+            'id': email.key,
+            'status': email.status,
+            'attempts': email.attempts,
+            'sent_at': email.sent_at,
+        })
+
     @action(detail=False, methods=['POST'])
     def logout(self, request):
+        if isinstance(request.auth, Token):
+            invalidate_token(request.auth.key)
         logout(request)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -137,15 +158,14 @@ class UserViewSet(viewsets.GenericViewSet):
                 'error': 'username query is required.'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        userprofiles = UserProfile.objects.filter(user__username__icontains=username)
-        if userprofiles.count() == 0:
+        userprofiles = filter_contains(UserProfile.objects.with_email().order_by('pk'), NgramToken.USERNAME,
+                                       'user__username', username, id_field='user_id')
+        page = self.paginate_queryset(userprofiles)
+        if not page:
             return Response(status=status.HTTP_404_NOT_FOUND)
-        else:
-            page = self.paginate_queryset(userprofiles)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
-            return Response(self.get_serializer(userprofiles, many=True).data)
+        with timed('serialize'):
+            data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
 
     @action(detail=True, methods=['GET'])
     def about(self, request, pk):
@@ -204,23 +224,35 @@ class UserViewSet(viewsets.GenericViewSet):
                 queryset = queryset.order_by('-published_at')
             else:
                 queryset = queryset.order_by('-updated_at')
+            self.paginator.count_name = user_story_count_name(request.user.id, public)
             page = self.paginate_queryset(queryset)
             assert page is not None
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            with timed('serialize'):
+                data = self.get_serializer(page, many=True).data
+            return self.get_paginated_response(data)
 
         # /user/{user_id}/story/
-        queryset = self.get_object().stories. \
+        user = self.get_object()
+        queryset = user.stories. \
             filter(published=True). \
             only(*UserStorySerializer.Meta.fields, 'writer'). \
             order_by('-published_at')
         if 'title' in request.query_params:
             title = request.query_params.get('title')
-            queryset = queryset.filter(title__icontains=title)
+            queryset = filter_contains(queryset, NgramToken.STORY_TITLE, 'title', title)
         if 'tag' in request.query_params:
-            return Response({'error': 'tag query is not implemented'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+            try:
+                tag_ids, tag_mode = get_tag_query(request.query_params)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = filter_by_tags(queryset, tag_ids, tag_mode) if tag_ids is not None else queryset.none()
+        if 'q' in request.query_params:
+            queryset = search_stories(queryset, request.query_params.get('q'))
+        if not {'title', 'tag', 'q'} & set(request.query_params):
+            self.paginator.count_name = user_story_count_name(user.id, True)
         self.paginator.page_size = 5
         page = self.paginate_queryset(queryset)
         assert page is not None
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        with timed('serialize'):
+            data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
@@ -5,6 +5,7 @@ from django.http import HttpResponseBadRequest
 from rest_framework.authtoken.models import Token
 from rest_framework.serializers import ValidationError
 
+from user.authentication import login_user
 from user.models import UserProfile, EmailAddress
 
 
@@ -12,6 +13,10 @@ class WadiumAccountAdapter(DefaultAccountAdapter):
     def is_open_for_signup(self, request):
         return False  # disable account/email signup
 
+    def login(self, request, user):
+        # Social logins answer with the DRF token; see TOKEN_ONLY_LOGIN.
+        login_user(request, user)
+
 
 class WadiumSocialAccountAdapter(DefaultSocialAccountAdapter):
     def is_open_for_signup(self, request, sociallogin):
@@ -43,9 +48,7 @@ class WadiumSocialAccountAdapter(DefaultSocialAccountAdapter):
             'profile_image': picture
         }
         try:
-            user = UserProfile.create_user(
-                UserProfile.get_unique_username(sociallogin.account.extra_data['email']),
-                userprofile)
+            user = UserProfile.create_user_with_unique_username(userprofile)
         except ValidationError as e:
             res = HttpResponseBadRequest(str(e.detail))
             raise ImmediateHttpResponse(res)
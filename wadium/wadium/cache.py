@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = '{key}:lock'
+INVALIDATION_CHANNEL = 'wadium:cache:invalidate'
+
+_LOCKED = object()
+_MISSING = object()
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache with a per-entry TTL: the L1 tier in front of Redis.
+    Values are shared between threads as is, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if timeout <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalCache(settings.L1_CACHE_MAX_ENTRIES, settings.L1_CACHE_TIMEOUT)
+
+
+def get_redis():
+    """
+    Return the Redis client behind the default cache, or None when it is not a django_redis cache.
+    Keys used on it directly should go through cache.make_key().
+    """
+    # `cache` is a proxy whatever the backend: ask django_redis about the actual cache.
+    from django_redis import get_redis_connection
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        return None
+
+
+class InvalidationListener:
+    """
+    Keeps the L1 tiers of all workers coherent. Writers publish the keys they changed
+    on a Redis channel; every worker drops those keys from its own L1 tier.
+    Without a django_redis cache, L1 is only coherent within a process.
+    """
+
+    def __init__(self):
+        self.sender = uuid.uuid4().hex
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # First use in this process, or first use after a fork: start over.
+            self._pid = os.getpid()
+            self.sender = uuid.uuid4().hex
+            local_cache.clear()
+            if get_redis() is not None:
+                threading.Thread(target=self.listen, name='l1-invalidation', daemon=True).start()
+
+    def publish(self, keys):
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            redis.publish(INVALIDATION_CHANNEL, json.dumps({'sender': self.sender, 'keys': list(keys)}))
+        except Exception:
+            logger.exception('Failed to publish L1 cache invalidation')
+
+    def handle(self, data):
+        payload = json.loads(data)
+        if payload['sender'] != self.sender:
+            local_cache.delete_many(payload['keys'])
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Messages may have been missed while (re)connecting.
+                local_cache.clear()
+                for message in pubsub.listen():
+                    self.handle(message['data'])
+            except Exception:
+                logger.exception('L1 cache invalidation listener failed, reconnecting')
+                local_cache.clear()
+                time.sleep(1)
+
+
+invalidation_listener = InvalidationListener()
+
+
+def get_local(key, load):
+    """
+    Read a plain value through the L1 tier, loading it with `load()` on a miss.
+    """
+    invalidation_listener.ensure_started()
+    value = local_cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = load()
+        if value is not None:
+            local_cache.set(key, value)
+    return value
+
+
+def invalidate_local(*keys):
+    """
+    Drop keys from the L1 tier of every worker.
+    """
+    local_cache.delete_many(keys)
+    invalidation_listener.publish(keys)
+
+
+def clear_all():
+    cache.clear()
+    local_cache.clear()
+
+
+def set_value(key, value, timeout, stale_timeout=None, local=False):
+    """
+    Store `value` as fresh for `timeout` seconds. It is kept for another `stale_timeout`
+    seconds (default: `timeout`) so that get_or_compute() can serve it while one
+    caller recomputes.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    entry = (value, time.time() + timeout)
+    cache.set(key, entry, timeout=timeout + stale_timeout)
+    if local:
+        invalidate_local(key)
+        local_cache.set(key, entry)
+
+
+def delete_value(key, local=False):
+    cache.delete(key)
+    if local:
+        invalidate_local(key)
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=None, lock_timeout=10, wait_timeout=2, local=False):
+    """
+    Single-flight read-through cache.
+
+    At most one caller at a time runs `compute()` for a key; the others are guarded by
+    a lock taken with cache.add() (SET NX on Redis):
+    - fresh entry: returned as is.
+    - stale entry: the lock holder recomputes, everyone else keeps serving the stale value.
+    - no entry: the lock holder computes, everyone else waits up to `wait_timeout`
+      seconds for its result before computing on their own.
+
+    With `local=True` the entry is also kept in the L1 tier for L1_CACHE_TIMEOUT seconds,
+    so hot keys are served without a Redis round trip. Writers must then pass `local=True`
+    to set_value()/delete_value() as well.
+    """
+    if local:
+        invalidation_listener.ensure_started()
+        entry = local_cache.get(key)
+        if entry is not None and time.time() < entry[1]:
+            return entry[0]
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            if local:
+                local_cache.set(key, entry)
+            return value
+        recomputed = _compute_with_lock(key, compute, timeout, stale_timeout, lock_timeout, local)
+        return value if recomputed is _LOCKED else recomputed
+
+    recomputed = _compute_with_lock(key, compute, timeout, stale_timeout, lock_timeout, local)
+    if recomputed is not _LOCKED:
+        return recomputed
+
+    deadline = time.time() + wait_timeout
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    value = compute()
+    set_value(key, value, timeout, stale_timeout, local)
+    return value
+
+
+def _compute_with_lock(key, compute, timeout, stale_timeout, lock_timeout, local):
+    lock_key = LOCK_KEY.format(key=key)
+    token = secrets.token_hex(8)
+    if not cache.add(lock_key, token, timeout=lock_timeout):
+        return _LOCKED
+    try:
+        value = compute()
+        set_value(key, value, timeout, stale_timeout, local)
+        return value
+    finally:
+        # Do not release a lock that expired and was taken by someone else meanwhile.
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
@@ -0,0 +1,116 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+
+class CountProvider:
+    """
+    Row counts for paginated querysets, served from the cache.
+
+    Named counts ('story:list', 'story:3:comments', ...) are kept up to date by
+    model signals through incr(). Other querysets are keyed by a hash of their SQL
+    and simply expire. When the optimizer estimates more than
+    COUNT_ESTIMATE_THRESHOLD rows the estimate is used instead of COUNT(*).
+    """
+    key_prefix = 'count:'
+    estimate_suffix = ':estimate'
+
+    def get_key(self, queryset, name=None):
+        if name is not None:
+            return self.key_prefix + name
+        sql, params = queryset.query.sql_with_params()
+        return self.key_prefix + 'sql:' + hashlib.md5(repr((sql, params)).encode('utf-8')).hexdigest()
+
+    def get(self, queryset, name=None):
+        """
+        Return (count, exact) for the queryset.
+        """
+        try:
+            key = self.get_key(queryset, name)
+        except EmptyResultSet:  # e.g. queryset.none()
+            return 0, True
+        estimate_key = key + self.estimate_suffix
+        cached = cache.get_many([key, estimate_key])
+        if key in cached:
+            return cached[key], True
+        if estimate_key in cached:
+            return cached[estimate_key], False
+
+        timeout = settings.COUNT_CACHE_TIMEOUT if name is not None else settings.COUNT_SIGNATURE_CACHE_TIMEOUT
+        estimate = self.estimate(queryset)
+        if estimate is not None and estimate > settings.COUNT_ESTIMATE_THRESHOLD:
+            cache.set(estimate_key, estimate, timeout=timeout)
+            return estimate, False
+        count = queryset.count()
+        cache.set(key, count, timeout=timeout)
+        return count, True
+
+    def estimate(self, queryset):
+        """
+        Return the optimizer's row estimate for the queryset, or None when the
+        database cannot give one cheaply.
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'mysql':
+            return None
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        plan = dict(zip(columns, row))
+        if plan.get('rows') is None:
+            return None
+        return int(plan['rows'] * (plan.get('filtered') or 100) / 100)
+
+    def incr(self, name, delta=1):
+        """
+        Adjust a named count in place. Counts that are not cached are left alone;
+        they will be computed on the next request.
+        """
+        key = self.key_prefix + name
+        for cached_key in (key, key + self.estimate_suffix):
+            try:
+                cache.incr(cached_key, delta)
+            except ValueError:  # not cached
+                pass
+
+    def delete(self, *names):
+        keys = [self.key_prefix + name for name in names]
+        cache.delete_many(keys + [key + self.estimate_suffix for key in keys])
+
+
+count_provider = CountProvider()
+
+
+class CountedPaginator(Paginator):
+    def __init__(self, object_list, per_page, count_name=None, **kwargs):
+        super(CountedPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.count_name = count_name
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super(CountedPaginator, self).count
+        count, self.count_exact = count_provider.get(self.object_list, self.count_name)
+        return count
+
+
+class CountedPaginationMixin:
+    """
+    PageNumberPagination mixin that takes `count` from the count provider.
+    Views may set `paginator.count_name` to use a signal-maintained count.
+    """
+    count_name = None
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountedPaginator(object_list, per_page, count_name=self.count_name)
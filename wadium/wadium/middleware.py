@@ -0,0 +1,108 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import SessionBase
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import connections
+
+from .timing import RequestTiming, current_timing, timed_cache
+
+logger = logging.getLogger('wadium.timing')
+
+
+class ServerTimingMiddleware:
+    """
+    Measure where the time of a sample of requests (SERVER_TIMING_SAMPLE_RATE) goes: database,
+    cache, serializers and rendering. Sampled responses get a Server-Timing header, and the
+    numbers are logged as a JSON line to the 'wadium.timing' logger.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(timed_cache())
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        timing.add('total', time.perf_counter() - start)
+
+        response['Server-Timing'] = timing.as_header()
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'timing': timing.as_dict(),
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that too.
+        timing = current_timing.get()
+        if timing is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(lambda response: timing.add('render', time.perf_counter() - start))
+        return response
+
+
+class NullSession(SessionBase):
+    """
+    A session that is always empty and never stored.
+    """
+
+    def exists(self, session_key):
+        return False
+
+    def create(self):
+        pass
+
+    def save(self, must_create=False):
+        pass
+
+    def delete(self, session_key=None):
+        pass
+
+    def load(self):
+        return {}
+
+    @classmethod
+    def clear_expired(cls):
+        pass
+
+
+class PathSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware that leaves the session store alone for the token-authenticated API
+    (SESSIONLESS_PATHS, with TOKEN_ONLY_LOGIN): those requests get an empty NullSession,
+    and no session cookie is set on their responses.
+    """
+
+    @staticmethod
+    def is_sessionless(request):
+        return settings.TOKEN_ONLY_LOGIN and request.path_info.startswith(settings.SESSIONLESS_PATHS)
+
+    def process_request(self, request):
+        if self.is_sessionless(request):
+            request.session = NullSession()
+            return
+        super(PathSessionMiddleware, self).process_request(request)
+
+    def process_response(self, request, response):
+        if isinstance(getattr(request, 'session', None), NullSession):
+            return response
+        return super(PathSessionMiddleware, self).process_response(request, response)
@@ -0,0 +1,71 @@
+import hashlib
+import json
+from collections import namedtuple
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .timing import timed
+
+# etag is a quoted strong ETag; last_modified is a POSIX timestamp or None.
+RenderedContent = namedtuple('RenderedContent', ('content', 'content_type', 'etag', 'last_modified'),
+                             defaults=(None, None))
+
+
+def render_content(data, etag=None, last_modified=None):
+    """
+    Render data once, the way a DRF Response would for a plain JSON request,
+    so that the bytes can be cached and served again without re-rendering.
+    The ETag defaults to a hash of the rendered bytes.
+    """
+    renderer = JSONRenderer()
+    with timed('render'):
+        content = renderer.render(data)
+    if etag is None:
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+    return RenderedContent(content, renderer.media_type, etag, last_modified)
+
+
+def is_plain_json(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    return type(renderer) is JSONRenderer and renderer.get_indent(request.accepted_media_type, {}) is None
+
+
+def not_modified_response(request, etag=None, last_modified=None):
+    """
+    Return a 304 (or 412) response when the client's copy, described by If-None-Match /
+    If-Modified-Since, is still current; None when the full response must be sent.
+    Only plain JSON requests are answered, since the validators describe the JSON bytes.
+    """
+    if not is_plain_json(request):
+        return None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(request, response, etag=None, last_modified=None):
+    if not is_plain_json(request):
+        return response
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def rendered_response(request, rendered, status=200):
+    """
+    Serve cached rendered content. JSON requests get the bytes as is, with ETag /
+    Last-Modified, or a 304 when the client already has them. Anything else (the
+    browsable API, an `indent` media type parameter, ...) goes through DRF rendering.
+    """
+    if not is_plain_json(request):
+        return Response(json.loads(rendered.content), status=status)
+    if status == 200:
+        response = not_modified_response(request, rendered.etag, rendered.last_modified)
+        if response is not None:
+            return response
+    response = HttpResponse(rendered.content, content_type=rendered.content_type, status=status)
+    return set_validators(request, response, rendered.etag, rendered.last_modified)
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'user.apps.UserConfig',
     'story.apps.StoryConfig',
+    'search.apps.SearchConfig',
+    'bench.apps.BenchConfig',
     'corsheaders',
     'django.contrib.sites',
 
@@ -60,7 +62,8 @@ SITE_ID = 1
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'wadium.middleware.ServerTimingMiddleware',
+    'wadium.middleware.PathSessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,7 +74,7 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'user.authentication.CachedTokenAuthentication',
     )
 }
 
@@ -124,6 +127,71 @@ CACHES = {
     }
 }
 
+# In-process L1 cache in front of Redis for the hottest keys (wadium/cache.py).
+# Workers keep their L1 tiers coherent through Redis pub/sub.
+L1_CACHE_MAX_ENTRIES = 256
+L1_CACHE_TIMEOUT = 5
+
+# Pagination counts (wadium/counts.py)
+# Named counts are kept up to date by signals; the others are keyed by their SQL.
+COUNT_CACHE_TIMEOUT = 60 * 60
+COUNT_SIGNATURE_CACHE_TIMEOUT = 60
+# Above this many estimated rows, MySQL's EXPLAIN estimate is served instead of COUNT(*).
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+# Story read tracking (story/reads.py)
+# Reads are buffered in Redis and written to StoryRead by `manage.py flush_story_reads`; without
+# Redis, they are written to StoryRead as they are recorded.
+# Repeated reads of a story by the same user within this many seconds count once.
+STORY_READ_DEDUP_WINDOW = 60 * 30
+
+# Trending engine (story/trending.py, `manage.py compute_trending`)
+# Reads and comments of the last TRENDING_WINDOW_DAYS count, decaying by half every TRENDING_HALF_LIFE_HOURS.
+TRENDING_WINDOW_DAYS = 7
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_COMMENT_WEIGHT = 3.0
+
+# Email outbox (user/outbox.py, `manage.py send_emails`)
+# Signup and login emails are queued by the request and sent by the worker; failed sends are
+# retried after EMAIL_OUTBOX_RETRY_DELAY seconds, doubling every time, up to EMAIL_OUTBOX_MAX_ATTEMPTS.
+EMAIL_TRANSPORT = 'user.email_backend.MailjetTransport'
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 60 * 5
+
+# Token authentication (user/authentication.py)
+# Snapshot of the user of a token, dropped on logout, token deletion and user changes.
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 10
+
+# Token-only login (user/authentication.py, wadium/middleware.py)
+# API clients only use their DRF token: logins do not create a Django session, and requests
+# under SESSIONLESS_PATHS never load or save one. The admin and the social login views keep sessions.
+TOKEN_ONLY_LOGIN = os.getenv('TOKEN_ONLY_LOGIN', 'true') in ('true', 'True')
+SESSIONLESS_PATHS = ('/story/', '/user/')
+
+# Server timing (wadium/middleware.py)
+# Share of requests whose DB, cache, serializer and render times are sent as a Server-Timing header and logged.
+SERVER_TIMING_SAMPLE_RATE = float(os.getenv('SERVER_TIMING_SAMPLE_RATE', '0.01'))
+
+# Logging
+# The root logger only lets warnings through: the sampled timing lines need their own level and handler.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'wadium.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -163,6 +231,9 @@ STATIC_URL = '/static/'
 # Mailjet API
 MAILJET_API_KEY = os.getenv('MAILJET_API_KEY')
 MAILJET_API_SECRET = os.getenv('MAILJET_API_SECRET')
+MAILJET_API_URL = os.getenv('MAILJET_API_URL', 'https://api.mailjet.com/v3.1/send')
+# (connect, read) timeouts in seconds of a call to the send API; the outbox retries on timeout.
+MAILJET_TIMEOUT = (3.05, 10)
 
 CORS_ALLOWED_ORIGINS = [
     'https://wadium.shop',
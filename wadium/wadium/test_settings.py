@@ -10,3 +10,6 @@ DATABASES = {
         'PASSWORD': 'team2-server'
     }
 }
+
+# Sampled requests would log timing lines in the middle of the test output.
+SERVER_TIMING_SAMPLE_RATE = 0
@@ -0,0 +1,83 @@
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from wadium.cache import clear_all
+
+# Dataset sizes an endpoint is measured at; all of them fit in one page of every paginator.
+QUERY_BUDGET_SIZES = (1, 3, 5)
+LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+class QueryProfile:
+    """
+    The SQL statements run while serving one request.
+    """
+
+    def __init__(self, queries):
+        self.statements = [query['sql'] for query in queries]
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def duplicates(self):
+        """
+        Statements run more than once with the very same parameters: {sql: times}.
+        """
+        return {sql: times for sql, times in Counter(self.statements).items() if times > 1}
+
+    @property
+    def shapes(self):
+        """
+        Statements grouped by their SQL with the literals left out: {shape: times}.
+        An N+1 shows up as one shape repeated once per row.
+        """
+        return Counter(LITERAL_PATTERN.sub('?', sql) for sql in self.statements)
+
+    def __str__(self):
+        return '\n'.join(f'{times} x {shape}' for shape, times in self.shapes.most_common())
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin that measures how many queries an endpoint runs as its dataset grows.
+
+        self.assertQueryBudget(lambda: self.client.get('/story/'), self.create_stories, budget=4)
+
+    `grow(size)` brings the dataset to `size` rows, then `request()` is run and its queries
+    recorded, once for every size in QUERY_BUDGET_SIZES. Caches are cleared before each
+    request, so that what is measured is a cold request, and the rows are rolled back
+    afterwards, so `grow` should count the rows it has to add. The test fails when the number of
+    queries changes with the dataset size (an N+1), when it exceeds `budget`, or when a
+    statement is run twice with the same parameters.
+    """
+
+    def measure_queries(self, request, grow, sizes=QUERY_BUDGET_SIZES):
+        profiles = {}
+        with transaction.atomic():
+            for size in sizes:
+                grow(size)
+                clear_all()
+                with CaptureQueriesContext(connection) as context:
+                    response = request()
+                self.assertLess(response.status_code, 400, f'{response.status_code} at size {size}')
+                profiles[size] = QueryProfile(context.captured_queries)
+            transaction.set_rollback(True)
+        return profiles
+
+    def assertQueryBudget(self, request, grow, budget=None, sizes=QUERY_BUDGET_SIZES, allow_duplicates=False):
+        profiles = self.measure_queries(request, grow, sizes)
+        counts = {size: profile.count for size, profile in profiles.items()}
+        largest = profiles[max(sizes)]
+        if len(set(counts.values())) > 1:
+            self.fail(f'Query count grows with the dataset {counts}:\n{largest}')
+        if budget is not None and largest.count > budget:
+            self.fail(f'{largest.count} queries, over the budget of {budget}:\n{largest}')
+        if not allow_duplicates and largest.duplicates:
+            self.fail('Duplicate statements:\n' + '\n'.join(
+                f'{times} x {sql}' for sql, times in largest.duplicates.items()))
+        return profiles
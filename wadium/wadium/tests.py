@@ -1,5 +1,23 @@
+import json
+import logging
+import threading
+import time
+from unittest import mock
+
+import redis
 from rest_framework import status
-from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import connection
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .cache import INVALIDATION_CHANNEL, LOCK_KEY, InvalidationListener, LocalCache, clear_all, delete_value, \
+    get_or_compute, get_redis, invalidate_local, invalidation_listener, local_cache, set_value
+from .testing import QueryBudgetMixin, QueryProfile
 
 
 class GetRootTestCase(TestCase):
@@ -13,3 +31,268 @@ class GetRootTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         content = response.content.decode('utf-8')
         self.assertEqual(content, self.expected_response)
+
+
+class GetOrComputeTestCase(SimpleTestCase):
+    key = 'test:single-flight'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_get_or_compute_caches(self):
+        compute = mock.Mock(return_value='value')
+        self.assertEqual(get_or_compute(self.key, compute, timeout=60), 'value')
+        self.assertEqual(get_or_compute(self.key, compute, timeout=60), 'value')
+        self.assertEqual(compute.call_count, 1)
+
+    def test_get_or_compute_single_flight_on_miss(self):
+        calls = []
+
+        def compute():
+            calls.append(threading.get_ident())
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute(self.key, compute, timeout=60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_compute_serves_stale_while_revalidating(self):
+        set_value(self.key, 'stale', timeout=-1, stale_timeout=60)
+        cache.add(LOCK_KEY.format(key=self.key), 'other worker', timeout=10)
+        compute = mock.Mock(return_value='fresh')
+        self.assertEqual(get_or_compute(self.key, compute, timeout=60), 'stale')
+        compute.assert_not_called()
+
+        cache.delete(LOCK_KEY.format(key=self.key))
+        self.assertEqual(get_or_compute(self.key, compute, timeout=60), 'fresh')
+        self.assertEqual(get_or_compute(self.key, compute, timeout=60), 'fresh')
+        self.assertEqual(compute.call_count, 1)
+        self.assertIsNone(cache.get(LOCK_KEY.format(key=self.key)))
+
+    def test_get_or_compute_releases_lock_on_error(self):
+        compute = mock.Mock(side_effect=ValueError)
+        with self.assertRaises(ValueError):
+            get_or_compute(self.key, compute, timeout=60)
+        self.assertIsNone(cache.get(LOCK_KEY.format(key=self.key)))
+
+
+class LocalCacheTestCase(SimpleTestCase):
+    def test_local_cache_lru(self):
+        local = LocalCache(max_entries=2, timeout=60)
+        local.set('a', 1)
+        local.set('b', 2)
+        self.assertEqual(local.get('a'), 1)
+        local.set('c', 3)  # evicts 'b', the least recently used
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(local.get('a'), 1)
+        self.assertEqual(local.get('c'), 3)
+
+    def test_local_cache_timeout(self):
+        local = LocalCache(max_entries=2, timeout=60)
+        local.set('a', 1, timeout=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(local.get('a'))
+
+
+class L1GetOrComputeTestCase(SimpleTestCase):
+    key = 'test:l1'
+
+    def setUp(self):
+        clear_all()
+
+    def test_get_or_compute_local_hit_skips_redis(self):
+        compute = mock.Mock(return_value='value')
+        get_or_compute(self.key, compute, timeout=60, local=True)
+        with mock.patch.object(cache, 'get') as mock_get:
+            self.assertEqual(get_or_compute(self.key, compute, timeout=60, local=True), 'value')
+            mock_get.assert_not_called()
+        self.assertEqual(compute.call_count, 1)
+
+    def test_get_or_compute_local_invalidation(self):
+        get_or_compute(self.key, lambda: 'old', timeout=60, local=True)
+        set_value(self.key, 'new', timeout=60, local=True)
+        self.assertEqual(get_or_compute(self.key, lambda: 'unused', timeout=60, local=True), 'new')
+        delete_value(self.key, local=True)
+        self.assertEqual(get_or_compute(self.key, lambda: 'computed', timeout=60, local=True), 'computed')
+
+    def test_invalidation_message_from_other_worker(self):
+        get_or_compute(self.key, lambda: 'value', timeout=60, local=True)
+        own_message = json.dumps({'sender': invalidation_listener.sender, 'keys': [self.key]})
+        invalidation_listener.handle(own_message)
+        self.assertIsNotNone(local_cache.get(self.key))
+
+        other_message = json.dumps({'sender': 'other worker', 'keys': [self.key]})
+        invalidation_listener.handle(other_message)
+        self.assertIsNone(local_cache.get(self.key))
+
+
+REDIS_CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+        'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient'},
+    }
+}
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class StopListening(BaseException):
+    pass
+
+
+class GetRedisTestCase(SimpleTestCase):
+    @override_settings(CACHES=REDIS_CACHES)
+    def test_django_redis(self):
+        # The client connects on its first command, so no server is needed here.
+        self.assertIsInstance(get_redis(), redis.Redis)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_other_backend(self):
+        self.assertIsNone(get_redis())
+
+
+@override_settings(CACHES=REDIS_CACHES)
+class RedisInvalidationTestCase(SimpleTestCase):
+    key = 'test:l1'
+
+    def setUp(self):
+        self.redis = mock.MagicMock()
+        patcher = mock.patch('django_redis.get_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        local_cache.clear()
+
+    def test_publish(self):
+        invalidate_local(self.key)
+        self.redis.publish.assert_called_once_with(INVALIDATION_CHANNEL, json.dumps({
+            'sender': invalidation_listener.sender,
+            'keys': [self.key],
+        }))
+
+    def test_listener_started(self):
+        listener = InvalidationListener()
+        with mock.patch('wadium.cache.threading.Thread') as mock_thread:
+            listener.ensure_started()
+            listener.ensure_started()
+        mock_thread.assert_called_once_with(target=listener.listen, name='l1-invalidation', daemon=True)
+        mock_thread.return_value.start.assert_called_once_with()
+
+    def test_listen(self):
+        local_cache.set(self.key, 'value')
+        message = {'data': json.dumps({'sender': 'other worker', 'keys': [self.key]}).encode()}
+        pubsub = self.redis.pubsub.return_value
+        pubsub.listen.side_effect = [iter([message]), StopListening()]
+        with self.assertRaises(StopListening):
+            InvalidationListener().listen()
+        pubsub.subscribe.assert_called_with(INVALIDATION_CHANNEL)
+        self.assertIsNone(local_cache.get(self.key))
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    def grow(self, size):
+        for i in range(User.objects.count(), size):
+            User.objects.create(username=f'user{i}')
+
+    def test_query_profile(self):
+        profile = QueryProfile([{'sql': 'SELECT 1 FROM t WHERE id = 1'}, {'sql': 'SELECT 1 FROM t WHERE id = 2'},
+                                {'sql': "SELECT 1 FROM t WHERE name = 'a'"}, {'sql': 'SELECT 1 FROM t WHERE id = 1'}])
+        self.assertEqual(profile.count, 4)
+        self.assertEqual(profile.duplicates, {'SELECT 1 FROM t WHERE id = 1': 2})
+        self.assertEqual(profile.shapes, {'SELECT ? FROM t WHERE id = ?': 3, 'SELECT ? FROM t WHERE name = ?': 1})
+
+    def test_query_budget(self):
+        def constant():
+            list(User.objects.all())
+            return HttpResponse()
+
+        def n_plus_one():
+            for user in User.objects.all():
+                User.objects.get(pk=user.pk)
+            return HttpResponse()
+
+        def duplicate():
+            User.objects.filter(pk=1).exists()
+            User.objects.filter(pk=1).exists()
+            return HttpResponse()
+
+        profiles = self.assertQueryBudget(constant, self.grow, budget=1)
+        self.assertEqual(sorted(profiles), [1, 3, 5])
+        self.assertEqual(User.objects.count(), 0)  # rolled back
+        with self.assertRaisesRegex(AssertionError, 'grows with the dataset'):
+            self.assertQueryBudget(n_plus_one, self.grow)
+        with self.assertRaisesRegex(AssertionError, 'over the budget'):
+            self.assertQueryBudget(constant, self.grow, budget=0)
+        with self.assertRaisesRegex(AssertionError, 'Duplicate statements'):
+            self.assertQueryBudget(duplicate, self.grow)
+        self.assertQueryBudget(duplicate, self.grow, allow_duplicates=True)
+
+
+class ServerTimingTestCase(TestCase):
+    def setUp(self):
+        clear_all()
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_server_timing(self):
+        with self.assertLogs('wadium.timing', 'INFO') as logs:
+            response = self.client.get('/story/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = {metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(metrics), {'db', 'cache', 'serialize', 'render', 'total'})
+        self.assertRegex(metrics['db'], r'^db;dur=\d+\.\d;desc="\d+ calls"$')
+        self.assertRegex(metrics['total'], r'^total;dur=\d+\.\d$')
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['method'], line['path'], line['status']), ('GET', '/story/', 200))
+        self.assertEqual(line['timing']['db']['count'], int(metrics['db'].split('"')[1].split()[0]))
+
+        # The page is cached now.
+        response = self.client.get('/story/')
+        self.assertNotIn('db;', response['Server-Timing'])
+        self.assertNotIn('get', caches['default'].__dict__)  # the timed cache methods are removed
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_server_timing_logging_configured(self):
+        # Through the LOGGING handler, not one that assertLogs installs.
+        logger = logging.getLogger('wadium.timing')
+        self.assertEqual(logger.level, logging.INFO)
+        self.assertEqual(len(logger.handlers), 1)
+        with mock.patch.object(logger.handlers[0], 'emit') as emit:
+            self.client.get('/story/')
+        record = emit.call_args[0][0]
+        self.assertEqual(record.levelno, logging.INFO)
+        self.assertEqual(json.loads(record.getMessage())['path'], '/story/')
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_server_timing_not_sampled(self):
+        response = self.client.get('/story/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class PathSessionMiddlewareTestCase(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'admin@wadium.shop', 'password')
+        self.token = 'Token ' + Token.objects.create(user=admin).key
+        self.client.login(username='admin', password='password')
+
+    def test_sessionless_path(self):
+        # Logging out flushes the session, but the API never loads the admin's.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/user/logout/', HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(any('django_session' in query['sql'] for query in queries.captured_queries))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.client.get('/admin/').status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_ONLY_LOGIN=False)
+    def test_disabled(self):
+        self.client.post('/user/logout/', HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(self.client.get('/admin/').status_code, status.HTTP_302_FOUND)
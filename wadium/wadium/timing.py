@@ -0,0 +1,91 @@
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import caches
+
+# Cache methods whose calls are timed as 'cache'.
+CACHE_METHODS = ('get', 'set', 'add', 'delete', 'get_many', 'set_many', 'delete_many', 'has_key', 'incr', 'decr',
+                 'touch', 'get_or_set')
+
+current_timing = ContextVar('current_timing', default=None)
+
+
+class RequestTiming:
+    """
+    Time and number of calls per phase ('db', 'cache', 'serialize', 'render', ...) of one request.
+    Phases may overlap: a serializer that queries counts in both 'serialize' and 'db'.
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = Counter()
+
+    def add(self, name, duration):
+        self.durations[name] += duration
+        self.counts[name] += 1
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - start)
+
+    def as_dict(self):
+        return {
+            name: {'ms': round(duration * 1000, 2), 'count': self.counts[name]}
+            for name, duration in self.durations.items()
+        }
+
+    def as_header(self):
+        """
+        Server-Timing header value, e.g. 'db;dur=3.1;desc="2 calls", total;dur=7.5'.
+        """
+        metrics = []
+        for name, duration in self.durations.items():
+            metric = f'{name};dur={duration * 1000:.1f}'
+            if name != 'total':
+                metric += f';desc="{self.counts[name]} calls"'
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to the current request's timing, if it is sampled.
+    """
+    timing = current_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+def timed_method(method, name):
+    def wrapper(*args, **kwargs):
+        with timed(name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def timed_cache(alias='default'):
+    """
+    Time the calls to the cache for the duration of the block. Cache instances are per thread,
+    so only the current request's calls are affected. Raw Redis clients are not covered.
+    """
+    cache = caches[alias]
+    for method in CACHE_METHODS:
+        setattr(cache, method, timed_method(getattr(cache, method), 'cache'))
+    try:
+        yield
+    finally:
+        for method in CACHE_METHODS:
+            delattr(cache, method)